@@ -1,70 +1,154 @@
 import os
+import time
 import shutil
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Define directories
 full_image_root = 'FULL_IMAGE_1000x750'
 output_labels_root = 'output_yolo_labels'
 temp_upload_dir = 'CNRPark_S1_Upload_Temp'
 
-# Clean up existing temp directory if it exists
-if os.path.exists(temp_upload_dir):
-    print(f"Cleaning existing temp directory: {temp_upload_dir}")
-    shutil.rmtree(temp_upload_dir)
-os.makedirs(temp_upload_dir, exist_ok=True)
-
-# Counters for summary
-total_images_found_in_source = 0
-copied_images = 0
-copied_actual_labels = 0
-created_dummy_labels = 0
-labels_not_found_for_copy = 0
-
-print(f"Starting to process images from: {os.path.abspath(full_image_root)}")
-print(f"Looking for corresponding labels in: {os.path.abspath(output_labels_root)}")
-print(f"Copying to: {os.path.abspath(temp_upload_dir)}")
-
-# Walk through all image files
-for root, _, files in os.walk(full_image_root):
-    for filename in files:
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            total_images_found_in_source += 1
-            image_path_source = os.path.join(root, filename)
-            base_filename_no_ext = os.path.splitext(filename)[0]
-            original_label_path = os.path.join(output_labels_root, base_filename_no_ext + '.txt')
-            image_path_dest = os.path.join(temp_upload_dir, filename)
-            label_path_dest = os.path.join(temp_upload_dir, base_filename_no_ext + '.txt')
-
-            # Copy image
-            try:
-                shutil.copy2(image_path_source, image_path_dest)
-                copied_images += 1
-            except Exception as e:
-                print(f"Error copying image {image_path_source} to {image_path_dest}: {e}")
-                continue
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SYNC_MODES = ['sync', 'full']       # 'sync' updates the temp dir in place, 'full' deletes and recopies everything
+COMPARE_MODES = ['size-mtime', 'hash']
+NUM_WORKERS = 16                    # Copies are I/O bound, so threads overlap them well
+MAX_MISSING_LABEL_WARNINGS = 10
+HASH_CHUNK_BYTES = 1 << 20
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-            # Copy label if it exists; else create empty dummy label
-            if os.path.exists(original_label_path):
-                try:
-                    shutil.copy2(original_label_path, label_path_dest)
-                    copied_actual_labels += 1
-                except Exception as e:
-                    print(f"Error copying label {original_label_path} to {label_path_dest}: {e}")
-                    with open(label_path_dest, 'w') as f_dummy:
-                        pass
-                    created_dummy_labels += 1
-                    labels_not_found_for_copy += 1
+def plan_upload_dir(image_root, labels_root):
+    """
+    Desired contents of the upload dir: {filename: source path}, where a source of None means an empty
+    dummy label (image without a label in labels_root). Also returns the images missing a label.
+    """
+    label_names = set(os.listdir(labels_root)) if os.path.isdir(labels_root) else set()
+    desired = {}
+    missing_labels = []
+    for root, _, files in os.walk(image_root):
+        for filename in files:
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            desired[filename] = os.path.join(root, filename)
+            label_filename = os.path.splitext(filename)[0] + '.txt'
+            if label_filename in label_names:
+                desired[label_filename] = os.path.join(labels_root, label_filename)
             else:
-                print(f"Warning: Original label file not found at {original_label_path} for image {image_path_source}.")
-                with open(label_path_dest, 'w') as f_dummy:
+                desired[label_filename] = None
+                missing_labels.append(os.path.join(root, filename))
+    return desired, missing_labels
+
+def is_unchanged(source_path, dest_stat, dest_path, compare_mode):
+    if source_path is None:
+        return dest_stat.st_size == 0
+    source_stat = os.stat(source_path)
+    if source_stat.st_size != dest_stat.st_size:
+        return False
+    if compare_mode == 'hash':
+        return file_hash(source_path) == file_hash(dest_path)
+    # copy2 keeps the source mtime, so equal size and mtime means the file was not touched since the last sync
+    return int(source_stat.st_mtime) == int(dest_stat.st_mtime)
+
+def sync_upload_dir(image_root, labels_root, upload_dir, compare_mode='size-mtime', num_workers=NUM_WORKERS):
+    """
+    Brings upload_dir in line with the images and labels: copies new or changed files on a thread pool
+    (to a temporary name, then renamed, so an interrupted run never leaves a truncated file that looks
+    current), writes empty dummy labels where a label is missing and deletes files no longer in the source.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    desired, missing_labels = plan_upload_dir(image_root, labels_root)
+    existing = {}
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                existing[entry.name] = entry.stat()
+
+    counts = {'images_copied': 0, 'labels_copied': 0, 'dummy_labels_created': 0, 'unchanged': 0,
+              'orphans_removed': 0, 'failed': 0, 'bytes_copied': 0}
+    counts_lock = threading.Lock()
+
+    def sync_one(item):
+        filename, source_path = item
+        dest_path = os.path.join(upload_dir, filename)
+        try:
+            if filename in existing and is_unchanged(source_path, existing[filename], dest_path, compare_mode):
+                outcome, copied_bytes = 'unchanged', 0
+            elif source_path is None:
+                with open(dest_path, 'w'):
                     pass
-                created_dummy_labels += 1
-                labels_not_found_for_copy += 1
-
-# Summary
-print(f"\n--- Summary of Populating {temp_upload_dir} ---")
-print(f"Total image files found in source ('{full_image_root}'): {total_images_found_in_source}")
-print(f"Images successfully copied to '{temp_upload_dir}': {copied_images}")
-print(f"Actual label files successfully copied: {copied_actual_labels}")
-print(f"Empty dummy label files created (due to missing original labels or copy errors): {created_dummy_labels}")
-if labels_not_found_for_copy > 0:
-    print(f"Warning: {labels_not_found_for_copy} original label files were not found or failed to copy.")
+                outcome, copied_bytes = 'dummy_labels_created', 0
+            else:
+                tmp_path = dest_path + '.sync_tmp'
+                shutil.copy2(source_path, tmp_path)
+                os.replace(tmp_path, dest_path)
+                outcome = 'labels_copied' if filename.endswith('.txt') else 'images_copied'
+                copied_bytes = os.path.getsize(dest_path)
+        except Exception as e:
+            print(f"Error syncing {source_path or 'dummy label'} to {dest_path}: {e}")
+            outcome, copied_bytes = 'failed', 0
+        with counts_lock:
+            counts[outcome] += 1
+            counts['bytes_copied'] += copied_bytes
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for _ in pool.map(sync_one, desired.items(), chunksize=64):
+            pass
+
+    for filename in existing:
+        if filename not in desired:
+            os.remove(os.path.join(upload_dir, filename))
+            counts['orphans_removed'] += 1
+    counts['images_in_source'] = sum(1 for filename in desired if not filename.endswith('.txt'))
+    counts['files_in_source'] = len(desired)
+    return counts, missing_labels
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Populate the Stage 1 upload folder with images and YOLO labels.")
+    parser.add_argument('--mode', default='sync', choices=SYNC_MODES,
+                        help="'sync' only copies changed files; 'full' deletes the folder and recopies everything")
+    parser.add_argument('--compare', default='size-mtime', choices=COMPARE_MODES,
+                        help="How to detect changed files ('hash' reads both copies)")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    args = parser.parse_args()
+
+    # Full mode: clean up existing temp directory if it exists
+    if args.mode == 'full' and os.path.exists(temp_upload_dir):
+        print(f"Cleaning existing temp directory: {temp_upload_dir}")
+        shutil.rmtree(temp_upload_dir)
+
+    print(f"Starting to process images from: {os.path.abspath(full_image_root)}")
+    print(f"Looking for corresponding labels in: {os.path.abspath(output_labels_root)}")
+    print(f"Syncing to: {os.path.abspath(temp_upload_dir)} (mode: {args.mode}, compare: {args.compare})")
+
+    start_time = time.perf_counter()
+    counts, missing_labels = sync_upload_dir(full_image_root, output_labels_root, temp_upload_dir,
+                                             compare_mode=args.compare, num_workers=args.workers)
+    elapsed = time.perf_counter() - start_time
+
+    for image_path in missing_labels[:MAX_MISSING_LABEL_WARNINGS]:
+        print(f"Warning: Original label file not found in {output_labels_root} for image {image_path}.")
+    if len(missing_labels) > MAX_MISSING_LABEL_WARNINGS:
+        print(f"  ... and {len(missing_labels) - MAX_MISSING_LABEL_WARNINGS} more images without a label.")
+
+    # Summary
+    changed_files = counts['images_copied'] + counts['labels_copied'] + counts['dummy_labels_created']
+    print(f"\n--- Summary of Syncing {temp_upload_dir} ---")
+    print(f"Total image files found in source ('{full_image_root}'): {counts['images_in_source']}")
+    print(f"Images copied (new or changed): {counts['images_copied']}")
+    print(f"Actual label files copied (new or changed): {counts['labels_copied']}")
+    print(f"Empty dummy label files created: {counts['dummy_labels_created']} "
+          f"({len(missing_labels)} images have no original label)")
+    print(f"Unchanged files skipped: {counts['unchanged']}")
+    print(f"Orphaned files removed: {counts['orphans_removed']}")
+    if counts['failed'] > 0:
+        print(f"Warning: {counts['failed']} files failed to sync.")
+    print(f"Elapsed: {elapsed:.2f}s, {counts['files_in_source'] / max(elapsed, 1e-9):.0f} files/sec checked, "
+          f"{changed_files} changed, {counts['bytes_copied'] / 1e6 / max(elapsed, 1e-9):.1f} MB/s copied")
@@ -1,11 +1,147 @@
 import os
-import glob
+import re
+import json
 import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
-def check_and_move_malformed_yolo_labels(dataset_root_dir, malformed_output_root_dir, splits_to_check=None):
+# ---------------------- CONFIG ------------------------
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+CACHE_FILENAME = '.label_check_cache.json'  # Stored in the dataset root; per-file results keyed by size + mtime
+VALIDATOR_VERSION = 1                       # Bump when the checks change, so cached results are recomputed
+COORD_TOLERANCE = 1e-6                      # Slack for rounding in exported coordinates
+MIN_BOX_SIDE = 1e-6                         # Normalized width/height at or below this counts as zero-area
+NUM_WORKERS = os.cpu_count() or 4
+# Issues that make a label file malformed (moved unless dry run). 'duplicate_boxes' is only reported.
+MOVE_ISSUE_TYPES = {'read_error', 'wrong_column_count', 'non_numeric', 'class_out_of_range',
+                    'coords_out_of_bounds', 'zero_area'}
+
+# ---------------------- VALIDATION ------------------------
+def read_num_classes(dataset_root_dir):
+    """
+    Reads `nc` from the dataset's data.yaml (Roboflow/Ultralytics export), or None if there is none.
+    """
+    yaml_path = os.path.join(dataset_root_dir, 'data.yaml')
+    if not os.path.exists(yaml_path):
+        return None
+    with open(yaml_path, 'r') as f:
+        match = re.search(r'^nc:\s*(\d+)', f.read(), re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+def validate_label_file(label_path, num_classes=None):
+    """
+    Parses a whole label file into an (N, 5) array in one conversion and checks it with array operations.
+    Returns {'lines': N, 'issues': {issue_type: [line numbers (first few)]}}; empty files (background images) are valid.
+    """
+    issues = {}
+    try:
+        with open(label_path, 'r') as f:
+            lines = [(line_num, line.split()) for line_num, line in enumerate(f, 1) if line.strip()]
+    except Exception as e:
+        return {'lines': 0, 'issues': {'read_error': [str(e)]}}
+
+    bad_columns = [line_num for line_num, parts in lines if len(parts) != 5]
+    if bad_columns:
+        issues['wrong_column_count'] = bad_columns
+    rows = [(line_num, parts) for line_num, parts in lines if len(parts) == 5]
+    if not rows:
+        return {'lines': len(lines), 'issues': issues}
+
+    line_numbers = np.array([line_num for line_num, _ in rows])
+    try:
+        values = np.array([value for _, parts in rows for value in parts], dtype=np.float64).reshape(-1, 5)
+    except ValueError:
+        # Fall back to per-line parsing only for files that contain non-numeric values
+        numeric = []
+        for line_num, parts in rows:
+            try:
+                numeric.append([float(value) for value in parts])
+            except ValueError:
+                issues.setdefault('non_numeric', []).append(line_num)
+        line_numbers = np.array([line_num for line_num, _ in rows if line_num not in issues['non_numeric']])
+        values = np.array(numeric, dtype=np.float64).reshape(-1, 5)
+        if len(values) == 0:
+            return {'lines': len(lines), 'issues': issues}
+
+    class_ids, x_center, y_center, width, height = values.T
+    bad_class = (class_ids != np.round(class_ids)) | (class_ids < 0) | ~np.isfinite(class_ids)
+    if num_classes is not None:
+        bad_class |= class_ids >= num_classes
+    coords = values[:, 1:]
+    edges = np.stack([x_center - width / 2, y_center - height / 2, x_center + width / 2, y_center + height / 2], axis=1)
+    out_of_bounds = (~np.isfinite(coords).all(axis=1) |
+                     (coords < -COORD_TOLERANCE).any(axis=1) | (coords > 1 + COORD_TOLERANCE).any(axis=1) |
+                     (edges < -COORD_TOLERANCE).any(axis=1) | (edges > 1 + COORD_TOLERANCE).any(axis=1))
+    zero_area = (width <= MIN_BOX_SIDE) | (height <= MIN_BOX_SIDE)
+    _, first_index = np.unique(np.round(values, 6), axis=0, return_index=True)
+    duplicate = np.ones(len(values), dtype=bool)
+    duplicate[first_index] = False
+
+    for issue_type, mask in [('class_out_of_range', bad_class), ('coords_out_of_bounds', out_of_bounds),
+                             ('zero_area', zero_area), ('duplicate_boxes', duplicate)]:
+        if mask.any():
+            issues[issue_type] = line_numbers[mask].tolist()
+    return {'lines': len(lines), 'issues': issues}
+
+def _validate_chunk(args):
+    label_paths, num_classes = args
+    return [validate_label_file(label_path, num_classes) for label_path in label_paths]
+
+def validate_label_files(label_paths, num_classes=None, num_workers=NUM_WORKERS, chunk_size=512):
+    """
+    Validates label files on a process pool in chunks (parsing is CPU-bound); results come back in input order.
+    """
+    chunks = [(label_paths[i:i + chunk_size], num_classes) for i in range(0, len(label_paths), chunk_size)]
+    if num_workers <= 1 or len(chunks) <= 1:
+        return [result for chunk in chunks for result in _validate_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return [result for chunk_results in pool.map(_validate_chunk, chunks) for result in chunk_results]
+
+# ---------------------- CACHE ------------------------
+def load_validation_cache(cache_path, num_classes):
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != VALIDATOR_VERSION or cache.get('num_classes') != num_classes:
+        return {}
+    return cache.get('files', {})
+
+def save_validation_cache(cache_path, num_classes, file_results):
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': VALIDATOR_VERSION, 'num_classes': num_classes, 'files': file_results}, f)
+    os.replace(tmp_path, cache_path)
+
+def scan_files(directory, extensions):
     """
-    Checks YOLO label files for malformed lines (not exactly 5 columns).
-    Moves malformed label files and their corresponding images to a separate directory.
+    One directory listing: {filename stem: (path, size, mtime_ns)} for files with the given extensions.
+    """
+    files = {}
+    if not os.path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() in extensions and entry.is_file():
+                stat = entry.stat()
+                files[stem] = (entry.path, stat.st_size, stat.st_mtime_ns)
+    return files
+
+# ---------------------- MAIN CHECK ------------------------
+def check_and_move_malformed_yolo_labels(dataset_root_dir, malformed_output_root_dir, splits_to_check=None,
+                                         num_classes=None, dry_run=False, use_cache=True, num_workers=NUM_WORKERS,
+                                         report_path=None):
+    """
+    Validates YOLO label files: column count, numeric values, class id range, normalized coordinate
+    bounds, zero-area and duplicate boxes, plus labels without images and images without labels.
+    Malformed label files (see MOVE_ISSUE_TYPES) and their images are moved to a separate directory,
+    or only reported with `dry_run`. Files whose size and mtime are unchanged since the last run reuse
+    their cached result; `num_classes` defaults to `nc` from data.yaml.
     """
     # Auto-detect train/valid/test splits if not provided
     if splits_to_check is None:
@@ -13,15 +149,26 @@ def check_and_move_malformed_yolo_labels(dataset_root_dir, malformed_output_root
         for potential_split in ['train', 'valid', 'test']:
             if os.path.isdir(os.path.join(dataset_root_dir, potential_split)):
                 splits_to_check.append(potential_split)
+    if num_classes is None:
+        num_classes = read_num_classes(dataset_root_dir)
 
-    print(f"Checking splits: {splits_to_check}")
-    print(f"Malformed files and their images will be moved to: {os.path.abspath(malformed_output_root_dir)}")
+    print(f"Checking splits: {splits_to_check} (classes: {num_classes if num_classes is not None else 'unknown'})")
+    if dry_run:
+        print("Dry run: nothing will be moved.")
+    else:
+        print(f"Malformed files and their images will be moved to: {os.path.abspath(malformed_output_root_dir)}")
 
+    cache_path = os.path.join(dataset_root_dir, CACHE_FILENAME) if use_cache else None
+    cached_results = load_validation_cache(cache_path, num_classes)
+    new_cache = {}
     malformed_files_summary = {}
+    report = {'splits': {}}
     total_labels_checked = 0
+    total_labels_from_cache = 0
     total_lines_checked = 0
     total_malformed_lines_overall = 0
     total_files_moved = 0
+    issue_totals = {}
 
     for split in splits_to_check:
         source_label_dir = os.path.join(dataset_root_dir, split, 'labels')
@@ -36,83 +183,115 @@ def check_and_move_malformed_yolo_labels(dataset_root_dir, malformed_output_root
             print(f"Warning: Image directory not found for split '{split}': {source_image_dir}")
 
         print(f"\n--- Checking split: {split} ---")
-        malformed_files_in_split_details = []
-        label_files = glob.glob(os.path.join(source_label_dir, '*.txt'))
+        label_files = scan_files(source_label_dir, ['.txt'])
+        image_files = scan_files(source_image_dir, IMAGE_EXTENSIONS)
         if not label_files:
             print(f"No label files (.txt) found in {source_label_dir}")
             continue
 
-        for label_path in label_files:
-            total_labels_checked += 1
-            base_label_filename = os.path.basename(label_path)
-            image_filename_base = os.path.splitext(base_label_filename)[0]
-            current_file_has_malformed_lines = False
-            malformed_line_numbers_in_file = []
+        # Reuse results for unchanged files, validate the rest in parallel
+        results = {}
+        to_validate = []
+        for stem, (label_path, size, mtime_ns) in label_files.items():
+            cached = cached_results.get(label_path)
+            if cached is not None and cached['size'] == size and cached['mtime_ns'] == mtime_ns:
+                results[stem] = cached['result']
+            else:
+                to_validate.append(stem)
+        for stem, result in zip(to_validate, validate_label_files([label_files[s][0] for s in to_validate],
+                                                                  num_classes, num_workers)):
+            results[stem] = result
+        total_labels_checked += len(label_files)
+        total_labels_from_cache += len(label_files) - len(to_validate)
+        print(f"  {len(label_files)} label files ({len(label_files) - len(to_validate)} unchanged since last run)")
+
+        missing_images = sorted(stem for stem in label_files if stem not in image_files)
+        missing_labels = sorted(stem for stem in image_files if stem not in label_files)
+        if missing_images:
+            print(f"  {len(missing_images)} label file(s) without an image, e.g. {missing_images[:3]}")
+        if missing_labels:
+            print(f"  {len(missing_labels)} image(s) without a label file, e.g. {missing_labels[:3]}")
+
+        malformed_files_in_split_details = []
+        files_with_warnings = 0
+        for stem in sorted(results):
+            label_path, size, mtime_ns = label_files[stem]
+            result = results[stem]
+            total_lines_checked += result['lines']
+            for issue_type, line_numbers in result['issues'].items():
+                issue_totals[issue_type] = issue_totals.get(issue_type, 0) + len(line_numbers)
+
+            malformed_issues = {issue_type: line_numbers for issue_type, line_numbers in result['issues'].items()
+                                if issue_type in MOVE_ISSUE_TYPES}
+            if not malformed_issues:
+                new_cache[label_path] = {'size': size, 'mtime_ns': mtime_ns, 'result': result}
+                files_with_warnings += bool(result['issues'])
+                continue
 
+            malformed_line_numbers_in_file = sorted({n for numbers in malformed_issues.values() for n in numbers
+                                                     if isinstance(n, int)})
+            total_malformed_lines_overall += len(malformed_line_numbers_in_file)
+            corresponding_image_source_path = image_files[stem][0] if stem in image_files else None
+            image_filename_with_ext = (os.path.basename(corresponding_image_source_path)
+                                       if corresponding_image_source_path else "Unknown")
+            malformed_files_in_split_details.append({
+                'label_file_source': label_path,
+                'image_file_source': corresponding_image_source_path,
+                'image_filename': image_filename_with_ext,
+                'label_filename': os.path.basename(label_path),
+                'malformed_lines_count': len(malformed_line_numbers_in_file),
+                'first_few_malformed_line_numbers': malformed_line_numbers_in_file[:5],
+                'issues': {issue_type: line_numbers[:5] for issue_type, line_numbers in malformed_issues.items()}
+            })
+
+            if dry_run:
+                # Still malformed next time, so keep the cached result
+                new_cache[label_path] = {'size': size, 'mtime_ns': mtime_ns, 'result': result}
+                continue
+
+            os.makedirs(dest_malformed_label_dir, exist_ok=True)
+            os.makedirs(dest_malformed_image_dir, exist_ok=True)
+            dest_label_path = os.path.join(dest_malformed_label_dir, os.path.basename(label_path))
             try:
-                with open(label_path, 'r') as f:
-                    for line_num, line in enumerate(f, 1):
-                        total_lines_checked += 1
-                        parts = line.strip().split()
-                        if len(parts) != 5:
-                            total_malformed_lines_overall += 1
-                            current_file_has_malformed_lines = True
-                            malformed_line_numbers_in_file.append(line_num)
-            except Exception as e:
-                print(f"  ERROR reading or processing file '{label_path}': {e}")
-                current_file_has_malformed_lines = True
-
-            if current_file_has_malformed_lines:
-                corresponding_image_source_path = None
-                image_filename_with_ext = "Unknown"
-                for img_ext in ['.jpg', '.jpeg', '.png']:
-                    img_path_candidate = os.path.join(source_image_dir, image_filename_base + img_ext)
-                    if os.path.exists(img_path_candidate):
-                        corresponding_image_source_path = img_path_candidate
-                        image_filename_with_ext = os.path.basename(corresponding_image_source_path)
-                        break
-
-                malformed_files_in_split_details.append({
-                    'label_file_source': label_path,
-                    'image_file_source': corresponding_image_source_path,
-                    'image_filename': image_filename_with_ext,
-                    'label_filename': base_label_filename,
-                    'malformed_lines_count': len(malformed_line_numbers_in_file),
-                    'first_few_malformed_line_numbers': malformed_line_numbers_in_file[:5]
-                })
-
-                os.makedirs(dest_malformed_label_dir, exist_ok=True)
-                os.makedirs(dest_malformed_image_dir, exist_ok=True)
-
-                dest_label_path = os.path.join(dest_malformed_label_dir, base_label_filename)
-                dest_image_path = None
-                if corresponding_image_source_path and os.path.exists(corresponding_image_source_path):
+                shutil.move(label_path, dest_label_path)
+                print(f"  MOVED Label: '{label_path}' -> '{dest_label_path}'")
+                total_files_moved += 1
+                if corresponding_image_source_path:
                     dest_image_path = os.path.join(dest_malformed_image_dir, image_filename_with_ext)
-
-                try:
-                    shutil.move(label_path, dest_label_path)
-                    print(f"  MOVED Label: '{label_path}' -> '{dest_label_path}'")
+                    shutil.move(corresponding_image_source_path, dest_image_path)
+                    print(f"  MOVED Image: '{corresponding_image_source_path}' -> '{dest_image_path}'")
                     total_files_moved += 1
-                    if dest_image_path:
-                        shutil.move(corresponding_image_source_path, dest_image_path)
-                        print(f"  MOVED Image: '{corresponding_image_source_path}' -> '{dest_image_path}'")
-                        total_files_moved += 1
-                    elif corresponding_image_source_path:
-                        print(f"  Warning: Could not move image for {label_path}, source image not found: {corresponding_image_source_path}")
-                except Exception as e:
-                    print(f"  ERROR moving file '{label_path}' or its image: {e}")
+            except Exception as e:
+                print(f"  ERROR moving file '{label_path}' or its image: {e}")
 
+        if files_with_warnings:
+            print(f"  {files_with_warnings} label file(s) with duplicate boxes (reported, not moved).")
         if malformed_files_in_split_details:
-            print(f"  Moved {len(malformed_files_in_split_details)} label file(s) (and their images if found) from split '{split}'.")
+            action = "Found" if dry_run else "Moved"
+            print(f"  {action} {len(malformed_files_in_split_details)} malformed label file(s) in split '{split}'.")
             malformed_files_summary[split] = malformed_files_in_split_details
         else:
             print(f"  No malformed label files found in split '{split}'.")
+        report['splits'][split] = {
+            'label_files': len(label_files),
+            'malformed_files': malformed_files_in_split_details,
+            'duplicate_box_files': sorted(label_files[stem][0] for stem, result in results.items()
+                                          if 'duplicate_boxes' in result['issues']),
+            'labels_without_image': missing_images,
+            'images_without_label': missing_labels
+        }
+
+    if cache_path is not None:
+        save_validation_cache(cache_path, num_classes, new_cache)
 
     print("\n--- Overall Summary ---")
-    print(f"Total label files checked: {total_labels_checked}")
+    print(f"Total label files checked: {total_labels_checked} ({total_labels_from_cache} from cache)")
     print(f"Total lines checked: {total_lines_checked}")
     print(f"Total malformed lines found: {total_malformed_lines_overall}")
-    print(f"Total files moved: {total_files_moved // 2 if total_files_moved > 0 else 0} pairs (approx)")
+    for issue_type, count in sorted(issue_totals.items()):
+        print(f"  {issue_type}: {count}")
+    if not dry_run:
+        print(f"Total files moved: {total_files_moved}")
 
     if total_malformed_lines_overall > 0:
         print("\nDetails of files with malformed lines:")
@@ -121,19 +300,35 @@ def check_and_move_malformed_yolo_labels(dataset_root_dir, malformed_output_root
             for entry in files_details:
                 print(f"    Label: {entry['label_file_source']}")
                 print(f"    Image: {entry['image_file_source'] if entry['image_file_source'] else 'Not found'}")
-                print(f"    Malformed lines: {entry['malformed_lines_count']}")
+                print(f"    Malformed lines: {entry['malformed_lines_count']} {sorted(entry['issues'])}")
     else:
         print("All label files are correctly formatted.")
 
+    if report_path:
+        report['issue_totals'] = issue_totals
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to: {report_path}")
+
     return malformed_files_summary
 
 if __name__ == '__main__':
     ROBOFLOW_DATASET_ROOT = 'C:\\temp\\pklot dataset for stage 1'
-    MALFORMED_OUTPUT_DIR = os.path.join(ROBOFLOW_DATASET_ROOT, 'malformed_files')
 
-    if ROBOFLOW_DATASET_ROOT == 'C:\\temp\\pklot dataset for stage 1' and not os.path.exists(ROBOFLOW_DATASET_ROOT):
+    parser = argparse.ArgumentParser(description="Validate YOLO label files and move malformed ones aside.")
+    parser.add_argument('--root', default=ROBOFLOW_DATASET_ROOT)
+    parser.add_argument('--dry-run', action='store_true', help="Only report, do not move anything")
+    parser.add_argument('--report', default=None, help="Also write the findings to this JSON file")
+    parser.add_argument('--num-classes', type=int, default=None, help="Defaults to nc in data.yaml")
+    parser.add_argument('--no-cache', action='store_true', help="Revalidate every file")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    args = parser.parse_args()
+    malformed_output_dir = os.path.join(args.root, 'malformed_files')
+
+    if args.root == 'C:\\temp\\pklot dataset for stage 1' and not os.path.exists(args.root):
         print("Please update 'ROBOFLOW_DATASET_ROOT' in the script with the correct path to your unzipped Roboflow dataset!")
     else:
-        print(f"Dataset Root: {os.path.abspath(ROBOFLOW_DATASET_ROOT)}")
-        print(f"Malformed files will be moved to: {os.path.abspath(MALFORMED_OUTPUT_DIR)}")
-        check_and_move_malformed_yolo_labels(ROBOFLOW_DATASET_ROOT, MALFORMED_OUTPUT_DIR)
+        print(f"Dataset Root: {os.path.abspath(args.root)}")
+        check_and_move_malformed_yolo_labels(args.root, malformed_output_dir, num_classes=args.num_classes,
+                                             dry_run=args.dry_run, use_cache=not args.no_cache,
+                                             num_workers=args.workers, report_path=args.report)
@@ -1,23 +1,289 @@
 from ultralytics import YOLO
 import os
+import csv
 import yaml
+import argparse
+import cv2
+import numpy as np
 
 # Set paths relative to this script's directory
 script_dir = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(script_dir, 'best.pt')
 DATA_YAML_PATH = os.path.join(script_dir, 'data.yaml')
 SPLIT_TO_EVALUATE = 'test'
+VAL_CONF = 0.25
+VAL_IOU = 0.45
 
-if __name__ == '__main__':
-    # Check required files exist
-    if not os.path.exists(MODEL_PATH):
-        print(f"Error: Model file not found at {MODEL_PATH}")
-        exit()
-    if not os.path.exists(DATA_YAML_PATH):
-        print(f"Error: data.yaml file not found at {DATA_YAML_PATH}")
-        print("Ensure this YAML file defines the path to your test set images and labels.")
-        exit()
+# Threshold sweep: the detector runs once at a very low confidence and a loose NMS, the raw boxes are
+# cached, and every (conf, NMS IoU) grid point is scored from the cache.
+PREDICTION_CACHE_DIR = os.path.join(script_dir, 'eval_cache')
+CACHE_CONF = 0.001
+CACHE_NMS_IOU = 0.9          # Sweep NMS IoUs must be at or below this
+CACHE_MAX_DET = 3000         # Dense lots exceed the Ultralytics default of 300
+PREDICT_BATCH_SIZE = 16
+SWEEP_CONFS = sorted({round(c, 2) for c in np.arange(0.05, 0.951, 0.05)} | {0.2, 0.25, 0.3})
+SWEEP_NMS_IOUS = [0.3, 0.4, 0.45, 0.5, 0.6, 0.7]
+MATCH_IOUS = np.linspace(0.5, 0.95, 10)  # mAP50-95 thresholds; index 0 is mAP50 / P / R / F1
+SWEEP_CSV_PATH = os.path.join(script_dir, 'csv_output', 'stage1_threshold_sweep.csv')
+# Thresholds currently used elsewhere, reported next to the best grid point: (name, conf, NMS IoU)
+DEPLOYED_SETTINGS = [('inference.py', 0.2, 0.5), ('inference.py library default', 0.3, 0.5),
+                     ('test_stage_model1.py', 0.25, 0.7), ('model.val', VAL_CONF, VAL_IOU)]
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# ---------------------- DATA ------------------------
+def split_image_dir(data_yaml_path, split):
+    """
+    Resolves the image folder of a split from data.yaml (relative to `path:` or to the YAML itself).
+    """
+    with open(data_yaml_path, 'r') as f:
+        data = yaml.safe_load(f)
+    split_path = data.get(split) or data.get('val' if split == 'valid' else split)
+    if split_path is None:
+        raise RuntimeError(f"Split '{split}' is not defined in {data_yaml_path}")
+    root = data.get('path') or os.path.dirname(os.path.abspath(data_yaml_path))
+    if not os.path.isabs(root):
+        root = os.path.join(os.path.dirname(os.path.abspath(data_yaml_path)), root)
+    return os.path.normpath(os.path.join(root, split_path))
+
+def label_path_for(image_path):
+    # Ultralytics convention: .../images/x.jpg -> .../labels/x.txt
+    image_dir, filename = os.path.split(image_path)
+    label_dir = os.path.join(os.path.dirname(image_dir), 'labels')
+    return os.path.join(label_dir, os.path.splitext(filename)[0] + '.txt')
+
+def load_ground_truth(image_path, image_height, image_width):
+    """
+    Returns the YOLO labels of one image as (classes, xyxy pixel boxes); malformed lines are ignored.
+    """
+    label_path = label_path_for(image_path)
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            rows = [parts for parts in (line.split() for line in f) if len(parts) == 5]
+    if not rows:
+        return np.empty((0,), dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+    values = np.array(rows, dtype=np.float64)
+    x_center, y_center = values[:, 1] * image_width, values[:, 2] * image_height
+    half_w, half_h = values[:, 3] * image_width / 2, values[:, 4] * image_height / 2
+    boxes = np.stack([x_center - half_w, y_center - half_h, x_center + half_w, y_center + half_h], axis=1)
+    return values[:, 0].astype(np.int64), boxes.astype(np.float32)
+
+# ---------------------- PREDICTION CACHE ------------------------
+def prediction_cache_path(split):
+    return os.path.join(PREDICTION_CACHE_DIR, f"stage1_{split}_predictions.npz")
+
+def model_signature(model_path):
+    stat = os.stat(model_path)
+    # 'by-shape' marks caches predicted one image size at a time, so older mixed-size caches are rebuilt
+    return (f"{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{CACHE_CONF}|{CACHE_NMS_IOU}|"
+            f"{CACHE_MAX_DET}|by-shape")
+
+def group_indices_by_shape(image_paths):
+    """
+    Groups image indices by (height, width). Mixed sizes in one predict call are letterboxed to a
+    shared shape, which changes the boxes and scores compared to predicting each image on its own.
+    """
+    indices_by_shape = {}
+    for i, image_path in enumerate(image_paths):
+        image = cv2.imread(image_path)
+        if image is None:
+            raise RuntimeError(f"Could not read image: {image_path}")
+        indices_by_shape.setdefault(image.shape[:2], []).append(i)
+    return list(indices_by_shape.values())
+
+def build_prediction_cache(model_path, image_paths, cache_path):
+    """
+    Runs the detector once over the split at CACHE_CONF / CACHE_NMS_IOU and stores every box, score and
+    class (flattened, with per-image offsets) plus each image's size.
+    """
+    model = YOLO(model_path)
+    per_image = [None] * len(image_paths)
+    predicted = 0
+    # Batches never mix image sizes, so the cached boxes match a per-image run
+    for indices in group_indices_by_shape(image_paths):
+        for start in range(0, len(indices), PREDICT_BATCH_SIZE):
+            batch_indices = indices[start:start + PREDICT_BATCH_SIZE]
+            results = model.predict(source=[image_paths[i] for i in batch_indices], conf=CACHE_CONF, iou=CACHE_NMS_IOU,
+                                    max_det=CACHE_MAX_DET, batch=len(batch_indices), save=False, verbose=False)
+            for i, result in zip(batch_indices, results):
+                per_image[i] = (result.boxes.xyxy.cpu().numpy().astype(np.float32),
+                                result.boxes.conf.cpu().numpy().astype(np.float32),
+                                result.boxes.cls.cpu().numpy().astype(np.int64),
+                                result.orig_shape[:2])
+            predicted += len(batch_indices)
+            print(f"  Predicted {predicted}/{len(image_paths)} images")
+    boxes = [image_boxes for image_boxes, _, _, _ in per_image]
+    scores = [image_scores for _, image_scores, _, _ in per_image]
+    classes = [image_classes for _, _, image_classes, _ in per_image]
+    counts = [len(image_boxes) for image_boxes in boxes]
+    shapes = [shape for _, _, _, shape in per_image]
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez_compressed(cache_path, signature=model_signature(model_path), image_paths=np.array(image_paths),
+                        boxes=np.concatenate(boxes) if boxes else np.empty((0, 4), np.float32),
+                        scores=np.concatenate(scores) if scores else np.empty((0,), np.float32),
+                        classes=np.concatenate(classes) if classes else np.empty((0,), np.int64),
+                        offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+                        shapes=np.array(shapes, dtype=np.int64).reshape(-1, 2))
+
+def read_prediction_cache(cache_path):
+    # Decompress every array once; indexing an NpzFile re-reads the member each time
+    with np.load(cache_path) as cache:
+        return {name: cache[name] for name in cache.files}
+
+def load_prediction_cache(model_path, image_paths, split, rebuild=False):
+    cache_path = prediction_cache_path(split)
+    if not rebuild and os.path.exists(cache_path):
+        cache = read_prediction_cache(cache_path)
+        if str(cache['signature']) == model_signature(model_path) and list(cache['image_paths']) == image_paths:
+            print(f"Using cached predictions: {cache_path}")
+            return cache
+        print("Cached predictions are stale (model or split changed), re-running the detector.")
+    print(f"Running the detector once on {len(image_paths)} images (conf >= {CACHE_CONF}, NMS IoU {CACHE_NMS_IOU})...")
+    build_prediction_cache(model_path, image_paths, cache_path)
+    return read_prediction_cache(cache_path)
+
+# ---------------------- VECTORIZED MATCHING ------------------------
+def box_iou_matrix(boxes_a, boxes_b):
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+def class_aware_nms(boxes, scores, classes, iou_threshold):
+    """
+    Greedy per-class NMS over boxes already sorted by descending score; returns a keep mask.
+    Boxes of different classes never suppress each other, as in Ultralytics' default NMS.
+    """
+    keep = np.ones(len(boxes), dtype=bool)
+    if len(boxes) < 2:
+        return keep
+    iou = box_iou_matrix(boxes, boxes)
+    iou[classes[:, None] != classes[None, :]] = 0.0
+    for i in range(len(boxes)):
+        if keep[i]:
+            suppressed = iou[i, i + 1:] > iou_threshold
+            keep[i + 1:] &= ~suppressed
+    return keep
 
+def match_image(pred_boxes, pred_classes, gt_boxes, gt_classes):
+    """
+    Greedy COCO-style matching in descending score order at every MATCH_IOUS threshold at once.
+    Returns an (N, len(MATCH_IOUS)) true-positive matrix. Because higher-scoring predictions are
+    matched first, raising the confidence threshold later only removes rows, so one matching serves every conf.
+    """
+    true_positives = np.zeros((len(pred_boxes), len(MATCH_IOUS)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return true_positives
+    iou = box_iou_matrix(pred_boxes, gt_boxes)
+    iou[pred_classes[:, None] != gt_classes[None, :]] = 0.0
+    gt_taken = np.zeros((len(MATCH_IOUS), len(gt_boxes)), dtype=bool)
+    threshold_index = np.arange(len(MATCH_IOUS))
+    for i in np.flatnonzero(iou.max(axis=1) >= MATCH_IOUS[0]):
+        candidates = np.where(gt_taken, -1.0, iou[i][None, :])
+        best_gt = candidates.argmax(axis=1)
+        matched = candidates[threshold_index, best_gt] >= MATCH_IOUS
+        true_positives[i] = matched
+        gt_taken[threshold_index[matched], best_gt[matched]] = True
+    return true_positives
+
+def average_precision(true_positives, num_ground_truth):
+    """
+    101-point interpolated AP for detections sorted by descending score; true_positives is (N, T).
+    """
+    if num_ground_truth == 0 or len(true_positives) == 0:
+        return np.zeros(true_positives.shape[1])
+    tp_cumulative = np.cumsum(true_positives, axis=0)
+    precision = tp_cumulative / np.arange(1, len(true_positives) + 1)[:, None]
+    recall = tp_cumulative / num_ground_truth
+    # Precision envelope (monotonically decreasing from the right)
+    precision = np.maximum.accumulate(precision[::-1], axis=0)[::-1]
+    recall_points = np.linspace(0, 1, 101)
+    ap = np.empty(true_positives.shape[1])
+    for t in range(true_positives.shape[1]):
+        indices = np.searchsorted(recall[:, t], recall_points, side='left')
+        valid = indices < len(precision)
+        ap[t] = precision[indices[valid], t].sum() / len(recall_points)
+    return ap
+
+def sweep_thresholds(cache, confs=SWEEP_CONFS, nms_ious=SWEEP_NMS_IOUS):
+    """
+    Scores every (conf, NMS IoU) pair from the cached predictions. NMS and matching run once per
+    NMS IoU (greedy NMS and score-ordered matching do not depend on where the confidence cut is),
+    then precision/recall/F1/mAP for all confidence thresholds come from cumulative sums.
+    """
+    image_paths = list(cache['image_paths'])
+    offsets, shapes = cache['offsets'], cache['shapes']
+    ground_truth = [load_ground_truth(path, h, w) for path, (h, w) in zip(image_paths, shapes)]
+    gt_classes_all = np.concatenate([classes for classes, _ in ground_truth]) if ground_truth else np.empty(0, np.int64)
+    class_ids = np.unique(gt_classes_all)  # Averaged over classes present in the labels, like model.val
+    rows = []
+    for nms_iou in nms_ious:
+        if nms_iou > CACHE_NMS_IOU:
+            print(f"Skipping NMS IoU {nms_iou}: above the cache's NMS IoU {CACHE_NMS_IOU}")
+            continue
+        all_scores, all_classes, all_tp = [], [], []
+        for i, (gt_classes, gt_boxes) in enumerate(ground_truth):
+            start, end = offsets[i], offsets[i + 1]
+            order = np.argsort(-cache['scores'][start:end], kind='stable')
+            boxes = cache['boxes'][start:end][order]
+            scores = cache['scores'][start:end][order]
+            classes = cache['classes'][start:end][order]
+            keep = class_aware_nms(boxes, scores, classes, nms_iou)
+            all_scores.append(scores[keep])
+            all_classes.append(classes[keep])
+            all_tp.append(match_image(boxes[keep], classes[keep], gt_boxes, gt_classes))
+        scores = np.concatenate(all_scores)
+        classes = np.concatenate(all_classes)
+        true_positives = np.concatenate(all_tp).reshape(-1, len(MATCH_IOUS))
+        order = np.argsort(-scores, kind='stable')
+        scores, classes, true_positives = scores[order], classes[order], true_positives[order]
+
+        for conf in confs:
+            kept = np.searchsorted(-scores, -conf, side='right')  # Detections with score >= conf
+            precisions, recalls, aps = [], [], []
+            for class_id in class_ids:
+                class_mask = classes[:kept] == class_id
+                class_tp = true_positives[:kept][class_mask]
+                num_gt = int((gt_classes_all == class_id).sum())
+                num_tp = int(class_tp[:, 0].sum())
+                precisions.append(num_tp / len(class_tp) if len(class_tp) else 0.0)
+                recalls.append(num_tp / num_gt if num_gt else 0.0)
+                aps.append(average_precision(class_tp, num_gt))
+            precision, recall = float(np.mean(precisions)), float(np.mean(recalls))
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            ap = np.mean(aps, axis=0) if aps else np.zeros(len(MATCH_IOUS))
+            rows.append({'conf': conf, 'nms_iou': nms_iou, 'precision': precision, 'recall': recall, 'f1': f1,
+                         'map50': float(ap[0]), 'map50_95': float(ap.mean()), 'detections': int(kept)})
+    return rows
+
+def print_sweep_report(rows, top_n=10):
+    header = f"  {'conf':>5} {'nms_iou':>7} {'P':>7} {'R':>7} {'F1':>7} {'mAP50':>7} {'mAP50-95':>8} {'dets':>7}"
+    def line(row):
+        return (f"  {row['conf']:>5.2f} {row['nms_iou']:>7.2f} {row['precision']:>7.4f} {row['recall']:>7.4f} "
+                f"{row['f1']:>7.4f} {row['map50']:>7.4f} {row['map50_95']:>8.4f} {row['detections']:>7}")
+    print(f"\n--- Top {top_n} settings by F1 ---")
+    print(header)
+    for row in sorted(rows, key=lambda r: r['f1'], reverse=True)[:top_n]:
+        print(line(row))
+    print("\n--- Currently used thresholds ---")
+    for name, conf, nms_iou in DEPLOYED_SETTINGS:
+        match = [row for row in rows if np.isclose(row['conf'], conf) and np.isclose(row['nms_iou'], nms_iou)]
+        print(f"  {name}:" if match else f"  {name}: (conf {conf}, NMS IoU {nms_iou} not in the grid)")
+        if match:
+            print(line(match[0]))
+
+def write_sweep_csv(rows, csv_path=SWEEP_CSV_PATH):
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nFull sweep saved to CSV: {csv_path}")
+
+# ---------------------- MODEL.VAL ------------------------
+def run_model_val(conf=VAL_CONF, iou=VAL_IOU):
     # Load YOLO model
     print(f"Loading model from: {MODEL_PATH}")
     model = YOLO(MODEL_PATH)
@@ -30,8 +296,8 @@ if __name__ == '__main__':
         split=SPLIT_TO_EVALUATE,
         imgsz=640,
         batch=16,
-        conf=0.25,
-        iou=0.45,
+        conf=conf,
+        iou=iou,
     )
 
     # Print key metrics
@@ -50,3 +316,39 @@ if __name__ == '__main__':
         print("Full metrics object:", metrics)
 
     print("\nEvaluation complete. Detailed results and plots saved in a 'runs/detect/valX' folder.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate the Stage 1 detector.")
+    parser.add_argument('--sweep', action='store_true',
+                        help="Score a conf/NMS-IoU grid from cached low-threshold predictions instead of model.val")
+    parser.add_argument('--rebuild-cache', action='store_true', help="Re-run the detector even if the cache is current")
+    parser.add_argument('--conf', type=float, default=VAL_CONF, help="model.val confidence threshold")
+    parser.add_argument('--iou', type=float, default=VAL_IOU, help="model.val NMS IoU threshold")
+    args = parser.parse_args()
+
+    # Check required files exist
+    if not os.path.exists(MODEL_PATH):
+        print(f"Error: Model file not found at {MODEL_PATH}")
+        exit()
+    if not os.path.exists(DATA_YAML_PATH):
+        print(f"Error: data.yaml file not found at {DATA_YAML_PATH}")
+        print("Ensure this YAML file defines the path to your test set images and labels.")
+        exit()
+
+    if not args.sweep:
+        run_model_val(args.conf, args.iou)
+    else:
+        try:
+            image_dir = split_image_dir(DATA_YAML_PATH, SPLIT_TO_EVALUATE)
+            if not os.path.isdir(image_dir):
+                raise RuntimeError(f"Image folder for split '{SPLIT_TO_EVALUATE}' not found: {image_dir}")
+            image_paths = sorted(os.path.join(image_dir, f) for f in os.listdir(image_dir)
+                                 if f.lower().endswith(IMAGE_EXTENSIONS))
+            cache = load_prediction_cache(MODEL_PATH, image_paths, SPLIT_TO_EVALUATE, rebuild=args.rebuild_cache)
+        except RuntimeError as e:
+            print(e)
+            exit()
+        rows = sweep_thresholds(cache)
+        if rows:
+            print_sweep_report(rows)
+            write_sweep_csv(rows)
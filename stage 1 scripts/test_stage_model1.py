@@ -1,10 +1,16 @@
 import cv2
 from ultralytics import YOLO
 import os
-import csv  
+import csv
+import argparse
+import sys
 
 # Define paths and parameters
 script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Render gating and the background writer are shared with the Stage 2 scripts
+sys.path.append(os.path.join(script_dir, '..', 'stage 2 scripts'))
+from render_writer import RENDER_MODES, BackgroundImageWriter, should_render
 MODEL_FILENAME = 'best.pt'
 MODEL_PATH = os.path.join(script_dir, MODEL_FILENAME)
 IMAGE_DIR = os.path.join(script_dir, 'test_images')
@@ -12,16 +18,95 @@ OUTPUT_DIR = os.path.join(script_dir, 'test_results')
 CSV_OUTPUT_DIR = os.path.join(script_dir, 'csv_output')
 CSV_OUTPUT_PATH = os.path.join(CSV_OUTPUT_DIR, 'stage1_detections.csv')
 CONFIDENCE_THRESHOLD = 0.25
+BATCH_SIZE = 8  # Images sent to YOLO per predict call
+
+SHOW_RESULTS = False         # Interactive review with cv2.imshow/waitKey (needs a display); off = headless batch run
+RENDER_MODE = 'always'       # Annotated images: 'off', 'sampled' (every RENDER_EVERY_N_FRAMES images) or 'always'
+RENDER_EVERY_N_FRAMES = 10
+RENDER_WORKERS = 2           # Background threads drawing and writing annotated images in headless mode
+RENDER_QUEUE_SIZE = 16       # Max images waiting for a render thread before the detection loop waits
 
 # Ensure necessary directories exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CSV_OUTPUT_DIR, exist_ok=True)
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
-def run_inference_on_images(model, image_directory, output_directory, csv_path, conf_threshold):
+# Define legend text properties
+LEGEND_TEXT = "PS: Parking_Slot"
+LEGEND_FONT_SCALE = 0.7
+LEGEND_THICKNESS = 2
+LEGEND_TEXT_COLOR = (0, 0, 0)
+LEGEND_BG_COLOR = (220, 220, 220)
+LEGEND_PADDING = 10
+CUSTOM_CLASS_NAME = "PS"
+
+def draw_stage1_detections(img_to_draw_on, detections):
+    """
+    Draws the legend and one labelled box per (x1, y1, x2, y2, conf) detection onto the image in place.
     """
-    Runs inference on images, displays results with annotated legend and bounding boxes,
-    saves output images and writes detections to CSV.
+    # Draw legend box
+    (legend_w, legend_h), _ = cv2.getTextSize(LEGEND_TEXT, cv2.FONT_HERSHEY_SIMPLEX, LEGEND_FONT_SCALE, LEGEND_THICKNESS)
+    cv2.rectangle(img_to_draw_on,
+                  (LEGEND_PADDING // 2, LEGEND_PADDING // 2),
+                  (LEGEND_PADDING // 2 + legend_w + LEGEND_PADDING, LEGEND_PADDING // 2 + legend_h + LEGEND_PADDING),
+                  LEGEND_BG_COLOR, -1)
+    cv2.putText(img_to_draw_on, LEGEND_TEXT,
+                (LEGEND_PADDING, LEGEND_PADDING + legend_h),
+                cv2.FONT_HERSHEY_SIMPLEX, LEGEND_FONT_SCALE, LEGEND_TEXT_COLOR, LEGEND_THICKNESS)
+
+    for x1, y1, x2, y2, conf in detections:
+        label = f'{CUSTOM_CLASS_NAME} {conf:.2f}'
+        box_color = (255, 0, 0)
+        text_color_on_box = (255, 255, 255)
+        font_scale = 0.6
+        thickness = 2
+
+        # Draw bounding box
+        cv2.rectangle(img_to_draw_on, (x1, y1), (x2, y2), box_color, thickness)
+
+        # Determine label position
+        (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness -1 if thickness > 1 else 1)
+        text_y_pos = y1 - text_height - baseline - 5
+        if text_y_pos < (LEGEND_PADDING // 2 + legend_h + LEGEND_PADDING + 5):
+            text_y_pos = y1 + text_height + 5
+            if text_y_pos + text_height > img_to_draw_on.shape[0]:
+                text_y_pos = y1 - baseline - 5
+
+        # Draw label background + text
+        cv2.rectangle(img_to_draw_on, (x1, text_y_pos - text_height - baseline), (x1 + text_width, text_y_pos + baseline), box_color, -1)
+        cv2.putText(img_to_draw_on, label, (x1 + 2, text_y_pos),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color_on_box, thickness -1 if thickness > 1 else 1)
+    return img_to_draw_on
+
+def predict_grouped_by_shape(model, image_paths, conf_threshold):
+    """
+    Runs one predict call per group of same-sized images and returns the results in input order
+    (None for unreadable images). Mixed sizes in one call would be letterboxed to a shared shape,
+    which changes the boxes and confidences compared to predicting each image on its own.
+    """
+    images = [cv2.imread(image_path) for image_path in image_paths]
+    results = [None] * len(image_paths)
+    indices_by_shape = {}
+    for i, image in enumerate(images):
+        if image is None:
+            print(f"  Could not read {image_paths[i]}, skipping.")
+            continue
+        indices_by_shape.setdefault(image.shape, []).append(i)
+    for indices in indices_by_shape.values():
+        group_results = model.predict(source=[images[i] for i in indices], conf=conf_threshold, batch=len(indices),
+                                      save=False)
+        for i, result in zip(indices, group_results):
+            results[i] = result
+    return results
+
+def run_inference_on_images(model, image_directory, output_directory, csv_path, conf_threshold, batch_size=BATCH_SIZE,
+                            show_results=SHOW_RESULTS, render_mode=RENDER_MODE,
+                            render_every_n_frames=RENDER_EVERY_N_FRAMES):
+    """
+    Runs inference on images in batches of `batch_size`, saves annotated output images and
+    writes detections to CSV. With `show_results` every image is shown and the loop waits
+    for a key; otherwise it runs headless and the drawing/JPEG writing happens on background
+    threads (bounded by RENDER_QUEUE_SIZE pending images) while the next batch is detected.
     """
     if not os.listdir(image_directory):
         print(f"No images found in '{image_directory}'. Please add some test images.")
@@ -30,67 +115,34 @@ def run_inference_on_images(model, image_directory, output_directory, csv_path,
     image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
     all_detections_for_csv = []
 
-    # Define legend text properties
-    legend_text = "PS: Parking_Slot"
-    legend_font_scale = 0.7
-    legend_thickness = 2
-    legend_text_color = (0, 0, 0)
-    legend_bg_color = (220, 220, 220)
-    legend_padding = 10
-
-    for filename in os.listdir(image_directory):
-        if filename.lower().endswith(image_extensions):
-            image_path = os.path.join(image_directory, filename)
-            print(f"Processing image: {image_path}")
-
-            results = model.predict(source=image_path, conf=conf_threshold, save=False)
-
-            for result in results:
-                img_to_draw_on = result.orig_img.copy()
-                boxes = result.boxes
-                custom_class_name = "PS"
-
-                # Draw legend box
-                (legend_w, legend_h), _ = cv2.getTextSize(legend_text, cv2.FONT_HERSHEY_SIMPLEX, legend_font_scale, legend_thickness)
-                cv2.rectangle(img_to_draw_on, 
-                              (legend_padding // 2, legend_padding // 2),
-                              (legend_padding // 2 + legend_w + legend_padding, legend_padding // 2 + legend_h + legend_padding),
-                              legend_bg_color, -1)
-                cv2.putText(img_to_draw_on, legend_text,
-                            (legend_padding, legend_padding + legend_h),
-                            cv2.FONT_HERSHEY_SIMPLEX, legend_font_scale, legend_text_color, legend_thickness)
-
-                for box in boxes:
+    image_filenames = [f for f in os.listdir(image_directory) if f.lower().endswith(image_extensions)]
+    image_writer = None if show_results else BackgroundImageWriter(num_workers=RENDER_WORKERS,
+                                                                   max_queue_size=RENDER_QUEUE_SIZE)
+    images_seen = 0
+
+    try:
+        for batch_start in range(0, len(image_filenames), batch_size):
+            batch_filenames = image_filenames[batch_start:batch_start + batch_size]
+            batch_paths = [os.path.join(image_directory, f) for f in batch_filenames]
+            print(f"Processing batch: {', '.join(batch_paths)}")
+
+            # One predict call per image size in the batch; results come back in the same order as the sources
+            results = predict_grouped_by_shape(model, batch_paths, conf_threshold)
+
+            for filename, result in zip(batch_filenames, results):
+                if result is None:
+                    continue
+                detections = []
+                for box in result.boxes:
                     x1, y1, x2, y2 = map(int, box.xyxy[0])
                     conf = float(box.conf[0])
-
-                    label = f'{custom_class_name} {conf:.2f}'
-                    box_color = (255, 0, 0)
-                    text_color_on_box = (255, 255, 255)
-                    font_scale = 0.6
-                    thickness = 2
-
-                    # Draw bounding box
-                    cv2.rectangle(img_to_draw_on, (x1, y1), (x2, y2), box_color, thickness)
-
-                    # Determine label position
-                    (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness -1 if thickness > 1 else 1)
-                    text_y_pos = y1 - text_height - baseline - 5
-                    if text_y_pos < (legend_padding // 2 + legend_h + legend_padding + 5):
-                        text_y_pos = y1 + text_height + 5
-                        if text_y_pos + text_height > img_to_draw_on.shape[0]:
-                            text_y_pos = y1 - baseline - 5
-
-                    # Draw label background + text
-                    cv2.rectangle(img_to_draw_on, (x1, text_y_pos - text_height - baseline), (x1 + text_width, text_y_pos + baseline), box_color, -1)
-                    cv2.putText(img_to_draw_on, label, (x1 + 2, text_y_pos),
-                                cv2.FONT_HERSHEY_SIMPLEX, font_scale, text_color_on_box, thickness -1 if thickness > 1 else 1)
+                    detections.append((x1, y1, x2, y2, conf))
 
                     # Record detection for CSV
                     all_detections_for_csv.append({
                         'image_filename': filename,
                         'class_id': int(box.cls[0]),
-                        'class_name': custom_class_name,
+                        'class_name': CUSTOM_CLASS_NAME,
                         'confidence': f"{conf:.4f}",
                         'x_min': x1,
                         'y_min': y1,
@@ -99,20 +151,31 @@ def run_inference_on_images(model, image_directory, output_directory, csv_path,
                         'width': x2 - x1,
                         'height': y2 - y1
                     })
-
-                # Show and save result
-                cv2.imshow(f'Detections - {filename}', img_to_draw_on)
                 print(f"  Found {len(result.boxes)} parking slots.")
-                print("  Press any key to continue to the next image (or 'q' to quit)...")
-                key = cv2.waitKey(0)
                 output_path = os.path.join(output_directory, f"detected_{filename}")
-                cv2.imwrite(output_path, img_to_draw_on)
-                print(f"  Result saved to: {output_path}")
 
-                if key == ord('q'):
-                    print("Quitting...")
-                    cv2.destroyAllWindows()
-                    return
+                if show_results:
+                    # Show and save result
+                    img_to_draw_on = draw_stage1_detections(result.orig_img.copy(), detections)
+                    cv2.imshow(f'Detections - {filename}', img_to_draw_on)
+                    print("  Press any key to continue to the next image (or 'q' to quit)...")
+                    key = cv2.waitKey(0)
+                    cv2.imwrite(output_path, img_to_draw_on)
+                    print(f"  Result saved to: {output_path}")
+
+                    if key == ord('q'):
+                        print("Quitting...")
+                        cv2.destroyAllWindows()
+                        return
+                elif should_render(render_mode, images_seen, render_every_n_frames):
+                    # result.orig_img is not used again, so the render thread can draw on it directly
+                    image_writer.submit(draw_stage1_detections, result.orig_img, (detections,), output_path)
+                images_seen += 1
+    finally:
+        if image_writer is not None:
+            image_writer.close()
+            print(f"Annotated images written to: {output_directory} "
+                  f"({image_writer.written} written, {image_writer.failed} failed)")
 
     # Write detections to CSV
     if all_detections_for_csv:
@@ -126,10 +189,18 @@ def run_inference_on_images(model, image_directory, output_directory, csv_path,
     else:
         print("\nNo detections to save to CSV.")
 
-    cv2.destroyAllWindows()
+    if show_results:
+        cv2.destroyAllWindows()
     print("Finished processing all images.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Stage 1 slot detector on test images.")
+    parser.add_argument('--show', action='store_true', default=SHOW_RESULTS,
+                        help="Show each image and wait for a key (needs a display)")
+    parser.add_argument('--render-mode', default=RENDER_MODE, choices=RENDER_MODES)
+    parser.add_argument('--render-every', type=int, default=RENDER_EVERY_N_FRAMES)
+    args = parser.parse_args()
+
     try:
         print(f"Loading model from: {MODEL_PATH}")
         model = YOLO(MODEL_PATH)
@@ -139,4 +210,6 @@ if __name__ == '__main__':
         print(f"Please ensure '{MODEL_FILENAME}' is in the directory: '{os.path.abspath(script_dir)}'")
         exit()
 
-    run_inference_on_images(model, IMAGE_DIR, OUTPUT_DIR, CSV_OUTPUT_PATH, CONFIDENCE_THRESHOLD)
+    run_inference_on_images(model, IMAGE_DIR, OUTPUT_DIR, CSV_OUTPUT_PATH, CONFIDENCE_THRESHOLD,
+                            show_results=args.show, render_mode=args.render_mode,
+                            render_every_n_frames=args.render_every)
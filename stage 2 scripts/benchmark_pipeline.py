@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+
+from inference import (
+    ParkingPipeline, extract_slot_crops, scores_to_slots_info, draw_occupancy_overlay, INPUT_TEST_IMAGES_DIR, BACKEND
+)
+
+# ---------------------- CONFIG ------------------------
+BENCHMARK_OUTPUT_DIR = 'benchmarks'
+BENCHMARK_RESULTS_PATH = os.path.join(BENCHMARK_OUTPUT_DIR, 'latest.json')
+BENCHMARK_BASELINE_PATH = os.path.join(BENCHMARK_OUTPUT_DIR, 'baseline.json')
+
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+NUM_WARMUP_RUNS = 2
+NUM_REPEATS = 10
+STAGES = ['decode', 'stage1', 'crop', 'stage2', 'draw', 'encode', 'total']  # 'stage2' includes the crop resize
+
+# A stage regresses when its p50 or p95 is more than REGRESSION_TOLERANCE slower than the
+# baseline AND at least REGRESSION_MIN_DELTA_MS slower (so sub-millisecond noise never fails).
+REGRESSION_TOLERANCE = 0.10
+REGRESSION_MIN_DELTA_MS = 1.0
+
+# ---------------------- WORKLOAD ------------------------
+def make_density_variants(image):
+    """
+    Synthetic slot-density variants of one frame: the original, its left half (about half the slots)
+    and a 2x2 mosaic (about four times the slots at four times the pixels).
+    """
+    h_img, w_img = image.shape[:2]
+    return {
+        'x1': image,
+        'x0.5': np.ascontiguousarray(image[:, :w_img // 2]),
+        'x4': np.vstack([np.hstack([image, image]), np.hstack([image, image])]),
+    }
+
+def build_workload(image_dir, include_variants=True):
+    """
+    Returns a list of (name, encoded_bytes) so every run measures decoding from the same bytes.
+    """
+    workload = []
+    for image_filename_with_ext in sorted(os.listdir(image_dir)):
+        if not image_filename_with_ext.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        image_path = os.path.join(image_dir, image_filename_with_ext)
+        with open(image_path, 'rb') as f:
+            workload.append((image_filename_with_ext, f.read()))
+        if include_variants:
+            image = cv2.imread(image_path)
+            if image is None:
+                continue
+            for variant_name, variant_image in make_density_variants(image).items():
+                if variant_name == 'x1':
+                    continue
+                ok, encoded = cv2.imencode('.jpg', variant_image)
+                if ok:
+                    workload.append((f"{image_filename_with_ext}[{variant_name}]", encoded.tobytes()))
+    return workload
+
+# ---------------------- TIMED PIPELINE ------------------------
+def run_frame_timed(pipeline, encoded_bytes):
+    """
+    Runs the full pipeline on one encoded frame and returns (per-stage ms, number of slots).
+    Stage 1 and Stage 2 are the pipeline's own methods, so tiling, chunking and calibration
+    are timed exactly as deployed.
+    """
+    timings_ms = {}
+    frame_start = time.perf_counter()
+
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(encoded_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    timings_ms['decode'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    boxes, _ = pipeline.run_stage1_detection(image, stage1_conf=STAGE1_CONF)
+    timings_ms['stage1'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    slot_boxes, slot_crops = extract_slot_crops(image, boxes) if len(boxes) > 0 else ([], [])
+    timings_ms['crop'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    scores = pipeline.classify_slot_crops_batched(slot_crops)
+    timings_ms['stage2'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    detected_slots_info = scores_to_slots_info(slot_boxes, scores, STAGE2_OCCUPIED_THRESHOLD)
+    output_visualization_image = draw_occupancy_overlay(image.copy(), detected_slots_info)
+    timings_ms['draw'] = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    cv2.imencode('.jpg', output_visualization_image)
+    timings_ms['encode'] = (time.perf_counter() - start) * 1000.0
+
+    timings_ms['total'] = (time.perf_counter() - frame_start) * 1000.0
+    return timings_ms, len(detected_slots_info)
+
+def summarize(samples_ms):
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(values.mean()),
+        'n': int(values.size)
+    }
+
+def run_benchmark(pipeline, workload, warmup_runs=NUM_WARMUP_RUNS, repeats=NUM_REPEATS):
+    samples = {stage: [] for stage in STAGES}
+    per_frame = {}
+    for frame_name, encoded_bytes in workload:
+        for _ in range(warmup_runs):
+            run_frame_timed(pipeline, encoded_bytes)
+        frame_samples = {stage: [] for stage in STAGES}
+        num_slots = 0
+        for _ in range(repeats):
+            timings_ms, num_slots = run_frame_timed(pipeline, encoded_bytes)
+            for stage in STAGES:
+                samples[stage].append(timings_ms[stage])
+                frame_samples[stage].append(timings_ms[stage])
+        per_frame[frame_name] = {'slots': num_slots,
+                                 'stages': {stage: summarize(frame_samples[stage]) for stage in STAGES}}
+        print(f"  {frame_name:<28} {num_slots:>4} slots  total p50 {per_frame[frame_name]['stages']['total']['p50']:8.1f} ms")
+    return {stage: summarize(samples[stage]) for stage in STAGES}, per_frame
+
+# ---------------------- REPORTING / REGRESSION ------------------------
+def print_stage_table(stage_summary):
+    print(f"\n{'Stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for stage in STAGES:
+        summary = stage_summary[stage]
+        print(f"{stage:<14}{summary['p50']:>10.2f}{summary['p95']:>10.2f}{summary['p99']:>10.2f}{summary['mean']:>10.2f}")
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE, min_delta_ms=REGRESSION_MIN_DELTA_MS):
+    regressions = []
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        for percentile in ['p50', 'p95']:
+            old = baseline['stages'][stage][percentile]
+            new = results['stages'][stage][percentile]
+            if new > old * (1.0 + tolerance) and new - old >= min_delta_ms:
+                regressions.append((stage, percentile, old, new))
+    return regressions
+
+def print_baseline_diff(results, baseline):
+    print(f"\n{'Stage':<14}{'base p50':>10}{'new p50':>10}{'delta':>9}{'base p95':>10}{'new p95':>10}{'delta':>9}")
+    for stage in STAGES:
+        if stage not in baseline['stages']:
+            continue
+        old, new = baseline['stages'][stage], results['stages'][stage]
+        delta_p50 = (new['p50'] / old['p50'] - 1.0) * 100 if old['p50'] > 0 else 0.0
+        delta_p95 = (new['p95'] / old['p95'] - 1.0) * 100 if old['p95'] > 0 else 0.0
+        print(f"{stage:<14}{old['p50']:>10.2f}{new['p50']:>10.2f}{delta_p50:>+8.1f}%"
+              f"{old['p95']:>10.2f}{new['p95']:>10.2f}{delta_p95:>+8.1f}%")
+    if baseline.get('meta', {}).get('machine') != results['meta']['machine']:
+        print("Warning: baseline was recorded on a different machine; timings may not be comparable.")
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark with baseline regression check.")
+    parser.add_argument('--input-dir', default=INPUT_TEST_IMAGES_DIR)
+    parser.add_argument('--backend', default=BACKEND, choices=['native', 'onnx'])
+    parser.add_argument('--warmup', type=int, default=NUM_WARMUP_RUNS)
+    parser.add_argument('--repeats', type=int, default=NUM_REPEATS)
+    parser.add_argument('--no-variants', action='store_true', help="Skip the synthetic slot-density variants")
+    parser.add_argument('--out', default=BENCHMARK_RESULTS_PATH, help="Machine-readable results (JSON)")
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_PATH, help="Baseline JSON to diff against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir) or not os.listdir(args.input_dir):
+        print(f"Error: Input images directory '{args.input_dir}' not found or is empty.")
+        exit()
+
+    pipeline = ParkingPipeline(backend=args.backend)
+    try:
+        pipeline.warm_up()
+    except RuntimeError as e:
+        print(e)
+        exit()
+
+    workload = build_workload(args.input_dir, include_variants=not args.no_variants)
+    print(f"Benchmarking {len(workload)} frames ({args.backend} backend), "
+          f"{args.warmup} warm-up + {args.repeats} timed runs each")
+    stage_summary, per_frame = run_benchmark(pipeline, workload, args.warmup, args.repeats)
+    print_stage_table(stage_summary)
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'backend': args.backend,
+            'machine': f"{platform.node()} {platform.machine()} {os.cpu_count()} cpus",
+            'python': sys.version.split()[0],
+            'opencv': cv2.__version__,
+            'warmup': args.warmup,
+            'repeats': args.repeats,
+            'frames': len(workload)
+        },
+        'stages': stage_summary,
+        'per_frame': per_frame
+    }
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"\nResults saved to: {args.out}")
+
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print_baseline_diff(results, baseline)
+        regressions = find_regressions(results, baseline, tolerance=args.tolerance)
+        if regressions:
+            print("\n!!! PERFORMANCE REGRESSION !!!")
+            for stage, percentile, old, new in regressions:
+                print(f"  {stage} {percentile}: {old:.2f} ms -> {new:.2f} ms (+{(new / old - 1.0) * 100:.1f}%)")
+            sys.exit(1)
+        print("\nNo stage regressed beyond the tolerance.")
+    else:
+        print(f"No baseline found at '{args.baseline}'. Rerun with --save-baseline to record one.")
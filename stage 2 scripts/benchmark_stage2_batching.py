@@ -0,0 +1,105 @@
+import os
+import time
+import cv2
+import numpy as np
+
+from inference import (
+    ParkingPipeline, extract_slot_crops, INPUT_TEST_IMAGES_DIR, STAGE2_IMG_HEIGHT, STAGE2_IMG_WIDTH
+)
+
+# ---------------------- CONFIG ------------------------
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+NUM_WARMUP_RUNS = 2
+NUM_TIMED_RUNS = 5
+MAX_BATCH_SIZES_TO_TRY = [16, 32, 64, 128]
+
+# ---------------------- BASELINE (PER-SLOT) ------------------------
+def classify_slot_crops_per_slot(stage2_model, slot_crops):
+    """
+    Reference implementation of the original loop: one Stage 2 predict call per crop.
+    """
+    scores = np.empty(len(slot_crops), dtype=np.float32)
+    for i, slot_crop in enumerate(slot_crops):
+        img_resized_for_stage2 = cv2.resize(slot_crop, (STAGE2_IMG_WIDTH, STAGE2_IMG_HEIGHT))
+        img_array_for_stage2 = img_resized_for_stage2.astype(np.float32) / 255.0
+        img_batch_for_stage2 = np.expand_dims(img_array_for_stage2, axis=0)
+        scores[i] = stage2_model.predict(img_batch_for_stage2, verbose=0)[0][0]
+    return scores
+
+def time_call(fn, *args, **kwargs):
+    # Warm up, then return the median wall time (ms) and the last result
+    result = None
+    for _ in range(NUM_WARMUP_RUNS):
+        result = fn(*args, **kwargs)
+    timings_ms = []
+    for _ in range(NUM_TIMED_RUNS):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings_ms.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings_ms)), result
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    if not os.path.isdir(INPUT_TEST_IMAGES_DIR) or not os.listdir(INPUT_TEST_IMAGES_DIR):
+        print(f"Error: Test images directory '{INPUT_TEST_IMAGES_DIR}' not found or is empty.")
+        exit()
+
+    # The per-slot baseline calls Keras directly, so this benchmark always uses the native backend.
+    # It also returns raw sigmoid scores, so calibration is forced off to compare raw to raw.
+    pipeline = ParkingPipeline(backend='native', stage2_calibration_path=None)
+    try:
+        pipeline.warm_up()
+    except RuntimeError as e:
+        print(e)
+        exit()
+
+    print(f"Benchmarking Stage 2 per-slot vs batched classification on: {INPUT_TEST_IMAGES_DIR}")
+    print(f"Warm-up runs: {NUM_WARMUP_RUNS}, timed runs: {NUM_TIMED_RUNS} (median reported)\n")
+
+    header = f"{'Image':<20}{'Slots':>7}{'Per-slot ms':>14}" + "".join(f"{'Batch ' + str(b) + ' ms':>16}" for b in MAX_BATCH_SIZES_TO_TRY)
+    print(header)
+    print("-" * len(header))
+
+    total_per_slot_ms = 0.0
+    total_batched_ms = {b: 0.0 for b in MAX_BATCH_SIZES_TO_TRY}
+    total_status_mismatches = 0
+
+    for image_filename_with_ext in sorted(os.listdir(INPUT_TEST_IMAGES_DIR)):
+        if not image_filename_with_ext.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        image = cv2.imread(os.path.join(INPUT_TEST_IMAGES_DIR, image_filename_with_ext))
+        if image is None:
+            print(f"Skipping unreadable image: {image_filename_with_ext}")
+            continue
+
+        # Stage 1 runs once per image; only Stage 2 is timed
+        boxes, _ = pipeline.run_stage1_detection(image, stage1_conf=STAGE1_CONF)
+        if len(boxes) == 0:
+            print(f"{image_filename_with_ext:<20}{0:>7}  (no slots detected, skipped)")
+            continue
+        _, slot_crops = extract_slot_crops(image, boxes)
+
+        per_slot_ms, per_slot_scores = time_call(classify_slot_crops_per_slot, pipeline.stage2_backend.model,
+                                                 slot_crops)
+        total_per_slot_ms += per_slot_ms
+        row = f"{image_filename_with_ext:<20}{len(slot_crops):>7}{per_slot_ms:>14.1f}"
+
+        for max_batch_size in MAX_BATCH_SIZES_TO_TRY:
+            batched_ms, batched_scores = time_call(pipeline.classify_slot_crops_batched, slot_crops,
+                                                   max_batch_size=max_batch_size)
+            total_batched_ms[max_batch_size] += batched_ms
+            row += f"{batched_ms:>16.1f}"
+            total_status_mismatches += int(np.count_nonzero(
+                (per_slot_scores > STAGE2_OCCUPIED_THRESHOLD) != (batched_scores > STAGE2_OCCUPIED_THRESHOLD)))
+        print(row)
+
+    print("-" * len(header))
+    total_row = f"{'Total':<20}{'':>7}{total_per_slot_ms:>14.1f}" + "".join(f"{total_batched_ms[b]:>16.1f}" for b in MAX_BATCH_SIZES_TO_TRY)
+    print(total_row)
+
+    print("\n--- Summary ---")
+    for max_batch_size in MAX_BATCH_SIZES_TO_TRY:
+        if total_batched_ms[max_batch_size] > 0:
+            print(f"  max_batch_size={max_batch_size}: {total_per_slot_ms / total_batched_ms[max_batch_size]:.1f}x faster than per-slot")
+    print(f"  Slot status mismatches between per-slot and batched paths: {total_status_mismatches}")
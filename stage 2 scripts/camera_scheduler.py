@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+from inference import get_default_pipeline, OUTPUT_SQLITE_PATH, OUTPUT_PARQUET_DIR, OUTPUT_TIMESERIES_PATH
+from result_sinks import create_sink
+from slot_layout_cache import SlotLayoutCache
+from slot_registry import SlotRegistry
+
+# ---------------------- CONFIG ------------------------
+NUM_WORKERS = 2                  # Frames processed concurrently, whatever the number of cameras
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+MIN_POLL_INTERVAL_S = 2.0        # Fastest a single camera is polled (busy entrances)
+MAX_POLL_INTERVAL_S = 120.0      # Slowest a camera is polled (quiet lots at night)
+INITIAL_POLL_INTERVAL_S = 10.0
+SPEEDUP_FACTOR = 0.5             # Interval multiplier after a poll in which slots changed
+SLOWDOWN_FACTOR = 1.5            # Interval multiplier after a poll in which nothing changed
+CHANGE_FRACTION_FOR_SPEEDUP = 0.02  # Fraction of a camera's slots that must change to count as "changing"
+REPORT_EVERY_S = 30.0
+DIRECTORY_SOURCE_FPS = 1.0       # Frame rate a directory of frames is replayed at (treated as a live camera)
+
+# ---------------------- CAMERA SOURCES ------------------------
+class CameraSource:
+    """
+    Gives the most recent frame of one camera on demand.
+
+    Live sources (RTSP URLs, camera indexes) are drained by a grabber thread that only calls
+    `grab()` (no decoding), so `latest_frame()` decodes just the frame that is processed.
+    Local video files and frame directories are replayed in real time: a poll returns the
+    frame at the current playback position, so skipped frames cost nothing.
+    Returns (frame, capture_time) or (None, None) when no frame is available.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.capture = None
+        self.frame_paths = None
+        self.grabber = None
+        self.last_grab_time = None
+        self.stopped = False
+
+        if os.path.isdir(source):
+            self.frame_paths = sorted(os.path.join(source, f) for f in os.listdir(source)
+                                      if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+            return
+        self.capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"Error: Could not open camera source '{source}'")
+        self.is_live = not os.path.isfile(source)
+        if self.is_live:
+            self.grabber = threading.Thread(target=self._grab_loop, name=f'grab-{source}', daemon=True)
+            self.grabber.start()
+
+    def _grab_loop(self):
+        while not self.stopped:
+            with self.lock:
+                ok = self.capture.grab()
+                if ok:
+                    self.last_grab_time = time.time()
+            if not ok:
+                time.sleep(0.05)
+
+    def latest_frame(self):
+        if self.frame_paths is not None:
+            if not self.frame_paths:
+                return None, None
+            position = int((time.time() - self.start_time) * DIRECTORY_SOURCE_FPS) % len(self.frame_paths)
+            return cv2.imread(self.frame_paths[position]), time.time()
+        with self.lock:
+            if self.is_live:
+                if self.last_grab_time is None:
+                    return None, None
+                ok, frame = self.capture.retrieve()
+                return (frame, self.last_grab_time) if ok else (None, None)
+            # Local file: seek to the playback position, looping at the end
+            duration_ms = self.capture.get(cv2.CAP_PROP_FRAME_COUNT) / (self.capture.get(cv2.CAP_PROP_FPS) or 25.0) * 1000
+            position_ms = (time.time() - self.start_time) * 1000.0
+            self.capture.set(cv2.CAP_PROP_POS_MSEC, position_ms % duration_ms if duration_ms > 0 else 0)
+            ok, frame = self.capture.read()
+            return (frame, time.time()) if ok else (None, None)
+
+    def close(self):
+        self.stopped = True
+        if self.grabber is not None:
+            self.grabber.join(timeout=1.0)
+        if self.capture is not None:
+            self.capture.release()
+
+# ---------------------- PER-CAMERA STATE ------------------------
+class CameraState:
+    """
+    Scheduling and freshness state of one camera. The poll interval adapts multiplicatively:
+    it shrinks by SPEEDUP_FACTOR after a poll in which at least CHANGE_FRACTION_FOR_SPEEDUP of
+    the slots changed status and grows by SLOWDOWN_FACTOR otherwise, within [min, max].
+    """
+
+    def __init__(self, camera_id, source, priority=1, min_interval_s=MIN_POLL_INTERVAL_S,
+                 max_interval_s=MAX_POLL_INTERVAL_S):
+        self.camera_id = camera_id
+        self.source = source
+        self.priority = priority
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max_interval_s
+        self.interval_s = min(max(INITIAL_POLL_INTERVAL_S, min_interval_s), max_interval_s)
+        self.next_due = time.time()
+        self.last_served = 0.0
+        self.in_flight = False
+
+        self.layout_cache = SlotLayoutCache(camera_id=camera_id)
+        self.slot_registry = SlotRegistry(camera_id=camera_id)
+        self.previous_raw_statuses = {}
+
+        # Freshness / staleness bookkeeping
+        self.last_capture_time = None
+        self.last_result_time = None
+        self.last_occupied = 0
+        self.last_available = 0
+        self.polls = 0
+        self.failed_polls = 0
+        self.changed_slots_total = 0
+        self.busy_seconds = 0.0
+        self.latency_s = []     # Capture -> result published
+        self.peak_staleness_s = []  # Latency + interval chosen at that poll (age of the result when it is replaced)
+        self.lateness_s = []    # Poll start - due time (scheduler backlog)
+
+    def adapt_interval(self, changed_slots, total_slots):
+        changing = total_slots > 0 and changed_slots / total_slots >= CHANGE_FRACTION_FOR_SPEEDUP
+        factor = SPEEDUP_FACTOR if changing else SLOWDOWN_FACTOR
+        self.interval_s = min(max(self.interval_s * factor, self.min_interval_s), self.max_interval_s)
+
+    def staleness_s(self, now):
+        """
+        Age of the published occupancy relative to the real scene: now minus the capture time of the latest result.
+        """
+        return None if self.last_capture_time is None else now - self.last_capture_time
+
+# ---------------------- SCHEDULER ------------------------
+class CameraScheduler:
+    """
+    Multiplexes N cameras onto `num_workers` worker threads sharing one pipeline.
+
+    A worker always takes a camera that is due (next_due <= now) and not already being
+    processed; among due cameras the highest priority wins and ties go to the camera served
+    longest ago (round-robin). Each camera keeps its own layout cache and slot registry, and
+    its poll interval adapts to how fast its slots change, so busy cameras are polled often
+    and quiet ones rarely. When the workers cannot keep up, cameras run late instead of
+    queueing frames: lateness shows up in the report, never as a backlog of stale frames.
+    Stage 1 calls from the workers are serialized inside ParkingPipeline; Stage 2, cropping and
+    the per-camera bookkeeping of different cameras overlap.
+    """
+
+    def __init__(self, cameras, pipeline, num_workers=NUM_WORKERS, stage1_conf=STAGE1_CONF,
+                 stage2_occupied_threshold=STAGE2_OCCUPIED_THRESHOLD, result_sink=None):
+        self.cameras = {camera.camera_id: camera for camera in cameras}
+        self.sources = {}
+        self.pipeline = pipeline
+        self.num_workers = num_workers
+        self.stage1_conf = stage1_conf
+        self.stage2_occupied_threshold = stage2_occupied_threshold
+        self.result_sink = result_sink
+        self.sink_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.start_time = None
+
+    def _next_camera(self):
+        """
+        Blocks until a camera is due and returns it (marked in flight), or None once stopped.
+        """
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+                due = [camera for camera in self.cameras.values() if not camera.in_flight and camera.next_due <= now]
+                if due:
+                    camera = min(due, key=lambda c: (-c.priority, c.last_served))
+                    camera.in_flight = True
+                    return camera
+                waiting = [camera.next_due for camera in self.cameras.values() if not camera.in_flight]
+                self.condition.wait(timeout=max(0.01, min(waiting) - now) if waiting else 0.5)
+            return None
+
+    def _poll(self, camera):
+        poll_start = time.time()
+        camera.lateness_s.append(poll_start - camera.next_due)
+        frame, capture_time = self.sources[camera.camera_id].latest_frame()
+        if frame is None:
+            camera.failed_polls += 1
+            return
+        _, detected_slots_info, occupied_count, available_count = self.pipeline.predict(
+            frame, stage1_conf=self.stage1_conf, stage2_occupied_threshold=self.stage2_occupied_threshold,
+            layout_cache=camera.layout_cache, render=False, slot_registry=camera.slot_registry)
+        if detected_slots_info is None:
+            camera.failed_polls += 1
+            return
+
+        # Changes are measured on the raw statuses, so hysteresis does not hide activity from the rate control
+        raw_statuses = {slot['slot_id']: slot.get('raw_status', slot['status']) for slot in detected_slots_info}
+        changed_slots = sum(1 for slot_id, status in raw_statuses.items()
+                            if camera.previous_raw_statuses.get(slot_id, status) != status)
+        camera.previous_raw_statuses = raw_statuses
+        camera.adapt_interval(changed_slots, len(detected_slots_info))
+
+        result_time = time.time()
+        camera.polls += 1
+        camera.changed_slots_total += changed_slots
+        camera.last_capture_time = capture_time
+        camera.last_result_time = result_time
+        camera.last_occupied, camera.last_available = occupied_count, available_count
+        camera.latency_s.append(result_time - capture_time)
+        camera.peak_staleness_s.append(result_time - capture_time + camera.interval_s)
+        if self.result_sink is not None:
+            with self.sink_lock:
+                self.result_sink.write_frame({'frame_name': f"{camera.camera_id}@{capture_time:.3f}",
+                                              'camera_id': camera.camera_id, 'timestamp': capture_time},
+                                             detected_slots_info)
+
+    def _worker(self):
+        while True:
+            camera = self._next_camera()
+            if camera is None:
+                return
+            start = time.perf_counter()
+            try:
+                self._poll(camera)
+            except Exception as e:
+                camera.failed_polls += 1
+                print(f"  Camera '{camera.camera_id}' poll failed: {e}")
+            finally:
+                with self.condition:
+                    camera.busy_seconds += time.perf_counter() - start
+                    camera.last_served = time.time()
+                    camera.next_due = camera.last_served + camera.interval_s
+                    camera.in_flight = False
+                    self.condition.notify_all()
+
+    def run(self, duration_s=None, report_every_s=REPORT_EVERY_S):
+        """
+        Opens every source, runs the workers for `duration_s` seconds (until Ctrl+C when None) and prints
+        the freshness report every `report_every_s` seconds and at the end.
+        """
+        workers = []
+        self.start_time = time.time()
+        try:
+            # Opened inside the try, so the sources already open are closed if a later one fails
+            for camera in self.cameras.values():
+                self.sources[camera.camera_id] = CameraSource(camera.source)
+            self.start_time = time.time()
+            workers = [threading.Thread(target=self._worker, name=f'camera-worker-{i}', daemon=True)
+                       for i in range(self.num_workers)]
+            for worker in workers:
+                worker.start()
+            next_report = self.start_time + report_every_s
+            while duration_s is None or time.time() - self.start_time < duration_s:
+                time.sleep(0.5)
+                if time.time() >= next_report:
+                    self.print_report()
+                    next_report += report_every_s
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            with self.condition:
+                self.stopped = True
+                self.condition.notify_all()
+            for worker in workers:
+                worker.join()
+            for source in self.sources.values():
+                source.close()
+            if self.result_sink is not None:
+                self.result_sink.close()
+        self.print_report()
+
+    def print_report(self):
+        now = time.time()
+        elapsed = max(now - self.start_time, 1e-9)
+        total_busy = sum(camera.busy_seconds for camera in self.cameras.values())
+        print(f"\n--- Camera Freshness ({elapsed:.0f}s, {self.num_workers} workers, "
+              f"{total_busy / (elapsed * self.num_workers) * 100:.0f}% busy) ---")
+        print(f"  {'camera':<16} {'prio':>4} {'interval':>9} {'polls':>6} {'changed':>8} {'occ/free':>9} "
+              f"{'stale now':>10} {'stale p95':>10} {'late p95':>9} {'budget':>7}")
+        for camera in sorted(self.cameras.values(), key=lambda c: (-c.priority, c.camera_id)):
+            staleness = camera.staleness_s(now)
+            stale_p95 = np.percentile(camera.peak_staleness_s, 95) if camera.peak_staleness_s else None
+            late_p95 = np.percentile(camera.lateness_s, 95) if camera.lateness_s else None
+            print(f"  {camera.camera_id:<16} {camera.priority:>4} {camera.interval_s:>8.1f}s {camera.polls:>6} "
+                  f"{camera.changed_slots_total:>8} {f'{camera.last_occupied}/{camera.last_available}':>9} "
+                  f"{'-' if staleness is None else f'{staleness:.1f}s':>10} "
+                  f"{'-' if stale_p95 is None else f'{stale_p95:.1f}s':>10} "
+                  f"{'-' if late_p95 is None else f'{late_p95:.1f}s':>9} "
+                  f"{camera.busy_seconds / max(total_busy, 1e-9) * 100:>6.0f}%")
+            if camera.failed_polls:
+                print(f"    {camera.failed_polls} failed polls")
+
+def load_cameras(config_path=None, sources=()):
+    """
+    Cameras from a JSON list like [{"camera_id": "entrance", "source": "rtsp://...", "priority": 3,
+    "min_interval_s": 1, "max_interval_s": 30}, ...] and/or bare sources (ids cam0, cam1, ...).
+    """
+    cameras = []
+    if config_path:
+        with open(config_path, 'r') as f:
+            for entry in json.load(f):
+                cameras.append(CameraState(entry['camera_id'], entry['source'], entry.get('priority', 1),
+                                           entry.get('min_interval_s', MIN_POLL_INTERVAL_S),
+                                           entry.get('max_interval_s', MAX_POLL_INTERVAL_S)))
+    for i, source in enumerate(sources):
+        cameras.append(CameraState(f"cam{i}", source))
+    return cameras
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Poll many cameras on a fixed worker budget with adaptive rates.")
+    parser.add_argument('sources', nargs='*', help="Video files, RTSP URLs, camera indexes or frame directories")
+    parser.add_argument('--config', default=None, help="JSON list of cameras with ids, priorities and rate bounds")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--duration', type=float, default=None, help="Seconds to run (default: until Ctrl+C)")
+    parser.add_argument('--report-every', type=float, default=REPORT_EVERY_S)
+    parser.add_argument('--sink', action='append', default=[], choices=['sqlite', 'parquet', 'timeseries'],
+                        help="Also store per-frame and per-slot results (repeatable)")
+    args = parser.parse_args()
+
+    cameras = load_cameras(args.config, args.sources)
+    if not cameras:
+        print("Error: No cameras given. Pass sources or --config cameras.json.")
+        exit()
+
+    try:
+        pipeline = get_default_pipeline()
+        pipeline.warm_up()
+        result_sink = create_sink(args.sink, None, OUTPUT_SQLITE_PATH, OUTPUT_PARQUET_DIR,
+                                  OUTPUT_TIMESERIES_PATH) if args.sink else None
+        scheduler = CameraScheduler(cameras, pipeline, num_workers=args.workers, result_sink=result_sink)
+        print(f"Scheduling {len(cameras)} cameras on {args.workers} workers")
+        scheduler.run(duration_s=args.duration, report_every_s=args.report_every)
+    except RuntimeError as e:
+        print(e)
+        exit()
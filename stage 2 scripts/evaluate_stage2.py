@@ -0,0 +1,230 @@
+import os
+import re
+import csv
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from patch_store import (PACKED_PATCHES_DIR, SORTED_PATCHES_DIR, PatchStore, list_split, split_paths,
+                         PATCH_HEIGHT, PATCH_WIDTH)
+from stage2_calibration import (CALIBRATION_METHODS, apply_calibration, fit_calibration, save_calibration,
+                                log_loss, expected_calibration_error)
+
+# ---------------------- CONFIG ------------------------
+EVAL_SPLIT = 'test'
+CALIBRATION_SPLIT = 'val'            # Calibration is fitted on a different split than it is evaluated on
+SCORE_BATCH_SIZE = 512
+NUM_DECODE_WORKERS = 8               # Only used when the split has not been packed with patch_store.py
+THRESHOLDS = np.round(np.arange(0.01, 1.0, 0.01), 2)
+CURRENT_THRESHOLDS = [('function default', 0.7), ('inference.py main / scripts', 0.9)]
+LIGHTING_CONDITIONS = ['SUNNY', 'OVERCAST', 'RAINY']  # CNRPark-EXT patch folders: PATCHES/<WEATHER>/<date>/<camera>/
+MAX_FALSE_EMPTY_RATE = 0.02          # Reported: highest threshold that keeps missed occupied slots under this rate
+OUTPUT_CSV_DIR = 'csv_output'
+SCORE_CACHE_DIR = os.path.join(OUTPUT_CSV_DIR, 'stage2_eval_cache')
+SWEEP_CSV_PATH = os.path.join(OUTPUT_CSV_DIR, 'stage2_threshold_sweep.csv')
+CALIBRATION_OUTPUT_PATH = 'stage2_calibration.json'
+
+# ---------------------- SCORING ------------------------
+def lighting_condition(patch_path):
+    parts = {part.upper() for part in re.split(r'[\\/]', patch_path)}
+    for condition in LIGHTING_CONDITIONS:
+        if condition in parts:
+            return condition
+    return 'unknown'
+
+def iter_unpacked_batches(entries, batch_size):
+    """
+    Decodes patches from sorted_patches in batches (threaded), resized like prepare_stage2_batch.
+    """
+    def decode(entry):
+        patch = cv2.imread(entry[0], cv2.IMREAD_COLOR)
+        return None if patch is None else cv2.resize(patch, (PATCH_WIDTH, PATCH_HEIGHT))
+
+    with ThreadPoolExecutor(max_workers=NUM_DECODE_WORKERS) as pool:
+        for start in range(0, len(entries), batch_size):
+            batch_entries = entries[start:start + batch_size]
+            patches = list(pool.map(decode, batch_entries))
+            valid = [i for i, patch in enumerate(patches) if patch is not None]
+            batch = np.stack([patches[i] for i in valid]).astype(np.float32) / 255.0 if valid else None
+            yield batch, [batch_entries[i] for i in valid]
+
+def score_split(pipeline, split_name, batch_size=SCORE_BATCH_SIZE):
+    """
+    Raw Stage 2 scores for every patch of a split, with labels and source paths. Uses the packed
+    patch store when it exists (no decoding), otherwise decodes sorted_patches. Scores are cached
+    per split and model file (size + mtime) so re-running the sweep or calibration is instant.
+    """
+    stat = os.stat(pipeline.stage2_model_path)
+    signature = f"{os.path.abspath(pipeline.stage2_model_path)}|{pipeline.backend}|{stat.st_size}|{stat.st_mtime_ns}"
+    cache_path = os.path.join(SCORE_CACHE_DIR, f"{split_name}_scores.npz")
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            if str(cache['signature']) == signature:
+                print(f"Using cached '{split_name}' scores: {cache_path}")
+                return cache['scores'], cache['labels'], list(cache['paths'])
+
+    if os.path.exists(split_paths(PACKED_PATCHES_DIR, split_name)['images']):
+        store = PatchStore(PACKED_PATCHES_DIR, split_name)
+        print(f"Scoring {len(store)} packed '{split_name}' patches...")
+        scores = np.empty(len(store), dtype=np.float32)
+        position = 0
+        for batch_images, _ in store.batches(batch_size, shuffle=False):
+            scores[position:position + len(batch_images)] = pipeline.stage2_backend.predict_scores(batch_images)
+            position += len(batch_images)
+        labels, paths = store.labels.astype(np.uint8), list(store.index)
+    else:
+        entries = list_split(SORTED_PATCHES_DIR, split_name)
+        if not entries:
+            raise RuntimeError(f"No patches found for split '{split_name}' (pack them with patch_store.py "
+                               f"or sort them with sort_pnr_patches.py)")
+        print(f"Scoring {len(entries)} '{split_name}' patches from {SORTED_PATCHES_DIR} (pack them for faster runs)...")
+        score_parts, labels, paths = [], [], []
+        for batch, batch_entries in iter_unpacked_batches(entries, batch_size):
+            if batch is None:
+                continue
+            score_parts.append(pipeline.stage2_backend.predict_scores(batch))
+            paths.extend(path for path, _ in batch_entries)
+            labels.extend(label for _, label in batch_entries)
+        scores = np.concatenate(score_parts).astype(np.float32)
+        labels = np.array(labels, dtype=np.uint8)
+
+    os.makedirs(SCORE_CACHE_DIR, exist_ok=True)
+    np.savez(cache_path, signature=signature, scores=scores, labels=labels, paths=np.array(paths, dtype=str))
+    return scores, labels, paths
+
+# ---------------------- METRICS ------------------------
+def threshold_metrics(scores, labels, thresholds=THRESHOLDS):
+    """
+    Confusion counts and rates for every threshold at once ("occupied" = score > threshold, as in
+    scores_to_slots_info): sorting the scores per class turns each count into one searchsorted.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    positive_scores = np.sort(scores[labels == 1])
+    negative_scores = np.sort(scores[labels == 0])
+    tp = len(positive_scores) - np.searchsorted(positive_scores, thresholds, side='right')
+    fp = len(negative_scores) - np.searchsorted(negative_scores, thresholds, side='right')
+    fn = len(positive_scores) - tp
+    tn = len(negative_scores) - fp
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        false_occupied_rate = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+    return {'threshold': thresholds, 'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn, 'precision': precision,
+            'recall': recall, 'f1': f1, 'accuracy': (tp + tn) / max(len(scores), 1),
+            'false_empty_rate': 1.0 - recall, 'false_occupied_rate': false_occupied_rate}
+
+def roc_pr_summary(scores, labels):
+    """
+    ROC AUC and average precision over every distinct score (exact curves, not the threshold grid).
+    """
+    order = np.argsort(-scores, kind='stable')
+    sorted_scores, sorted_labels = scores[order], labels[order].astype(np.float64)
+    # Last index of each run of equal scores, so ties are handled as one threshold
+    distinct = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+    tp = np.cumsum(sorted_labels)[distinct]
+    fp = (distinct + 1) - tp
+    num_positive, num_negative = sorted_labels.sum(), len(sorted_labels) - sorted_labels.sum()
+    if num_positive == 0 or num_negative == 0:
+        return {'roc_auc': float('nan'), 'average_precision': float('nan')}
+    tpr = np.r_[0.0, tp / num_positive]
+    fpr = np.r_[0.0, fp / num_negative]
+    precision = tp / (tp + fp)
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    average_precision = float(np.sum(np.diff(tpr) * precision))
+    return {'roc_auc': roc_auc, 'average_precision': average_precision}
+
+def pick_thresholds(metrics):
+    """
+    Best-F1 and best-accuracy thresholds, plus the highest threshold (fewest false occupied slots)
+    whose false-empty rate stays under MAX_FALSE_EMPTY_RATE.
+    """
+    picks = {'best F1': int(np.argmax(metrics['f1'])), 'best accuracy': int(np.argmax(metrics['accuracy']))}
+    within_budget = np.flatnonzero(metrics['false_empty_rate'] <= MAX_FALSE_EMPTY_RATE)
+    if len(within_budget):
+        picks[f"false empty <= {MAX_FALSE_EMPTY_RATE:.0%}"] = int(within_budget[-1])
+    return picks
+
+def print_threshold_row(name, metrics, i):
+    print(f"  {name:<30} t={metrics['threshold'][i]:.2f}  acc {metrics['accuracy'][i]:.4f}  "
+          f"P {metrics['precision'][i]:.4f}  R {metrics['recall'][i]:.4f}  F1 {metrics['f1'][i]:.4f}  "
+          f"false empty {metrics['false_empty_rate'][i]:.4f}  false occupied {metrics['false_occupied_rate'][i]:.4f}")
+
+def report(scores, labels, paths, title):
+    """
+    Prints ROC/PR, the confusion matrix at the current and suggested thresholds and per-lighting
+    error rates; returns the per-threshold metrics.
+    """
+    metrics = threshold_metrics(scores, labels)
+    summary = roc_pr_summary(scores, labels)
+    print(f"\n--- {title}: {len(scores)} patches ({int(labels.sum())} occupied) ---")
+    print(f"  ROC AUC {summary['roc_auc']:.4f}, average precision {summary['average_precision']:.4f}, "
+          f"log loss {log_loss(scores, labels):.4f}, ECE {expected_calibration_error(scores, labels):.4f}")
+
+    rows = [(name, int(np.argmin(np.abs(THRESHOLDS - threshold)))) for name, threshold in CURRENT_THRESHOLDS]
+    rows += list(pick_thresholds(metrics).items())
+    for name, i in rows:
+        print_threshold_row(name, metrics, i)
+    for name, i in rows:
+        print(f"  Confusion at {metrics['threshold'][i]:.2f} ({name}): "
+              f"TP {metrics['tp'][i]}  FP {metrics['fp'][i]}  TN {metrics['tn'][i]}  FN {metrics['fn'][i]}")
+
+    conditions = np.array([lighting_condition(path) for path in paths])
+    print("  Error rate by lighting condition:")
+    for condition in LIGHTING_CONDITIONS + ['unknown']:
+        mask = conditions == condition
+        if not mask.any():
+            continue
+        condition_metrics = threshold_metrics(scores[mask], labels[mask])
+        errors = ", ".join(f"{1.0 - condition_metrics['accuracy'][i]:.4f} @ {THRESHOLDS[i]:.2f}" for _, i in rows)
+        print(f"    {condition:<9} n={int(mask.sum()):<7} {errors}")
+    return metrics
+
+def write_sweep_csv(metrics_by_name, csv_path=SWEEP_CSV_PATH):
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+    columns = ['threshold', 'accuracy', 'precision', 'recall', 'f1', 'false_empty_rate', 'false_occupied_rate',
+               'tp', 'fp', 'tn', 'fn']
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['scores'] + columns)
+        for name, metrics in metrics_by_name.items():
+            for i in range(len(metrics['threshold'])):
+                writer.writerow([name] + [metrics[column][i] for column in columns])
+    print(f"\nThreshold sweep saved to CSV: {csv_path}")
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    from inference import ParkingPipeline
+
+    parser = argparse.ArgumentParser(description="Stage 2 threshold sweep, ROC/PR and calibration on patch splits.")
+    parser.add_argument('--split', default=EVAL_SPLIT)
+    parser.add_argument('--backend', default='native', choices=['native', 'onnx'])
+    parser.add_argument('--calibrate', choices=CALIBRATION_METHODS, default=None,
+                        help="Fit a calibration on --calibration-split and report the evaluation split with it")
+    parser.add_argument('--calibration-split', default=CALIBRATION_SPLIT)
+    parser.add_argument('--calibration-out', default=CALIBRATION_OUTPUT_PATH,
+                        help="Where to save the fitted calibration (set STAGE2_CALIBRATION_PATH in inference.py to it)")
+    args = parser.parse_args()
+
+    try:
+        pipeline = ParkingPipeline(backend=args.backend)
+        scores, labels, paths = score_split(pipeline, args.split)
+        metrics_by_name = {'raw': report(scores, labels, paths, f"Raw scores, '{args.split}'")}
+
+        if args.calibrate:
+            fit_scores, fit_labels, _ = score_split(pipeline, args.calibration_split)
+            calibration = fit_calibration(fit_scores, fit_labels, method=args.calibrate)
+            calibration['fitted_on'] = args.calibration_split
+            calibration['model'] = os.path.basename(pipeline.stage2_model_path)
+            print(f"\nFitted {args.calibrate} calibration on '{args.calibration_split}': "
+                  f"scale {calibration['scale']:.4f} (T = {calibration['temperature']:.4f}), bias {calibration['bias']:.4f}")
+            calibrated_scores = apply_calibration(scores, calibration)
+            metrics_by_name['calibrated'] = report(calibrated_scores, labels, paths,
+                                                   f"Calibrated scores, '{args.split}'")
+            save_calibration(args.calibration_out, calibration)
+            print(f"Calibration saved to: {args.calibration_out}")
+        write_sweep_csv(metrics_by_name)
+    except RuntimeError as e:
+        print(e)
+        exit()
@@ -0,0 +1,239 @@
+import multiprocessing as mp
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+# ---------------------- CONFIG ------------------------
+RING_SLOTS = 8                      # Preallocated frames shared by all decoders and workers
+MAX_FRAME_SHAPE = (1080, 1920, 3)   # Largest frame a slot can hold (height, width, channels)
+SLOT_ALIGNMENT = 64                 # Slot data starts on a cache-line boundary
+
+# Slot states
+FREE, WRITING, READY, READING = 0, 1, 2, 3
+
+# Per-slot header columns (int64)
+STATE, SEQUENCE, HEIGHT, WIDTH, CHANNELS, CAPTURE_TIME_NS, SOURCE_INDEX, FRAME_INDEX = range(8)
+HEADER_COLUMNS = 8
+
+# Ring-wide counters (int64)
+NEXT_SEQUENCE, WRITERS_OPEN, DROPPED, READ_TOTAL = range(4)
+CONTROL_COLUMNS = 4
+
+# ---------------------- ATTACHING ------------------------
+def attach_shared_memory(name):
+    """
+    Attaches to an existing block without registering it with the resource tracker; the creating
+    process owns (and unlinks) it. Python 3.13+ supports this with track=False. Older versions
+    register every attach, and because spawned children share the parent's tracker, which keeps
+    one entry per name, unregistering after attaching would also drop the parent's entry. So the
+    registration is skipped while attaching instead.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == 'shared_memory' else register(name, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+# ---------------------- LEASES ------------------------
+class FrameLease:
+    """
+    One READY frame handed to a reader. `frame` is a NumPy view straight into shared memory:
+    slicing it for crops copies nothing, and the slot cannot be reused by a writer until the
+    lease is released (use it as a context manager). Anything that must outlive the lease,
+    such as an annotated output image, has to be copied first.
+    """
+
+    def __init__(self, ring, slot, sequence, frame, capture_time, source_index, frame_index):
+        self.ring = ring
+        self.slot = slot
+        self.sequence = sequence
+        self.frame = frame
+        self.capture_time = capture_time
+        self.source_index = source_index
+        self.frame_index = frame_index
+
+    def release(self):
+        if self.frame is not None:
+            self.frame = None
+            self.ring.release(self.slot, self.sequence)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+# ---------------------- RING BUFFER ------------------------
+class SharedFrameRing:
+    """
+    Ring of preallocated frame slots in one shared-memory block, passed between decoder and
+    inference processes without pickling any pixels.
+
+    Writers (decoders) call `write(frame, ...)`, or `begin_write(shape)` / `commit_write(...)` to
+    decode straight into the slot. Readers call `read()`, which returns a FrameLease whose
+    `frame` is a view of the slot, or None once `writer_done()` has been called for every writer
+    (by the writer itself or, as in ring_inference.py, by the parent once the writer process has
+    exited) and no frame is left. Ownership is tracked per slot with a state and a sequence number under one
+    shared condition: a slot is FREE, WRITING (owned by one writer), READY (published with the
+    next sequence number) or READING (leased to one reader). Readers take the oldest READY
+    frame; when no slot is free a writer reclaims the oldest READY frame instead of blocking,
+    so latency stays bounded like DropOldestQueue in stream_inference.py. A release whose
+    sequence does not match the slot raises, so a stale lease can never free someone else's frame.
+
+    Create the ring in the parent with the multiprocessing context used to start the children
+    and pass it in the Process args; children re-attach to the block by name.
+    """
+
+    def __init__(self, num_slots=RING_SLOTS, max_frame_shape=MAX_FRAME_SHAPE, num_writers=1, context=None):
+        context = context or mp.get_context()
+        self.num_slots = num_slots
+        self.max_frame_shape = tuple(max_frame_shape)
+        self.slot_bytes = -(-int(np.prod(max_frame_shape)) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self.condition = context.Condition()
+        self.owner = True
+        self.shm = shared_memory.SharedMemory(create=True, size=self._total_bytes())
+        self._map_arrays()
+        self.control[:] = 0
+        self.headers[:] = 0
+        self.control[NEXT_SEQUENCE] = 1
+        self.control[WRITERS_OPEN] = num_writers
+
+    def _data_offset(self):
+        header_bytes = (CONTROL_COLUMNS + self.num_slots * HEADER_COLUMNS) * 8
+        return -(-header_bytes // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+
+    def _total_bytes(self):
+        return self._data_offset() + self.num_slots * self.slot_bytes
+
+    def _map_arrays(self):
+        self.control = np.ndarray((CONTROL_COLUMNS,), dtype=np.int64, buffer=self.shm.buf)
+        self.headers = np.ndarray((self.num_slots, HEADER_COLUMNS), dtype=np.int64, buffer=self.shm.buf,
+                                  offset=CONTROL_COLUMNS * 8)
+        self.data = np.ndarray((self.num_slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf,
+                               offset=self._data_offset())
+
+    def __getstate__(self):
+        # Only the block name and the shared condition travel to the child; the pixels stay put
+        return {'num_slots': self.num_slots, 'max_frame_shape': self.max_frame_shape, 'slot_bytes': self.slot_bytes,
+                'condition': self.condition, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.num_slots = state['num_slots']
+        self.max_frame_shape = state['max_frame_shape']
+        self.slot_bytes = state['slot_bytes']
+        self.condition = state['condition']
+        self.owner = False
+        self.shm = attach_shared_memory(state['name'])
+        self._map_arrays()
+
+    def _slot_view(self, slot, shape):
+        return self.data[slot, :int(np.prod(shape))].reshape(shape)
+
+    # ---------------------- WRITER SIDE ------------------------
+    def begin_write(self, shape):
+        """
+        Claims a slot for a frame of `shape` and returns (slot, writable view). Reclaims the
+        oldest READY frame (counted in `dropped`) when no slot is free, and only waits when
+        every slot is being written or read.
+        """
+        if int(np.prod(shape)) > self.slot_bytes:
+            raise ValueError(f"Frame of shape {tuple(shape)} does not fit a ring slot of shape {self.max_frame_shape}")
+        with self.condition:
+            while True:
+                states = self.headers[:, STATE]
+                free_slots = np.flatnonzero(states == FREE)
+                if len(free_slots):
+                    slot = int(free_slots[0])
+                    break
+                ready_slots = np.flatnonzero(states == READY)
+                if len(ready_slots):
+                    slot = int(ready_slots[np.argmin(self.headers[ready_slots, SEQUENCE])])
+                    self.control[DROPPED] += 1
+                    break
+                self.condition.wait(timeout=0.1)
+            self.headers[slot, STATE] = WRITING
+        return slot, self._slot_view(slot, shape)
+
+    def commit_write(self, slot, shape, capture_time=None, source_index=0, frame_index=-1):
+        """
+        Publishes the frame written into `slot` and returns its sequence number.
+        """
+        with self.condition:
+            header = self.headers[slot]
+            header[HEIGHT], header[WIDTH] = shape[0], shape[1]
+            header[CHANNELS] = shape[2] if len(shape) > 2 else 0
+            header[CAPTURE_TIME_NS] = int((time.time() if capture_time is None else capture_time) * 1e9)
+            header[SOURCE_INDEX], header[FRAME_INDEX] = source_index, frame_index
+            sequence = int(self.control[NEXT_SEQUENCE])
+            self.control[NEXT_SEQUENCE] += 1
+            header[SEQUENCE] = sequence
+            header[STATE] = READY
+            self.condition.notify_all()
+        return sequence
+
+    def abort_write(self, slot):
+        with self.condition:
+            self.headers[slot, STATE] = FREE
+            self.condition.notify_all()
+
+    def write(self, frame, capture_time=None, source_index=0, frame_index=-1):
+        """
+        Copies `frame` into a slot (the only copy on its way to the workers) and publishes it.
+        """
+        slot, view = self.begin_write(frame.shape)
+        np.copyto(view, frame)
+        return self.commit_write(slot, frame.shape, capture_time, source_index, frame_index)
+
+    def writer_done(self):
+        with self.condition:
+            self.control[WRITERS_OPEN] -= 1
+            self.condition.notify_all()
+
+    # ---------------------- READER SIDE ------------------------
+    def read(self):
+        """
+        Blocks for the oldest READY frame and leases it, or returns None at end of stream.
+        """
+        with self.condition:
+            while True:
+                ready_slots = np.flatnonzero(self.headers[:, STATE] == READY)
+                if len(ready_slots):
+                    slot = int(ready_slots[np.argmin(self.headers[ready_slots, SEQUENCE])])
+                    break
+                if self.control[WRITERS_OPEN] <= 0:
+                    return None
+                self.condition.wait(timeout=0.1)
+            header = self.headers[slot]
+            header[STATE] = READING
+            self.control[READ_TOTAL] += 1
+            shape = (int(header[HEIGHT]), int(header[WIDTH])) + ((int(header[CHANNELS]),) if header[CHANNELS] else ())
+            return FrameLease(self, slot, int(header[SEQUENCE]), self._slot_view(slot, shape),
+                              header[CAPTURE_TIME_NS] / 1e9, int(header[SOURCE_INDEX]), int(header[FRAME_INDEX]))
+
+    def release(self, slot, sequence):
+        with self.condition:
+            if self.headers[slot, STATE] != READING or self.headers[slot, SEQUENCE] != sequence:
+                raise RuntimeError(f"Ring slot {slot} released with sequence {sequence}, "
+                                   f"but it holds sequence {int(self.headers[slot, SEQUENCE])}")
+            self.headers[slot, STATE] = FREE
+            self.condition.notify_all()
+
+    # ---------------------- BOOKKEEPING ------------------------
+    def stats(self):
+        with self.condition:
+            return {'written': int(self.control[NEXT_SEQUENCE]) - 1, 'read': int(self.control[READ_TOTAL]),
+                    'dropped': int(self.control[DROPPED])}
+
+    def close(self):
+        """
+        Detaches this process (all leases must be released); the creating process also frees the block.
+        """
+        self.control = self.headers = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
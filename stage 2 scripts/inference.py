@@ -1,115 +1,221 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing.image import img_to_array
 import os
-import csv
+import threading
+import time
+
+from inference_backends import create_stage1_backend, create_stage2_backend
+from instrumentation import Instrumentation, DISABLED_INSTRUMENTATION
+from render_writer import BackgroundImageWriter, should_render
+from result_cache import ResultCache
+from stage2_calibration import apply_calibration, load_calibration
+
+# NOTE: Ultralytics, TensorFlow and ONNX Runtime are imported lazily by the backends, so importing
+# this module (e.g. for the drawing or CSV helpers) does not load any framework.
 
 # ---------------------- CONFIG ------------------------
 STAGE1_MODEL_PATH = 'best.pt'
 STAGE2_MODEL_PATH = 'stage2_occupancy_classifier_best.h5'
+ONNX_STAGE1_MODEL_PATH = 'best.onnx'
+ONNX_STAGE2_MODEL_PATH = 'stage2_occupancy_classifier_best.onnx'
+BACKEND = 'native'  # 'native' (PyTorch + TensorFlow) or 'onnx' (ONNX Runtime for both stages)
+DEFAULT_MODEL_PATHS = {
+    'native': (STAGE1_MODEL_PATH, STAGE2_MODEL_PATH),
+    'onnx': (ONNX_STAGE1_MODEL_PATH, ONNX_STAGE2_MODEL_PATH)
+}
 INPUT_TEST_IMAGES_DIR = 'test_images'
 OUTPUT_VISUALIZATION_DIR = 'test_results_creative'
 OUTPUT_CSV_DIR = 'csv_output'
+RENDER_MODE = 'always'       # Annotated JPEGs: 'off', 'sampled' (every RENDER_EVERY_N_FRAMES images) or 'always'
+RENDER_EVERY_N_FRAMES = 10
+RESULT_CACHE_ENABLED = True  # Reuse stored slots for images already processed with the same models and thresholds
+RESULT_CACHE_PATH = os.path.join(OUTPUT_CSV_DIR, 'result_cache.sqlite')
+STAGE2_CALIBRATION_PATH = None  # e.g. 'stage2_calibration.json' from evaluate_stage2.py --calibrate; None = raw scores
+OUTPUT_SINKS = ['csv']  # Any of 'csv' (per-image summary), 'sqlite' and 'parquet' (per-frame + per-slot records)
+                        # and 'timeseries' (occupancy_store.py)
+OUTPUT_SUMMARY_CSV_PATH = os.path.join(OUTPUT_CSV_DIR, 'all_images_parking_summary_creative.csv')
+OUTPUT_SQLITE_PATH = os.path.join(OUTPUT_CSV_DIR, 'parking_results.sqlite')
+OUTPUT_PARQUET_DIR = os.path.join(OUTPUT_CSV_DIR, 'parking_results_parquet')
+OUTPUT_TIMESERIES_PATH = os.path.join(OUTPUT_CSV_DIR, 'occupancy_timeseries.sqlite')
 
 STAGE2_IMG_HEIGHT = 96
 STAGE2_IMG_WIDTH = 96
+STAGE2_MAX_BATCH_SIZE = 64  # Upper bound on crops per Stage 2 call (dense lots are split into chunks)
+STAGE1_BATCH_SIZE = 8       # Images per Stage 1 call in directory runs
+WARMUP_IMAGE_SIZE = 640     # Side of the dummy frame used to warm up Stage 1
 
-# Create output directories if not exist
-os.makedirs(OUTPUT_VISUALIZATION_DIR, exist_ok=True)
-os.makedirs(OUTPUT_CSV_DIR, exist_ok=True)
-
-# ---------------------- MODEL LOADING ------------------------
-print(f"Loading Stage 1 YOLOv8 model from: {STAGE1_MODEL_PATH}")
-try:
-    stage1_model = YOLO(STAGE1_MODEL_PATH)
-    print("Stage 1 YOLOv8 model loaded successfully.")
-except Exception as e:
-    print(f"Error loading Stage 1 model: {e}")
-    exit()
-
-print(f"Loading Stage 2 CNN Occupancy model from: {STAGE2_MODEL_PATH}")
-try:
-    stage2_model = load_model(STAGE2_MODEL_PATH)
-    print("Stage 2 CNN Occupancy model loaded successfully.")
-except Exception as e:
-    print(f"Error loading Stage 2 model: {e}")
-    exit()
+STAGE1_TILING = False               # Slice large frames into overlapping tiles for Stage 1 (dense, distant slots)
+STAGE1_TILED_MIN_SIDE = 1280        # Only frames whose longer side is at least this are tiled
+STAGE1_TILE_SIZE = 640              # Tile side in pixels (the YOLO input size, so tiles are not downscaled)
+STAGE1_TILE_OVERLAP = 0.2           # Fraction of a tile shared with its neighbour
+STAGE1_TILE_BATCH_SIZE = 8          # Tiles per Stage 1 call
+STAGE1_TILE_FULL_FRAME_PASS = True  # Also run the whole frame once, for slots larger than a tile
+STAGE1_TILE_MERGE_THRESHOLD = 0.6   # Cross-tile NMS: intersection over the smaller box above which boxes merge
+STAGE1_TILE_LAYOUT_MARGIN = 64      # Tiles farther than this from every known slot are skipped
 
-# ---------------------- MAIN INFERENCE FUNCTION ------------------------
-def predict_parking_occupancy_creative(image_path_or_cv2_image, stage1_conf=0.3, stage2_occupied_threshold=0.7):
-    # Handle input type (path or cv2 image)
-    if isinstance(image_path_or_cv2_image, str):
-        original_image = cv2.imread(image_path_or_cv2_image)
-        if original_image is None:
-            print(f"Error: Could not read image from {image_path_or_cv2_image}")
-            return None, None, 0, 0
-    else:
-        original_image = image_path_or_cv2_image.copy()
+INSTRUMENTATION_ENABLED = False  # Stage timers/counters for directory runs (near-zero cost when off)
+TRACE_ENABLED = False            # Also keep a per-frame Chrome trace (needs INSTRUMENTATION_ENABLED)
+METRICS_OUTPUT_PATH = os.path.join(OUTPUT_CSV_DIR, 'inference_metrics.prom')
+TRACE_OUTPUT_PATH = os.path.join(OUTPUT_CSV_DIR, 'inference_trace.json')
+
+# ---------------------- HELPERS (NO MODELS NEEDED) ------------------------
+def extract_slot_crops(original_image, boxes, return_indices=False):
+    """
+    Clips Stage 1 boxes to the image bounds and returns the integer boxes
+    together with their (non-empty) crops, in detection order.
+    With `return_indices` the positions of the kept boxes in `boxes` are returned as well.
+    """
+    h_img, w_img = original_image.shape[:2]
+    slot_boxes = []
+    slot_crops = []
+    kept_indices = []
+    for box_index, box in enumerate(boxes):
+        x1, y1, x2, y2 = map(int, box)
+        x1_crop, y1_crop = max(0, x1), max(0, y1)
+        x2_crop, y2_crop = min(w_img, x2), min(h_img, y2)
+
+        if x1_crop >= x2_crop or y1_crop >= y2_crop:
+            continue
+        slot_crop = original_image[y1_crop:y2_crop, x1_crop:x2_crop]
+        if slot_crop.size == 0:
+            continue
+        slot_boxes.append((x1, y1, x2, y2))
+        slot_crops.append(slot_crop)
+        kept_indices.append(box_index)
+    if return_indices:
+        return slot_boxes, slot_crops, kept_indices
+    return slot_boxes, slot_crops
 
-    # Run YOLOv8 detection
-    stage1_results = stage1_model.predict(original_image, conf=stage1_conf, iou=0.5, verbose=False)
+def prepare_stage2_batch(slot_crops):
+    """
+    Resizes all crops into one preallocated (N, 96, 96, 3) float32 tensor scaled to [0, 1].
+    """
+    batch = np.empty((len(slot_crops), STAGE2_IMG_HEIGHT, STAGE2_IMG_WIDTH, 3), dtype=np.float32)
+    for i, slot_crop in enumerate(slot_crops):
+        batch[i] = cv2.resize(slot_crop, (STAGE2_IMG_WIDTH, STAGE2_IMG_HEIGHT))
+    batch /= 255.0
+    return batch
 
+def scores_to_slots_info(slot_boxes, predictions_s2, stage2_occupied_threshold, slot_confidences=None):
+    """
+    Builds detected_slots_info: one dict per slot with its box, status and raw Stage 2 score,
+    plus the Stage 1 confidence when `slot_confidences` is given.
+    """
     detected_slots_info = []
-    output_visualization_image = original_image.copy()
-    occupied_count_viz = 0
-    empty_count_viz = 0
-
-    # Process detections if any
-    if stage1_results and stage1_results[0].boxes and len(stage1_results[0].boxes) > 0:
-        boxes = stage1_results[0].boxes.xyxy.cpu().numpy()
-        confidences_s1 = stage1_results[0].boxes.conf.cpu().numpy()
-
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = map(int, box)
-            center_x = (x1 + x2) // 2
-            center_y = (y1 + y2) // 2
-
-            # Crop the detected region
-            h_img, w_img = original_image.shape[:2]
-            x1_crop, y1_crop = max(0, x1), max(0, y1)
-            x2_crop, y2_crop = min(w_img, x2), min(h_img, y2)
-
-            if x1_crop >= x2_crop or y1_crop >= y2_crop:
-                continue
-            slot_crop = original_image[y1_crop:y2_crop, x1_crop:x2_crop]
-            if slot_crop.size == 0:
-                continue
+    for i, ((x1, y1, x2, y2), prediction_s2) in enumerate(zip(slot_boxes, predictions_s2)):
+        # Determine occupancy
+        occupancy_status = "occupied" if prediction_s2 > stage2_occupied_threshold else "empty"
+        slot_info = {'box': [x1, y1, x2, y2], 'status': occupancy_status, 'score': float(prediction_s2)}
+        if slot_confidences is not None:
+            slot_info['confidence'] = float(slot_confidences[i])
+        detected_slots_info.append(slot_info)
+    return detected_slots_info
 
-            # Prepare crop for stage 2 CNN classifier
-            img_resized_for_stage2 = cv2.resize(slot_crop, (STAGE2_IMG_WIDTH, STAGE2_IMG_HEIGHT))
-            img_array_for_stage2 = img_to_array(img_resized_for_stage2) / 255.0
-            img_batch_for_stage2 = np.expand_dims(img_array_for_stage2, axis=0)
-
-            # Run stage 2 prediction
-            prediction_s2_raw = stage2_model.predict(img_batch_for_stage2, verbose=0)
-            prediction_s2 = prediction_s2_raw[0][0]
-
-            # Determine occupancy
-            occupancy_status = "occupied" if prediction_s2 > stage2_occupied_threshold else "empty"
-            detected_slots_info.append({'box': [x1, y1, x2, y2], 'status': occupancy_status})
-
-            # Draw marker + optional box
-            marker_radius = 8
-            line_thickness_for_box = 1
-
-            if occupancy_status == "occupied":
-                color = (0, 0, 255)
-                occupied_count_viz += 1
-                if line_thickness_for_box > 0:
-                    cv2.rectangle(output_visualization_image, (x1, y1), (x2, y2), (50, 50, 150), line_thickness_for_box)
-                cv2.circle(output_visualization_image, (center_x, center_y), marker_radius, color, -1)
-            else:
-                color = (0, 255, 0)
-                empty_count_viz += 1
-                if line_thickness_for_box > 0:
-                    cv2.rectangle(output_visualization_image, (x1, y1), (x2, y2), (50, 150, 50), line_thickness_for_box)
-                cv2.circle(output_visualization_image, (center_x, center_y), marker_radius, color, -1)
+def box_iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise IoU between two sets of xyxy boxes, returned as a (len(a), len(b)) array.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    inter_x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    inter_y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    inter_x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    inter_y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(inter_x2 - inter_x1, 0, None) * np.clip(inter_y2 - inter_y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+def non_max_suppression(boxes, confidences, threshold, match_metric='ios'):
+    """
+    Greedy class-agnostic NMS. Returns the indices of the kept boxes, highest confidence first.
+    'iou' compares intersection over union; 'ios' compares intersection over the smaller box,
+    which also merges a slot cut by a tile border with the complete box from the next tile.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.empty((0,), dtype=np.int64)
+    order = np.argsort(-confidences, kind='stable')
+    iou = box_iou_matrix(boxes[order], boxes[order])
+    if match_metric == 'ios':
+        areas = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))[order]
+        # union = a + b - intersection and iou = intersection / union give intersection back from the IoU
+        intersection = iou * (areas[:, None] + areas[None, :]) / (1.0 + iou)
+        overlap = intersection / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-9)
+    elif match_metric == 'iou':
+        overlap = iou
     else:
-        print("  Stage 1: No slots detected for this image.")
+        raise ValueError(f"Unknown NMS match metric '{match_metric}', expected 'iou' or 'ios'")
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed |= overlap[i] > threshold
+    return np.asarray(keep, dtype=np.int64)
+
+def make_tile_grid(image_height, image_width, tile_size=STAGE1_TILE_SIZE, overlap=STAGE1_TILE_OVERLAP):
+    """
+    Returns (x1, y1, x2, y2) tiles of tile_size x tile_size covering the image, neighbours sharing at
+    least `overlap` of a tile. The last row and column are aligned to the image edge, so every tile is full size.
+    """
+    def tile_starts(length):
+        if length <= tile_size:
+            return [0]
+        stride = max(1, int(tile_size * (1.0 - overlap)))
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    return [(x1, y1, x1 + tile_size, y1 + tile_size)
+            for y1 in tile_starts(image_height) for x1 in tile_starts(image_width)]
+
+def tiles_near_boxes(tiles, boxes, margin=STAGE1_TILE_LAYOUT_MARGIN):
+    """
+    Keeps the tiles that overlap at least one box grown by `margin` pixels.
+    """
+    tiles_array = np.asarray(tiles, dtype=np.float32).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    overlaps = ((boxes[None, :, 0] - margin < tiles_array[:, None, 2]) &
+                (boxes[None, :, 2] + margin > tiles_array[:, None, 0]) &
+                (boxes[None, :, 1] - margin < tiles_array[:, None, 3]) &
+                (boxes[None, :, 3] + margin > tiles_array[:, None, 1]))
+    return [tile for tile, near in zip(tiles, overlaps.any(axis=1)) if near]
+
+def count_slot_statuses(detected_slots_info):
+    occupied_count = sum(1 for slot in detected_slots_info if slot['status'] == "occupied")
+    return occupied_count, len(detected_slots_info) - occupied_count
+
+# ---------------------- VISUALIZATION ------------------------
+def draw_occupancy_overlay(output_visualization_image, detected_slots_info):
+    """
+    Draws a marker (and thin box) per slot plus the summary banner onto the image in place.
+    """
+    marker_radius = 8
+    line_thickness_for_box = 1
+
+    for slot in detected_slots_info:
+        x1, y1, x2, y2 = slot['box']
+        center_x = (x1 + x2) // 2
+        center_y = (y1 + y2) // 2
+
+        if slot['status'] == "occupied":
+            color = (0, 0, 255)
+            if line_thickness_for_box > 0:
+                cv2.rectangle(output_visualization_image, (x1, y1), (x2, y2), (50, 50, 150), line_thickness_for_box)
+            cv2.circle(output_visualization_image, (center_x, center_y), marker_radius, color, -1)
+        else:
+            color = (0, 255, 0)
+            if line_thickness_for_box > 0:
+                cv2.rectangle(output_visualization_image, (x1, y1), (x2, y2), (50, 150, 50), line_thickness_for_box)
+            cv2.circle(output_visualization_image, (center_x, center_y), marker_radius, color, -1)
 
     # Add summary text on image
+    occupied_count_viz, empty_count_viz = count_slot_statuses(detected_slots_info)
     total_detected_viz = occupied_count_viz + empty_count_viz
     summary_text = f"Detected: {total_detected_viz} | Occupied: {occupied_count_viz} | Empty: {empty_count_viz}"
     font_face = cv2.FONT_HERSHEY_SIMPLEX
@@ -126,54 +232,589 @@ def predict_parking_occupancy_creative(image_path_or_cv2_image, stage1_conf=0.3,
                   (text_x + text_width + 5, text_y + baseline - 5), background_color, -1)
     cv2.putText(output_visualization_image, summary_text, (text_x, text_y),
                 font_face, font_scale, text_color, text_thickness, cv2.LINE_AA)
+    return output_visualization_image
+
+# ---------------------- PIPELINE ------------------------
+class ParkingPipeline:
+    """
+    Two-stage parking occupancy pipeline (YOLOv8 slot detection + CNN occupancy classifier).
+
+    Each stage is loaded on first use, so constructing the pipeline is free. Call
+    `warm_up()` to load both stages and run them once on dummy input before serving;
+    `cold_start_seconds` records load and first-inference time per stage.
+    Model loading errors are raised as RuntimeError instead of exiting the process.
+
+    `backend` selects the runtime for both stages (see inference_backends.py):
+    'native' runs best.pt on PyTorch and the .h5 on TensorFlow, 'onnx' runs the exported
+    (optionally INT8-quantized) .onnx files on ONNX Runtime.
+
+    Pass an `Instrumentation` (see instrumentation.py) to time every stage and count slots,
+    Stage 2 batch sizes and cache hits; without one the hooks are no-ops.
+
+    With `stage1_tiling`, frames whose longer side is at least STAGE1_TILED_MIN_SIDE are
+    detected as overlapping full-resolution tiles (see run_stage1_detection_tiled).
+
+    `stage2_calibration_path` points to a calibration fitted by evaluate_stage2.py; Stage 2
+    scores are then calibrated probabilities and thresholds should be chosen on that scale.
+    """
+
+    def __init__(self, stage1_model_path=None, stage2_model_path=None, backend=BACKEND, num_threads=None,
+                 instrumentation=None, stage1_tiling=STAGE1_TILING, stage2_calibration_path=STAGE2_CALIBRATION_PATH):
+        default_stage1_path, default_stage2_path = DEFAULT_MODEL_PATHS[backend]
+        self.backend = backend
+        self.num_threads = num_threads
+        self.stage1_model_path = stage1_model_path or default_stage1_path
+        self.stage2_model_path = stage2_model_path or default_stage2_path
+        self._stage1_backend = None
+        self._stage2_backend = None
+        self._load_lock = threading.Lock()
+        # Ultralytics predictors are not thread-safe, so Stage 1 calls from concurrent threads are serialized
+        self._stage1_lock = threading.Lock()
+        self.cold_start_seconds = {}
+        self.instrumentation = instrumentation or DISABLED_INSTRUMENTATION
+        self.stage1_tiling = stage1_tiling
+        self.stage2_calibration = load_calibration(stage2_calibration_path)
+
+    # ---- Lazy model loading ----
+    @property
+    def stage1_backend(self):
+        if self._stage1_backend is None:
+            with self._load_lock:
+                if self._stage1_backend is None:
+                    print(f"Loading Stage 1 YOLOv8 model ({self.backend}) from: {self.stage1_model_path}")
+                    start = time.perf_counter()
+                    try:
+                        self._stage1_backend = create_stage1_backend(self.backend, self.stage1_model_path,
+                                                                     self.num_threads)
+                    except Exception as e:
+                        raise RuntimeError(f"Error loading Stage 1 model: {e}") from e
+                    self.cold_start_seconds['stage1_load'] = time.perf_counter() - start
+                    print("Stage 1 YOLOv8 model loaded successfully.")
+        return self._stage1_backend
+
+    @property
+    def stage2_backend(self):
+        if self._stage2_backend is None:
+            with self._load_lock:
+                if self._stage2_backend is None:
+                    print(f"Loading Stage 2 CNN Occupancy model ({self.backend}) from: {self.stage2_model_path}")
+                    start = time.perf_counter()
+                    try:
+                        self._stage2_backend = create_stage2_backend(self.backend, self.stage2_model_path,
+                                                                     self.num_threads)
+                    except Exception as e:
+                        raise RuntimeError(f"Error loading Stage 2 model: {e}") from e
+                    self.cold_start_seconds['stage2_load'] = time.perf_counter() - start
+                    print("Stage 2 CNN Occupancy model loaded successfully.")
+        return self._stage2_backend
+
+    def is_loaded(self):
+        return self._stage1_backend is not None and self._stage2_backend is not None
+
+    def warm_up(self):
+        """
+        Loads both stages and runs each once on dummy input so the first real frame
+        does not pay graph building / allocator start-up costs.
+        """
+        dummy_frame = np.zeros((WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3), dtype=np.uint8)
+        # Warm-up calls are kept out of the stage metrics
+        instrumentation, self.instrumentation = self.instrumentation, DISABLED_INSTRUMENTATION
+        try:
+            self.stage1_backend  # Loads the model outside the timed region
+            start = time.perf_counter()
+            self.run_stage1_detection(dummy_frame)
+            self.cold_start_seconds['stage1_warmup'] = time.perf_counter() - start
+
+            dummy_crops = [np.zeros((STAGE2_IMG_HEIGHT, STAGE2_IMG_WIDTH, 3), dtype=np.uint8)]
+            self.stage2_backend  # Loads the model outside the timed region
+            start = time.perf_counter()
+            self.classify_slot_crops_batched(dummy_crops)
+            self.cold_start_seconds['stage2_warmup'] = time.perf_counter() - start
+        finally:
+            self.instrumentation = instrumentation
+        return self.cold_start_seconds
+
+    def print_cold_start_report(self):
+        print(f"--- Cold Start ({self.backend} backend) ---")
+        for stage_key in ['stage1_load', 'stage1_warmup', 'stage2_load', 'stage2_warmup']:
+            if stage_key in self.cold_start_seconds:
+                print(f"  {stage_key:<15} {self.cold_start_seconds[stage_key] * 1000:10.1f} ms")
+
+    # ---- Stage 1 ----
+    def uses_tiling(self, original_image):
+        h_img, w_img = original_image.shape[:2]
+        return self.stage1_tiling and max(h_img, w_img) >= STAGE1_TILED_MIN_SIDE and min(h_img, w_img) >= STAGE1_TILE_SIZE
+
+    def detect_stage1_batch(self, images, conf, iou):
+        with self._stage1_lock:
+            return self.stage1_backend.detect_batch(images, conf=conf, iou=iou)
+
+    def stage1_settings_key(self):
+        """
+        The Stage 1 settings that change its boxes besides the model and conf, for the result cache
+        key; None when tiling is off, so untiled cache entries stay valid.
+        """
+        if not self.stage1_tiling:
+            return None
+        return (f"tiled,{STAGE1_TILED_MIN_SIDE},{STAGE1_TILE_SIZE},{STAGE1_TILE_OVERLAP!r},"
+                f"{STAGE1_TILE_FULL_FRAME_PASS},{STAGE1_TILE_MERGE_THRESHOLD!r},{STAGE1_TILE_LAYOUT_MARGIN}")
+
+    def run_stage1_detection(self, original_image, stage1_conf=0.3, layout_boxes=None):
+        """
+        Runs YOLOv8 on one image and returns the slot boxes (xyxy) and their confidences as NumPy arrays.
+        Large frames go through the tiled path when tiling is enabled; `layout_boxes` (a known slot
+        layout for this view) lets it skip tiles without slots.
+        """
+        if self.uses_tiling(original_image):
+            return self.run_stage1_detection_tiled(original_image, stage1_conf=stage1_conf, layout_boxes=layout_boxes)
+        with self.instrumentation.stage('stage1'):
+            return self.detect_stage1_batch([original_image], conf=stage1_conf, iou=0.5)[0]
+
+    def run_stage1_detection_tiled(self, original_image, stage1_conf=0.3, layout_boxes=None):
+        """
+        Slices the frame into overlapping STAGE1_TILE_SIZE tiles, detects on batches of tiles at full
+        resolution (plus one full-frame pass for large slots), shifts the boxes back to frame coordinates
+        and merges duplicates from overlapping tiles with cross-tile NMS.
+        """
+        h_img, w_img = original_image.shape[:2]
+        tiles = make_tile_grid(h_img, w_img, STAGE1_TILE_SIZE, STAGE1_TILE_OVERLAP)
+        if layout_boxes is not None and len(layout_boxes) > 0:
+            tiles_with_slots = tiles_near_boxes(tiles, layout_boxes, STAGE1_TILE_LAYOUT_MARGIN)
+            self.instrumentation.increment('stage1_tiles_skipped_total', len(tiles) - len(tiles_with_slots))
+            tiles = tiles_with_slots
+        self.instrumentation.observe('stage1_tiles_per_frame', len(tiles))
+
+        all_boxes = []
+        all_confidences = []
+        with self.instrumentation.stage('stage1'):
+            for start in range(0, len(tiles), STAGE1_TILE_BATCH_SIZE):
+                batch_tiles = tiles[start:start + STAGE1_TILE_BATCH_SIZE]
+                tile_images = [np.ascontiguousarray(original_image[y1:y2, x1:x2]) for x1, y1, x2, y2 in batch_tiles]
+                tile_layouts = self.detect_stage1_batch(tile_images, conf=stage1_conf, iou=0.5)
+                for (x1, y1, _, _), (boxes, confidences_s1) in zip(batch_tiles, tile_layouts):
+                    if len(boxes) > 0:
+                        all_boxes.append(boxes + np.array([x1, y1, x1, y1], dtype=np.float32))
+                        all_confidences.append(confidences_s1)
+            if STAGE1_TILE_FULL_FRAME_PASS:
+                boxes, confidences_s1 = self.detect_stage1_batch([original_image], conf=stage1_conf, iou=0.5)[0]
+                if len(boxes) > 0:
+                    all_boxes.append(boxes)
+                    all_confidences.append(confidences_s1)
+
+        if not all_boxes:
+            return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+        with self.instrumentation.stage('stage1_tile_merge'):
+            boxes = np.concatenate(all_boxes).astype(np.float32)
+            confidences_s1 = np.concatenate(all_confidences).astype(np.float32)
+            keep = non_max_suppression(boxes, confidences_s1, STAGE1_TILE_MERGE_THRESHOLD, match_metric='ios')
+        return boxes[keep], confidences_s1[keep]
+
+    def run_stage1_detection_batch(self, images, stage1_conf=0.3):
+        """
+        Runs YOLOv8 on a list of images and returns one (boxes, confidences) pair per image, in input order.
+        Images are grouped by shape so each group is letterboxed exactly as a single-image call would be,
+        which keeps the detections identical to run_stage1_detection.
+        """
+        layouts = [None] * len(images)
+        indices_by_shape = {}
+        for i, image in enumerate(images):
+            if self.uses_tiling(image):
+                # Tiled frames already batch their own tiles
+                layouts[i] = self.run_stage1_detection_tiled(image, stage1_conf=stage1_conf)
+                continue
+            indices_by_shape.setdefault(image.shape, []).append(i)
+
+        for indices in indices_by_shape.values():
+            self.instrumentation.observe('stage1_batch_size', len(indices))
+            with self.instrumentation.stage('stage1'):
+                group_layouts = self.detect_stage1_batch([images[i] for i in indices], conf=stage1_conf,
+                                                         iou=0.5)
+            for i, layout in zip(indices, group_layouts):
+                layouts[i] = layout
+        return layouts
+
+    # ---- Stage 2 ----
+    def classify_slot_crops_batched(self, slot_crops, max_batch_size=None):
+        """
+        Runs the Stage 2 classifier on all crops of a frame with one call per chunk
+        of at most `max_batch_size` crops. Returns the raw occupied scores in input order.
+        """
+        if max_batch_size is None:
+            max_batch_size = STAGE2_MAX_BATCH_SIZE
+        scores = np.empty(len(slot_crops), dtype=np.float32)
+        if not slot_crops:
+            return scores
+
+        instrumentation = self.instrumentation
+        with instrumentation.stage('stage2_resize'):
+            batch = prepare_stage2_batch(slot_crops)
+        for start in range(0, len(batch), max_batch_size):
+            end = start + max_batch_size
+            instrumentation.observe('stage2_batch_size', len(batch[start:end]))
+            with instrumentation.stage('stage2'):
+                scores[start:end] = self.stage2_backend.predict_scores(batch[start:end])
+        return apply_calibration(scores, self.stage2_calibration)
 
-    return output_visualization_image, detected_slots_info, occupied_count_viz, empty_count_viz
+    def classify_detected_slots(self, original_image, boxes, stage2_occupied_threshold=0.7,
+                                stage2_max_batch_size=None, slot_status_cache=None, confidences=None):
+        """
+        Crops every Stage 1 box and classifies all crops in one batched call
+        (only the crops that changed since the last frame when a slot status cache is given).
+        Returns the detected_slots_info list; pass the Stage 1 `confidences` to have them included.
+        """
+        if len(boxes) == 0:
+            return []
+
+        with self.instrumentation.stage('crop'):
+            slot_boxes, slot_crops, kept_indices = extract_slot_crops(original_image, boxes, return_indices=True)
+        if slot_status_cache is not None:
+            predictions_s2 = slot_status_cache.classify(
+                slot_boxes, slot_crops,
+                lambda crops: self.classify_slot_crops_batched(crops, max_batch_size=stage2_max_batch_size))
+            self.instrumentation.increment('slot_status_cache_hits_total', slot_status_cache.last_reused_count)
+            self.instrumentation.increment('slot_status_cache_misses_total',
+                                           slot_status_cache.last_reclassified_count)
+        else:
+            predictions_s2 = self.classify_slot_crops_batched(slot_crops, max_batch_size=stage2_max_batch_size)
+        slot_confidences = [confidences[i] for i in kept_indices] if confidences is not None else None
+        return scores_to_slots_info(slot_boxes, predictions_s2, stage2_occupied_threshold, slot_confidences)
+
+    def classify_detected_slots_batch(self, images, boxes_per_image, stage2_occupied_threshold=0.7,
+                                      stage2_max_batch_size=None, confidences_per_image=None):
+        """
+        Classifies the slots of several images together: crops from all images are
+        sent through Stage 2 as one stream of batches and mapped back to their image.
+        Returns one detected_slots_info list per image.
+        """
+        all_slot_boxes = []
+        all_slot_crops = []
+        all_slot_confidences = [] if confidences_per_image is not None else None
+        crop_counts = []
+        for image_index, (original_image, boxes) in enumerate(zip(images, boxes_per_image)):
+            with self.instrumentation.stage('crop'):
+                slot_boxes, slot_crops, kept_indices = extract_slot_crops(original_image, boxes, return_indices=True)
+            all_slot_boxes.extend(slot_boxes)
+            all_slot_crops.extend(slot_crops)
+            if all_slot_confidences is not None:
+                all_slot_confidences.extend(confidences_per_image[image_index][i] for i in kept_indices)
+            crop_counts.append(len(slot_crops))
+
+        predictions_s2 = self.classify_slot_crops_batched(all_slot_crops, max_batch_size=stage2_max_batch_size)
+
+        detected_slots_info_per_image = []
+        start = 0
+        for crop_count in crop_counts:
+            detected_slots_info_per_image.append(scores_to_slots_info(
+                all_slot_boxes[start:start + crop_count], predictions_s2[start:start + crop_count],
+                stage2_occupied_threshold,
+                all_slot_confidences[start:start + crop_count] if all_slot_confidences is not None else None))
+            start += crop_count
+        return detected_slots_info_per_image
+
+    # ---- Full pipeline ----
+    def predict(self, image_path_or_cv2_image, stage1_conf=0.3, stage2_occupied_threshold=0.7,
+                stage2_max_batch_size=None, layout_cache=None, slot_status_cache=None, render=True,
+                result_cache=None, slot_registry=None):
+        """
+        Runs both stages on one image. With `render=False` the overlay is skipped and the
+        first returned value is the undrawn image, so the caller can render it later (or never).
+        An array input is only copied when the overlay is drawn; otherwise the caller's array
+        (e.g. a shared-memory frame view from frame_ring.py) is read in place and returned as is.
+        With a `result_cache` (see result_cache.py) an image seen before with the same models
+        and thresholds returns its stored slots without running either model.
+        With a `slot_registry` (see slot_registry.py, one per camera) every slot gets a persistent
+        'slot_id' and its status is smoothed across frames before counting and drawing.
+        """
+        frame_name = image_path_or_cv2_image if isinstance(image_path_or_cv2_image, str) else 'frame'
+        with self.instrumentation.frame(frame_name):
+            original_image, detected_slots_info = self._predict(
+                image_path_or_cv2_image, stage1_conf, stage2_occupied_threshold, stage2_max_batch_size,
+                layout_cache, slot_status_cache, result_cache, copy_input=render)
+            if original_image is None:
+                return None, None, 0, 0
+            if slot_registry is not None:
+                with self.instrumentation.stage('slot_registry'):
+                    slot_registry.update(detected_slots_info, stage2_occupied_threshold)
+            return self._finish_prediction(original_image, detected_slots_info, render)
+
+    def result_cache_lookup(self, result_cache, image_bytes, stage1_conf, stage2_occupied_threshold):
+        """
+        Returns (cache_key, models_key, cached detected_slots_info or None).
+        """
+        models_key = result_cache.models_key(self.stage1_model_path, self.stage2_model_path, self.backend,
+                                             calibration=self.stage2_calibration,
+                                             stage1_settings=self.stage1_settings_key())
+        cache_key = result_cache.make_key(image_bytes, models_key, stage1_conf, stage2_occupied_threshold)
+        cached_slots_info = result_cache.get(cache_key)
+        self.instrumentation.increment('result_cache_hits_total' if cached_slots_info is not None
+                                       else 'result_cache_misses_total')
+        return cache_key, models_key, cached_slots_info
+
+    def _predict(self, image_path_or_cv2_image, stage1_conf, stage2_occupied_threshold,
+                 stage2_max_batch_size, layout_cache, slot_status_cache, result_cache, copy_input=True):
+        """
+        Returns (original image, detected_slots_info), or (None, None) if unreadable. The image is
+        owned by the caller unless an array was passed with `copy_input=False` (it is then that array).
+        """
+        instrumentation = self.instrumentation
+        cached_slots_info = None
+        # Handle input type (path or cv2 image)
+        if isinstance(image_path_or_cv2_image, str):
+            with instrumentation.stage('decode'):
+                original_image = cv2.imread(image_path_or_cv2_image)
+            if original_image is None:
+                print(f"Error: Could not read image from {image_path_or_cv2_image}")
+                return None, None
+            if result_cache is not None:
+                with open(image_path_or_cv2_image, 'rb') as f:
+                    cache_key, models_key, cached_slots_info = self.result_cache_lookup(
+                        result_cache, f.read(), stage1_conf, stage2_occupied_threshold)
+        else:
+            # Crops are views of the frame, so only drawing the overlay needs a private copy
+            original_image = image_path_or_cv2_image.copy() if copy_input else image_path_or_cv2_image
+            if result_cache is not None:
+                image_bytes = str(original_image.shape).encode('utf-8') + original_image.tobytes()
+                cache_key, models_key, cached_slots_info = self.result_cache_lookup(
+                    result_cache, image_bytes, stage1_conf, stage2_occupied_threshold)
+
+        if cached_slots_info is not None:
+            return original_image, cached_slots_info
+
+        # Run YOLOv8 detection (or reuse the cached layout for static cameras)
+        if layout_cache is not None:
+            detections_before = layout_cache.detections_run
+            boxes, confidences_s1 = layout_cache.get_layout(
+                original_image, lambda image: self.run_stage1_detection(image, stage1_conf=stage1_conf,
+                                                                        layout_boxes=layout_cache.known_layout()))
+            layout_cache_hit = layout_cache.detections_run == detections_before
+            instrumentation.increment('layout_cache_hits_total' if layout_cache_hit else 'layout_cache_misses_total')
+        else:
+            boxes, confidences_s1 = self.run_stage1_detection(original_image, stage1_conf=stage1_conf)
+
+        if len(boxes) == 0:
+            print("  Stage 1: No slots detected for this image.")
+
+        # Classify every detected slot
+        detected_slots_info = self.classify_detected_slots(
+            original_image, boxes,
+            stage2_occupied_threshold=stage2_occupied_threshold,
+            stage2_max_batch_size=stage2_max_batch_size,
+            slot_status_cache=slot_status_cache,
+            confidences=confidences_s1
+        )
+        if result_cache is not None:
+            result_cache.put(cache_key, models_key, detected_slots_info)
+        return original_image, detected_slots_info
+
+    def _finish_prediction(self, original_image, detected_slots_info, render):
+        """
+        Counts the statuses and (if `render`) draws the overlay onto `original_image`, which must be owned by the caller.
+        """
+        occupied_count_viz, empty_count_viz = count_slot_statuses(detected_slots_info)
+        self.instrumentation.observe('slots_per_frame', len(detected_slots_info))
+        if render:
+            # Draw markers and summary text
+            with self.instrumentation.stage('draw'):
+                draw_occupancy_overlay(original_image, detected_slots_info)
+        return original_image, detected_slots_info, occupied_count_viz, empty_count_viz
+
+    def predict_batch(self, image_paths, stage1_conf=0.3, stage2_occupied_threshold=0.7, stage2_max_batch_size=None,
+                      render=True, result_cache=None):
+        """
+        Batched counterpart of predict for directory runs: Stage 1 runs once per group
+        of same-sized images and Stage 2 once over all crops of the batch. Returns one
+        (visualization, detected_slots_info, occupied, empty) tuple per path, with
+        (None, None, 0, 0) for unreadable images. With `render=False` the visualization
+        is the undrawn image. Images found in `result_cache` skip both models.
+        """
+        instrumentation = self.instrumentation
+        results = [(None, None, 0, 0)] * len(image_paths)
+        images = []
+        readable_indices = []
+        cache_entries = []
+        for i, image_path in enumerate(image_paths):
+            with instrumentation.stage('decode'):
+                original_image = cv2.imread(image_path)
+            if original_image is None:
+                print(f"Error: Could not read image from {image_path}")
+                continue
+            if result_cache is not None:
+                with open(image_path, 'rb') as f:
+                    cache_key, models_key, cached_slots_info = self.result_cache_lookup(
+                        result_cache, f.read(), stage1_conf, stage2_occupied_threshold)
+                if cached_slots_info is not None:
+                    instrumentation.increment('frames_total')
+                    results[i] = self._finish_prediction(original_image, cached_slots_info, render)
+                    continue
+                cache_entries.append((cache_key, models_key))
+            images.append(original_image)
+            readable_indices.append(i)
+
+        if not images:
+            return results
+
+        layouts = self.run_stage1_detection_batch(images, stage1_conf=stage1_conf)
+        detected_slots_info_per_image = self.classify_detected_slots_batch(
+            images, [boxes for boxes, _ in layouts],
+            stage2_occupied_threshold=stage2_occupied_threshold,
+            stage2_max_batch_size=stage2_max_batch_size,
+            confidences_per_image=[confidences_s1 for _, confidences_s1 in layouts]
+        )
+
+        for j, (i, original_image, detected_slots_info) in enumerate(
+                zip(readable_indices, images, detected_slots_info_per_image)):
+            if not detected_slots_info:
+                print(f"  Stage 1: No slots detected for {image_paths[i]}.")
+            if result_cache is not None:
+                result_cache.put(cache_entries[j][0], cache_entries[j][1], detected_slots_info)
+            instrumentation.increment('frames_total')
+            # Each image was read for this batch only, so it can be drawn on directly
+            results[i] = self._finish_prediction(original_image, detected_slots_info, render)
+        return results
+
+# ---------------------- DEFAULT PIPELINE ------------------------
+# Module-level functions below keep the original script API; they share one lazily loaded pipeline.
+_default_pipeline = None
+
+def get_default_pipeline():
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = ParkingPipeline()
+    return _default_pipeline
+
+def run_stage1_detection(original_image, stage1_conf=0.3):
+    return get_default_pipeline().run_stage1_detection(original_image, stage1_conf=stage1_conf)
+
+def run_stage1_detection_batch(images, stage1_conf=0.3):
+    return get_default_pipeline().run_stage1_detection_batch(images, stage1_conf=stage1_conf)
+
+def classify_slot_crops_batched(slot_crops, max_batch_size=None):
+    return get_default_pipeline().classify_slot_crops_batched(slot_crops, max_batch_size=max_batch_size)
+
+def classify_detected_slots(original_image, boxes, stage2_occupied_threshold=0.7,
+                            stage2_max_batch_size=None, slot_status_cache=None, confidences=None):
+    return get_default_pipeline().classify_detected_slots(
+        original_image, boxes, stage2_occupied_threshold=stage2_occupied_threshold,
+        stage2_max_batch_size=stage2_max_batch_size, slot_status_cache=slot_status_cache, confidences=confidences)
+
+def classify_detected_slots_batch(images, boxes_per_image, stage2_occupied_threshold=0.7, stage2_max_batch_size=None,
+                                  confidences_per_image=None):
+    return get_default_pipeline().classify_detected_slots_batch(
+        images, boxes_per_image, stage2_occupied_threshold=stage2_occupied_threshold,
+        stage2_max_batch_size=stage2_max_batch_size, confidences_per_image=confidences_per_image)
+
+# ---------------------- MAIN INFERENCE FUNCTION ------------------------
+def predict_parking_occupancy_creative(image_path_or_cv2_image, stage1_conf=0.3, stage2_occupied_threshold=0.7,
+                                       stage2_max_batch_size=None, layout_cache=None, slot_status_cache=None,
+                                       render=True, result_cache=None, slot_registry=None):
+    return get_default_pipeline().predict(
+        image_path_or_cv2_image, stage1_conf=stage1_conf, stage2_occupied_threshold=stage2_occupied_threshold,
+        stage2_max_batch_size=stage2_max_batch_size, layout_cache=layout_cache, slot_status_cache=slot_status_cache,
+        render=render, result_cache=result_cache, slot_registry=slot_registry)
+
+def predict_parking_occupancy_batch(image_paths, stage1_conf=0.3, stage2_occupied_threshold=0.7,
+                                    stage2_max_batch_size=None, render=True, result_cache=None):
+    return get_default_pipeline().predict_batch(
+        image_paths, stage1_conf=stage1_conf, stage2_occupied_threshold=stage2_occupied_threshold,
+        stage2_max_batch_size=stage2_max_batch_size, render=render, result_cache=result_cache)
 
 # ---------------------- MAIN SCRIPT ------------------------
 if __name__ == '__main__':
+    # Imported here because result_sinks.py imports this module (count_slot_statuses)
+    from result_sinks import create_sink
+
     if not os.path.isdir(INPUT_TEST_IMAGES_DIR) or not os.listdir(INPUT_TEST_IMAGES_DIR):
         print(f"Error: Test images directory '{INPUT_TEST_IMAGES_DIR}' not found or is empty.")
     else:
-        print(f"Processing images from: {INPUT_TEST_IMAGES_DIR}")
-        all_images_summary_for_csv = []
+        # Create output directories if not exist
+        os.makedirs(OUTPUT_VISUALIZATION_DIR, exist_ok=True)
+        os.makedirs(OUTPUT_CSV_DIR, exist_ok=True)
+
+        # Load and warm up both stages up front so model errors surface before any work
+        pipeline = get_default_pipeline()
+        if INSTRUMENTATION_ENABLED:
+            pipeline.instrumentation = Instrumentation(trace=TRACE_ENABLED)
+        try:
+            pipeline.warm_up()
+        except RuntimeError as e:
+            print(e)
+            exit()
+        pipeline.print_cold_start_report()
+
+        print(f"Processing images from: {INPUT_TEST_IMAGES_DIR} (Stage 1 batch size: {STAGE1_BATCH_SIZE})")
+        # Results are streamed to the sinks as each batch finishes, so a crash keeps everything written so far
+        try:
+            result_sink = create_sink(OUTPUT_SINKS, OUTPUT_SUMMARY_CSV_PATH, OUTPUT_SQLITE_PATH, OUTPUT_PARQUET_DIR,
+                                      OUTPUT_TIMESERIES_PATH)
+        except RuntimeError as e:
+            print(e)
+            exit()
+        images_processed = 0
+        # Overlays and JPEG writes run on background threads so they never delay the next batch
+        image_writer = BackgroundImageWriter(instrumentation=pipeline.instrumentation)
+        result_cache = ResultCache(RESULT_CACHE_PATH) if RESULT_CACHE_ENABLED else None
 
+        image_filenames = []
         for image_filename_with_ext in os.listdir(INPUT_TEST_IMAGES_DIR):
             if image_filename_with_ext.lower().endswith(('.png', '.jpg', '.jpeg')):
-                test_image_full_path = os.path.join(INPUT_TEST_IMAGES_DIR, image_filename_with_ext)
-                print(f"\n--- Processing: {test_image_full_path} ---")
+                image_filenames.append(image_filename_with_ext)
+            else:
+                print(f"Skipping non-image file: {image_filename_with_ext}")
+        # File times are the frame timestamps for the sinks, so the occupancy store sees them in time order
+        image_filenames.sort(key=lambda f: (os.path.getmtime(os.path.join(INPUT_TEST_IMAGES_DIR, f)), f))
 
-                base_name = os.path.splitext(image_filename_with_ext)[0]
-                output_viz_filename = f"{base_name}_creative_occupancy.jpg"
+        for batch_start in range(0, len(image_filenames), STAGE1_BATCH_SIZE):
+            batch_filenames = image_filenames[batch_start:batch_start + STAGE1_BATCH_SIZE]
+            batch_paths = [os.path.join(INPUT_TEST_IMAGES_DIR, f) for f in batch_filenames]
+            print(f"\n--- Processing batch of {len(batch_paths)}: {', '.join(batch_filenames)} ---")
 
-                result_image, slots_details, occupied_final, empty_final = predict_parking_occupancy_creative(
-                    test_image_full_path,
+            with pipeline.instrumentation.stage('batch'):
+                batch_results = pipeline.predict_batch(
+                    batch_paths,
                     stage1_conf=0.2,
-                    stage2_occupied_threshold=0.9
+                    stage2_occupied_threshold=0.9,
+                    render=False,
+                    result_cache=result_cache
                 )
 
+            for image_filename_with_ext, image_path, batch_result in zip(batch_filenames, batch_paths, batch_results):
+                result_image, slots_details, occupied_final, empty_final = batch_result
+                base_name = os.path.splitext(image_filename_with_ext)[0]
+                output_viz_filename = f"{base_name}_creative_occupancy.jpg"
+
                 if result_image is not None:
-                    viz_save_path = os.path.join(OUTPUT_VISUALIZATION_DIR, output_viz_filename)
-                    cv2.imwrite(viz_save_path, result_image)
-                    print(f"  Output visualization saved to: {viz_save_path}")
-
-                    all_images_summary_for_csv.append({
-                        'Image Name': image_filename_with_ext,
-                        'Total Detected Slots': occupied_final + empty_final,
-                        'Occupied Slots': occupied_final,
-                        'Available Slots': empty_final
-                    })
-            else:
-                print(f"Skipping non-image file: {image_filename_with_ext}")
+                    if should_render(RENDER_MODE, images_processed, RENDER_EVERY_N_FRAMES):
+                        viz_save_path = os.path.join(OUTPUT_VISUALIZATION_DIR, output_viz_filename)
+                        # The undrawn image belongs to this result, so the writer may draw on it in place
+                        image_writer.submit(draw_occupancy_overlay, result_image, (slots_details,), viz_save_path)
+                        print(f"  Output visualization queued: {viz_save_path}")
 
-        if all_images_summary_for_csv:
-            overall_csv_path = os.path.join(OUTPUT_CSV_DIR, "all_images_parking_summary_creative.csv")
-            fieldnames = ['Image Name', 'Total Detected Slots', 'Occupied Slots', 'Available Slots']
-            with open(overall_csv_path, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(all_images_summary_for_csv)
-            print(f"\nOverall summary saved to: {overall_csv_path}")
+                    with pipeline.instrumentation.stage('sink_write'):
+                        result_sink.write_frame({'frame_name': image_filename_with_ext, 'camera_id': None,
+                                                 'timestamp': os.path.getmtime(image_path)}, slots_details)
+                    images_processed += 1
+
+        image_writer.close()
+        result_sink.close()
+        if result_cache is not None:
+            result_cache.print_summary()
+            result_cache.close()
+        if image_writer.written or image_writer.failed:
+            print(f"\nVisualizations written: {image_writer.written} (failed: {image_writer.failed}) "
+                  f"to {OUTPUT_VISUALIZATION_DIR}")
+        if images_processed:
+            print(f"\nResults for {images_processed} images saved to sinks: {', '.join(OUTPUT_SINKS)}")
+            if 'csv' in OUTPUT_SINKS:
+                print(f"Overall summary saved to: {OUTPUT_SUMMARY_CSV_PATH}")
         else:
             print("\nNo images were processed to create an overall summary.")
 
+        if pipeline.instrumentation.enabled:
+            pipeline.instrumentation.print_summary()
+            pipeline.instrumentation.write_prometheus(METRICS_OUTPUT_PATH)
+            print(f"Metrics saved to: {METRICS_OUTPUT_PATH}")
+            if pipeline.instrumentation.trace:
+                pipeline.instrumentation.write_trace(TRACE_OUTPUT_PATH)
+                print(f"Per-frame trace saved to: {TRACE_OUTPUT_PATH}")
+
         print("\nAll specified test images processed.")
@@ -0,0 +1,165 @@
+import cv2
+import numpy as np
+
+# NOTE: every framework (Ultralytics/PyTorch, TensorFlow, ONNX Runtime) is imported inside the
+# backend that needs it, so a process only pays for the runtimes its backends actually use.
+
+# ---------------------- CONFIG ------------------------
+STAGE1_ONNX_IMGSZ = 640        # Used when the exported Stage 1 graph has dynamic spatial dims
+STAGE1_MAX_DETECTIONS = 300    # Same cap as Ultralytics' default max_det
+LETTERBOX_PAD_VALUE = 114
+
+# ---------------------- STAGE 1 BACKENDS ------------------------
+def stage1_result_to_arrays(stage1_result):
+    if stage1_result.boxes and len(stage1_result.boxes) > 0:
+        boxes = stage1_result.boxes.xyxy.cpu().numpy()
+        confidences_s1 = stage1_result.boxes.conf.cpu().numpy()
+        return boxes, confidences_s1
+    return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+
+class UltralyticsStage1Backend:
+    """
+    YOLOv8 through Ultralytics (PyTorch for .pt weights). Returns (boxes_xyxy, confidences) per image.
+    """
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+
+    def detect_batch(self, images, conf, iou):
+        stage1_results = self.model.predict(images if len(images) > 1 else images[0], conf=conf, iou=iou,
+                                            verbose=False)
+        return [stage1_result_to_arrays(stage1_result) for stage1_result in stage1_results]
+
+def letterbox(image, new_size):
+    """
+    Resizes and pads an image to new_size x new_size the same way Ultralytics does for
+    fixed-size inputs. Returns the padded image, the scale gain and the (left, top) padding.
+    """
+    h_img, w_img = image.shape[:2]
+    gain = min(new_size / h_img, new_size / w_img)
+    new_unpad_w, new_unpad_h = int(round(w_img * gain)), int(round(h_img * gain))
+    pad_w, pad_h = (new_size - new_unpad_w) / 2, (new_size - new_unpad_h) / 2
+
+    if (w_img, h_img) != (new_unpad_w, new_unpad_h):
+        image = cv2.resize(image, (new_unpad_w, new_unpad_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                value=(LETTERBOX_PAD_VALUE, LETTERBOX_PAD_VALUE, LETTERBOX_PAD_VALUE))
+    return padded, gain, (left, top)
+
+def preprocess_stage1_images(images, imgsz):
+    """
+    Letterboxes BGR images into one (N, 3, imgsz, imgsz) float32 RGB tensor in [0, 1].
+    """
+    batch = np.empty((len(images), 3, imgsz, imgsz), dtype=np.float32)
+    letterbox_params = []
+    for i, image in enumerate(images):
+        padded, gain, pad = letterbox(image, imgsz)
+        batch[i] = padded[:, :, ::-1].transpose(2, 0, 1)
+        letterbox_params.append((gain, pad, image.shape[:2]))
+    batch /= 255.0
+    return batch, letterbox_params
+
+def decode_yolov8_output(prediction, conf, iou, gain, pad, image_shape, max_detections=STAGE1_MAX_DETECTIONS):
+    """
+    Turns one raw YOLOv8 output of shape (4 + num_classes, num_anchors) into NMS-filtered
+    xyxy boxes and confidences in original image coordinates.
+    """
+    prediction = prediction.T
+    scores = prediction[:, 4:].max(axis=1)
+    keep = scores > conf
+    if not np.any(keep):
+        return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+    boxes_cxcywh = prediction[keep, :4]
+    scores = scores[keep]
+
+    boxes_xywh = boxes_cxcywh.copy()
+    boxes_xywh[:, 0] -= boxes_cxcywh[:, 2] / 2
+    boxes_xywh[:, 1] -= boxes_cxcywh[:, 3] / 2
+    kept_indices = cv2.dnn.NMSBoxes(boxes_xywh.tolist(), scores.tolist(), conf, iou)
+    kept_indices = np.asarray(kept_indices, dtype=np.int64).reshape(-1)[:max_detections]
+
+    boxes = boxes_xywh[kept_indices]
+    boxes_xyxy = np.empty_like(boxes)
+    boxes_xyxy[:, 0] = (boxes[:, 0] - pad[0]) / gain
+    boxes_xyxy[:, 1] = (boxes[:, 1] - pad[1]) / gain
+    boxes_xyxy[:, 2] = (boxes[:, 0] + boxes[:, 2] - pad[0]) / gain
+    boxes_xyxy[:, 3] = (boxes[:, 1] + boxes[:, 3] - pad[1]) / gain
+    h_img, w_img = image_shape
+    boxes_xyxy[:, [0, 2]] = boxes_xyxy[:, [0, 2]].clip(0, w_img)
+    boxes_xyxy[:, [1, 3]] = boxes_xyxy[:, [1, 3]].clip(0, h_img)
+    return boxes_xyxy.astype(np.float32), scores[kept_indices].astype(np.float32)
+
+def create_onnx_session(model_path, num_threads=None):
+    import onnxruntime as ort
+    session_options = ort.SessionOptions()
+    session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        session_options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(model_path, sess_options=session_options, providers=['CPUExecutionProvider'])
+
+class OnnxStage1Backend:
+    """
+    YOLOv8 exported to ONNX (fp32 or INT8), run on ONNX Runtime with NumPy/OpenCV pre- and post-processing.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.session = create_onnx_session(model_path, num_threads)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.imgsz = model_input.shape[2] if isinstance(model_input.shape[2], int) else STAGE1_ONNX_IMGSZ
+        self.supports_batching = not isinstance(model_input.shape[0], int) or model_input.shape[0] > 1
+
+    def detect_batch(self, images, conf, iou):
+        batch, letterbox_params = preprocess_stage1_images(images, self.imgsz)
+        if self.supports_batching:
+            predictions = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            predictions = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0]
+                                          for i in range(len(batch))])
+        return [decode_yolov8_output(prediction, conf, iou, gain, pad, image_shape)
+                for prediction, (gain, pad, image_shape) in zip(predictions, letterbox_params)]
+
+# ---------------------- STAGE 2 BACKENDS ------------------------
+class KerasStage2Backend:
+    """
+    The original TensorFlow/Keras occupancy classifier (.h5).
+    """
+
+    def __init__(self, model_path):
+        from tensorflow.keras.models import load_model
+        self.model = load_model(model_path)
+
+    def predict_scores(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))[:, 0]
+
+class OnnxStage2Backend:
+    """
+    The occupancy classifier exported to ONNX (fp32 or INT8), run on ONNX Runtime.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        self.session = create_onnx_session(model_path, num_threads)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_scores(self, batch):
+        return np.asarray(self.session.run(None, {self.input_name: batch})[0])[:, 0]
+
+# ---------------------- FACTORY ------------------------
+BACKENDS = ['native', 'onnx']
+
+def create_stage1_backend(backend, model_path, num_threads=None):
+    if backend == 'native':
+        return UltralyticsStage1Backend(model_path)
+    if backend == 'onnx':
+        return OnnxStage1Backend(model_path, num_threads)
+    raise ValueError(f"Unknown Stage 1 backend '{backend}', expected one of {BACKENDS}")
+
+def create_stage2_backend(backend, model_path, num_threads=None):
+    if backend == 'native':
+        return KerasStage2Backend(model_path)
+    if backend == 'onnx':
+        return OnnxStage2Backend(model_path, num_threads)
+    raise ValueError(f"Unknown Stage 2 backend '{backend}', expected one of {BACKENDS}")
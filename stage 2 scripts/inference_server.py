@@ -0,0 +1,259 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import cv2
+import numpy as np
+
+from inference import ParkingPipeline, extract_slot_crops, scores_to_slots_info, count_slot_statuses
+from instrumentation import Instrumentation
+
+# ---------------------- CONFIG ------------------------
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+MICRO_BATCH_MAX_SIZE = 128       # Crops gathered from concurrent requests before a Stage 2 call is forced
+MICRO_BATCH_MAX_WAIT_MS = 10.0   # Max time the first waiting request is held to let others join its batch
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+# ---------------------- STAGE 2 MICRO-BATCHING ------------------------
+class Stage2MicroBatcher:
+    """
+    Gathers slot crops from concurrent requests into shared Stage 2 batches.
+
+    A single worker thread takes the first waiting request, keeps collecting
+    requests until `max_batch_size` crops are queued or `max_wait_ms` has passed
+    since it started, then classifies all crops in one call and hands every
+    request its own slice of the scores.
+    """
+
+    def __init__(self, pipeline, max_batch_size=MICRO_BATCH_MAX_SIZE, max_wait_ms=MICRO_BATCH_MAX_WAIT_MS):
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.pending_requests = queue.Queue()
+        self.stats_lock = threading.Lock()
+        self.crops_per_batch_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + ['+Inf']}
+        self.requests_per_batch_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + ['+Inf']}
+        self.batches_run = 0
+        self.worker = threading.Thread(target=self.run, name='stage2-batcher', daemon=True)
+        self.worker.start()
+
+    def queue_depth(self):
+        return self.pending_requests.qsize()
+
+    def submit(self, slot_crops):
+        """
+        Blocks until the crops have been classified as part of a shared batch and returns their scores.
+        """
+        if not slot_crops:
+            return np.empty(0, dtype=np.float32)
+        pending = {'crops': slot_crops, 'done': threading.Event(), 'scores': None, 'error': None}
+        self.pending_requests.put(pending)
+        pending['done'].wait()
+        if pending['error'] is not None:
+            raise pending['error']
+        return pending['scores']
+
+    def record_batch(self, num_crops, num_requests):
+        with self.stats_lock:
+            self.batches_run += 1
+            for histogram, value in [(self.crops_per_batch_histogram, num_crops),
+                                     (self.requests_per_batch_histogram, num_requests)]:
+                bucket = next((b for b in BATCH_SIZE_BUCKETS if value <= b), '+Inf')
+                histogram[bucket] += 1
+
+    def run(self):
+        while True:
+            batch = [self.pending_requests.get()]
+            num_crops = len(batch[0]['crops'])
+            deadline = time.perf_counter() + self.max_wait_s
+            while num_crops < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self.pending_requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(pending)
+                num_crops += len(pending['crops'])
+
+            all_crops = [crop for pending in batch for crop in pending['crops']]
+            try:
+                scores = self.pipeline.classify_slot_crops_batched(all_crops, max_batch_size=self.max_batch_size)
+                start = 0
+                for pending in batch:
+                    pending['scores'] = scores[start:start + len(pending['crops'])]
+                    start += len(pending['crops'])
+            except Exception as e:
+                for pending in batch:
+                    pending['error'] = e
+            self.record_batch(num_crops, len(batch))
+            for pending in batch:
+                pending['done'].set()
+
+# ---------------------- SERVER ------------------------
+class InferenceService:
+    """
+    Shared state of the server: the pipeline, the Stage 2 batcher and request counters.
+    """
+
+    def __init__(self, pipeline, batcher):
+        self.pipeline = pipeline
+        self.batcher = batcher
+        self.stats_lock = threading.Lock()
+        self.in_flight_requests = 0
+        self.requests_served = 0
+        self.requests_failed = 0
+
+    def predict(self, image, stage1_conf, stage2_occupied_threshold):
+        timings_ms = {}
+        start = time.perf_counter()
+        # Concurrent requests are serialized on Stage 1 inside the pipeline
+        boxes, confidences_s1 = self.pipeline.run_stage1_detection(image, stage1_conf=stage1_conf)
+        timings_ms['stage1'] = (time.perf_counter() - start) * 1000.0
+
+        start = time.perf_counter()
+        with self.pipeline.instrumentation.stage('crop'):
+            slot_boxes, slot_crops, kept_indices = extract_slot_crops(image, boxes, return_indices=True)
+        scores = self.batcher.submit(slot_crops)
+        timings_ms['stage2'] = (time.perf_counter() - start) * 1000.0
+
+        detected_slots_info = scores_to_slots_info(slot_boxes, scores, stage2_occupied_threshold,
+                                                   [confidences_s1[i] for i in kept_indices])
+        self.pipeline.instrumentation.increment('frames_total')
+        self.pipeline.instrumentation.observe('slots_per_frame', len(detected_slots_info))
+        occupied_count, empty_count = count_slot_statuses(detected_slots_info)
+        return {
+            'image_size': [int(image.shape[1]), int(image.shape[0])],
+            'slots': detected_slots_info,
+            'total_detected_slots': occupied_count + empty_count,
+            'occupied_slots': occupied_count,
+            'available_slots': empty_count,
+            'timings_ms': timings_ms
+        }
+
+    def metrics(self):
+        with self.stats_lock, self.batcher.stats_lock:
+            return {
+                'in_flight_requests': self.in_flight_requests,
+                'stage2_queue_depth': self.batcher.queue_depth(),
+                'requests_served': self.requests_served,
+                'requests_failed': self.requests_failed,
+                'stage2_batches_run': self.batcher.batches_run,
+                'stage2_crops_per_batch_histogram': {str(k): v for k, v in self.batcher.crops_per_batch_histogram.items()},
+                'stage2_requests_per_batch_histogram': {str(k): v for k, v in self.batcher.requests_per_batch_histogram.items()},
+                'cold_start_seconds': self.pipeline.cold_start_seconds
+            }
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict   body = encoded image bytes (JPEG/PNG); optional ?stage1_conf=&threshold=
+    GET  /metrics   queue depth, batch-size histograms and request counters
+    GET  /metrics/prometheus   per-stage timers and counters in the Prometheus text format
+    GET  /health    liveness and model status
+    """
+    service = None
+
+    def send_json(self, status_code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self.send_json(200, {'status': 'ok', 'models_loaded': self.service.pipeline.is_loaded()})
+        elif path == '/metrics':
+            self.send_json(200, self.service.metrics())
+        elif path == '/metrics/prometheus':
+            body = self.service.pipeline.instrumentation.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_json(404, {'error': f"Unknown path '{path}'"})
+
+    def do_POST(self):
+        parsed_url = urlparse(self.path)
+        if parsed_url.path != '/predict':
+            self.send_json(404, {'error': f"Unknown path '{parsed_url.path}'"})
+            return
+
+        service = self.service
+        with service.stats_lock:
+            service.in_flight_requests += 1
+        try:
+            query = parse_qs(parsed_url.query)
+            stage1_conf = float(query.get('stage1_conf', [STAGE1_CONF])[0])
+            stage2_occupied_threshold = float(query.get('threshold', [STAGE2_OCCUPIED_THRESHOLD])[0])
+
+            content_length = int(self.headers.get('Content-Length', 0))
+            image_bytes = self.rfile.read(content_length)
+            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                with service.stats_lock:
+                    service.requests_failed += 1
+                self.send_json(400, {'error': 'Could not decode image from request body'})
+                return
+
+            start = time.perf_counter()
+            result = service.predict(image, stage1_conf, stage2_occupied_threshold)
+            result['timings_ms']['total'] = (time.perf_counter() - start) * 1000.0
+            with service.stats_lock:
+                service.requests_served += 1
+            self.send_json(200, result)
+        except Exception as e:
+            with service.stats_lock:
+                service.requests_failed += 1
+            self.send_json(500, {'error': str(e)})
+        finally:
+            with service.stats_lock:
+                service.in_flight_requests -= 1
+
+    def log_message(self, format, *args):
+        # Keep the console quiet under load; errors are reported in the JSON responses
+        pass
+
+def run_server(host=SERVER_HOST, port=SERVER_PORT, max_batch_size=MICRO_BATCH_MAX_SIZE,
+               max_wait_ms=MICRO_BATCH_MAX_WAIT_MS, backend='native'):
+    pipeline = ParkingPipeline(backend=backend, instrumentation=Instrumentation())
+    pipeline.warm_up()
+    pipeline.print_cold_start_report()
+
+    InferenceRequestHandler.service = InferenceService(pipeline, Stage2MicroBatcher(pipeline, max_batch_size, max_wait_ms))
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    print(f"Serving parking occupancy inference on http://{host}:{port} "
+          f"(Stage 2 micro-batch: max {max_batch_size} crops / {max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down server.")
+    finally:
+        server.server_close()
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local HTTP server for the two-stage parking pipeline.")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=MICRO_BATCH_MAX_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MICRO_BATCH_MAX_WAIT_MS)
+    parser.add_argument('--backend', default='native', choices=['native', 'onnx'])
+    args = parser.parse_args()
+
+    try:
+        run_server(args.host, args.port, args.max_batch_size, args.max_wait_ms, backend=args.backend)
+    except RuntimeError as e:
+        print(e)
+        exit()
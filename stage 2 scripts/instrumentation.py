@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+
+# ---------------------- CONFIG ------------------------
+METRIC_PREFIX = 'parking'
+DURATION_BUCKETS_SECONDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]
+SIZE_BUCKETS = [0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+MAX_TRACE_EVENTS = 200000  # Oldest events are kept; later ones are counted as dropped
+
+# ---------------------- METRIC TYPES ------------------------
+class Histogram:
+    """
+    Prometheus-style histogram. Counts are kept per bucket and made cumulative on export.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+class _NullTimer:
+    """
+    Shared do-nothing context manager returned while instrumentation is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _StageTimer:
+    __slots__ = ('instrumentation', 'stage_name', 'trace_args', 'start')
+
+    def __init__(self, instrumentation, stage_name, trace_args=None):
+        self.instrumentation = instrumentation
+        self.stage_name = stage_name
+        self.trace_args = trace_args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record_stage(self.stage_name, self.start, time.perf_counter(), self.trace_args)
+        return False
+
+# ---------------------- INSTRUMENTATION ------------------------
+class Instrumentation:
+    """
+    Stage timers, counters and size histograms for the inference hot path.
+
+    While `enabled` is False, `stage()` and `frame()` return one shared no-op context manager and
+    `observe()` / `increment()` return immediately, so leaving the calls in the hot path costs a
+    method call each. When `trace` is True every timed stage is also kept as a Chrome trace event
+    (open the file written by `write_trace()` in chrome://tracing or Perfetto).
+    """
+
+    def __init__(self, enabled=True, trace=False, metric_prefix=METRIC_PREFIX, max_trace_events=MAX_TRACE_EVENTS):
+        self.enabled = enabled
+        self.trace = enabled and trace
+        self.metric_prefix = metric_prefix
+        self.max_trace_events = max_trace_events
+        self.lock = threading.Lock()
+        self.stage_histograms = {}
+        self.size_histograms = {}
+        self.counters = {}
+        self.trace_events = []
+        self.trace_events_dropped = 0
+        self.trace_origin = time.perf_counter()
+        self.thread_state = threading.local()
+
+    # ---- Recording ----
+    def stage(self, stage_name):
+        """
+        Context manager timing one stage, e.g. `with instrumentation.stage('stage1'): ...`.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage_name)
+
+    def frame(self, frame_name):
+        """
+        Context manager around one whole frame. Stages timed inside it on the same thread are
+        tagged with the frame name in the trace.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        self.thread_state.frame_name = frame_name
+        self.increment('frames_total')
+        return _StageTimer(self, 'frame', {'frame': frame_name})
+
+    def record_stage(self, stage_name, start, end, trace_args=None):
+        duration_s = end - start
+        with self.lock:
+            histogram = self.stage_histograms.get(stage_name)
+            if histogram is None:
+                histogram = self.stage_histograms[stage_name] = Histogram(DURATION_BUCKETS_SECONDS)
+            histogram.observe(duration_s)
+
+            if self.trace:
+                if len(self.trace_events) >= self.max_trace_events:
+                    self.trace_events_dropped += 1
+                    return
+                if trace_args is None:
+                    frame_name = getattr(self.thread_state, 'frame_name', None)
+                    trace_args = {'frame': frame_name} if frame_name is not None else {}
+                self.trace_events.append({
+                    'name': stage_name,
+                    'ph': 'X',
+                    'ts': (start - self.trace_origin) * 1e6,
+                    'dur': duration_s * 1e6,
+                    'pid': os.getpid(),
+                    'tid': threading.get_ident(),
+                    'args': trace_args
+                })
+
+    def observe(self, metric_name, value, buckets=SIZE_BUCKETS):
+        """
+        Adds one value (slots per frame, Stage 2 batch size, ...) to a size histogram.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.size_histograms.get(metric_name)
+            if histogram is None:
+                histogram = self.size_histograms[metric_name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, counter_name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + amount
+
+    # ---- Export ----
+    def prometheus_text(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        prefix = self.metric_prefix
+        lines = []
+        with self.lock:
+            if self.stage_histograms:
+                name = f"{prefix}_stage_duration_seconds"
+                lines.append(f"# HELP {name} Wall time spent in each pipeline stage.")
+                lines.append(f"# TYPE {name} histogram")
+                for stage_name, histogram in sorted(self.stage_histograms.items()):
+                    lines.extend(_histogram_lines(name, histogram, f'stage="{stage_name}"'))
+
+            for metric_name, histogram in sorted(self.size_histograms.items()):
+                name = f"{prefix}_{metric_name}"
+                lines.append(f"# HELP {name} Distribution of {metric_name.replace('_', ' ')}.")
+                lines.append(f"# TYPE {name} histogram")
+                lines.extend(_histogram_lines(name, histogram))
+
+            for counter_name, value in sorted(self.counters.items()):
+                name = f"{prefix}_{counter_name}"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, output_path):
+        """
+        Writes the metrics atomically, so a node_exporter textfile collector never reads a partial file.
+        """
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        temp_path = f"{output_path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(temp_path, output_path)
+
+    def write_trace(self, output_path):
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with self.lock:
+            trace = {
+                'traceEvents': list(self.trace_events),
+                'displayTimeUnit': 'ms',
+                'otherData': {'events_dropped': self.trace_events_dropped}
+            }
+        with open(output_path, 'w') as f:
+            json.dump(trace, f)
+
+    def print_summary(self):
+        with self.lock:
+            print("--- Stage Timings ---")
+            for stage_name, histogram in sorted(self.stage_histograms.items()):
+                mean_ms = histogram.sum / histogram.count * 1000 if histogram.count else 0.0
+                print(f"  {stage_name:<18} calls {histogram.count:>7}  mean {mean_ms:9.2f} ms  total {histogram.sum:8.2f} s")
+            for metric_name, histogram in sorted(self.size_histograms.items()):
+                mean_value = histogram.sum / histogram.count if histogram.count else 0.0
+                print(f"  {metric_name:<18} samples {histogram.count:>5}  mean {mean_value:9.1f}")
+            for counter_name, value in sorted(self.counters.items()):
+                print(f"  {counter_name:<18} {value}")
+
+def _histogram_lines(name, histogram, labels=''):
+    label_prefix = f"{labels}," if labels else ''
+    lines = []
+    cumulative = 0
+    for upper_bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{{{label_prefix}le="{upper_bound}"}} {cumulative}')
+    cumulative += histogram.bucket_counts[-1]
+    lines.append(f'{name}_bucket{{{label_prefix}le="+Inf"}} {cumulative}')
+    label_block = f"{{{labels}}}" if labels else ''
+    lines.append(f"{name}_sum{label_block} {histogram.sum}")
+    lines.append(f"{name}_count{label_block} {histogram.count}")
+    return lines
+
+# Used by pipelines created without instrumentation
+DISABLED_INSTRUMENTATION = Instrumentation(enabled=False)
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# ---------------------- CONFIG ------------------------
+SERVER_URL = 'http://127.0.0.1:8000'
+INPUT_TEST_IMAGES_DIR = 'test_images'
+NUM_REQUESTS = 200
+CONCURRENCY = 8
+
+# ---------------------- LOAD GENERATION ------------------------
+def load_request_bodies(image_dir):
+    bodies = []
+    for image_filename_with_ext in sorted(os.listdir(image_dir)):
+        if image_filename_with_ext.lower().endswith(('.png', '.jpg', '.jpeg')):
+            with open(os.path.join(image_dir, image_filename_with_ext), 'rb') as f:
+                bodies.append((image_filename_with_ext, f.read()))
+    return bodies
+
+def send_predict_request(server_url, body):
+    request = urllib.request.Request(f"{server_url}/predict", data=body, method='POST',
+                                     headers={'Content-Type': 'application/octet-stream'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        payload = json.loads(response.read())
+    return (time.perf_counter() - start) * 1000.0, payload
+
+def fetch_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+def run_load(server_url, bodies, num_requests, concurrency):
+    """
+    Sends `num_requests` images (cycling through `bodies`) with `concurrency` parallel
+    clients and prints throughput, latency percentiles and the server's batching metrics.
+    """
+    latencies_ms = []
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(send_predict_request, server_url, bodies[i % len(bodies)][1])
+                   for i in range(num_requests)]
+        for future in futures:
+            try:
+                latency_ms, _ = future.result()
+                latencies_ms.append(latency_ms)
+            except Exception as e:
+                failures += 1
+                if failures <= 5:
+                    print(f"  Request failed: {e}")
+    wall_seconds = time.perf_counter() - start
+
+    print("\n--- Load Test Summary ---")
+    print(f"Requests: {num_requests} (concurrency {concurrency}), failed: {failures}")
+    if latencies_ms:
+        values = np.asarray(latencies_ms)
+        print(f"Throughput: {len(latencies_ms) / wall_seconds:.2f} requests/s over {wall_seconds:.1f}s")
+        print(f"Latency ms: p50 {np.percentile(values, 50):.1f}  p95 {np.percentile(values, 95):.1f}  "
+              f"p99 {np.percentile(values, 99):.1f}  max {values.max():.1f}")
+
+    metrics = fetch_json(f"{server_url}/metrics")
+    print(f"\nServer Stage 2 batches run: {metrics['stage2_batches_run']}")
+    print("Crops per Stage 2 batch:")
+    for bucket, count in metrics['stage2_crops_per_batch_histogram'].items():
+        print(f"  <= {bucket:>5}: {count}")
+    print("Requests per Stage 2 batch:")
+    for bucket, count in metrics['stage2_requests_per_batch_histogram'].items():
+        print(f"  <= {bucket:>5}: {count}")
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive inference_server.py with concurrent image requests.")
+    parser.add_argument('--url', default=SERVER_URL)
+    parser.add_argument('--input-dir', default=INPUT_TEST_IMAGES_DIR)
+    parser.add_argument('--requests', type=int, default=NUM_REQUESTS)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir) or not os.listdir(args.input_dir):
+        print(f"Error: Input images directory '{args.input_dir}' not found or is empty.")
+        exit()
+
+    request_bodies = load_request_bodies(args.input_dir)
+    try:
+        health = fetch_json(f"{args.url}/health")
+    except Exception as e:
+        print(f"Error: Could not reach server at {args.url}: {e}")
+        exit()
+    print(f"Server health: {health}")
+    print(f"Sending {args.requests} requests from {len(request_bodies)} images at concurrency {args.concurrency}...")
+    run_load(args.url, request_bodies, args.requests, args.concurrency)
@@ -0,0 +1,279 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from result_sinks import ResultSink
+
+# ---------------------- CONFIG ------------------------
+OCCUPANCY_DB_PATH = os.path.join('csv_output', 'occupancy_timeseries.sqlite')
+STORE_BATCH_FRAMES = 64          # Frames buffered before one transaction
+RAW_RETENTION_DAYS = 14          # Raw per-slot observations older than this are pruned; rollups are kept
+DWELL_BUCKETS_SECONDS = [60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400]  # Last bucket is "longer"
+SLOT_KEY_GRID_PX = 8             # Box corners are snapped to this grid to give slots a stable id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    camera_id TEXT, slot_id TEXT, ts REAL, occupied INTEGER, score REAL
+);
+CREATE INDEX IF NOT EXISTS observations_camera_slot_ts ON observations (camera_id, slot_id, ts);
+CREATE INDEX IF NOT EXISTS observations_camera_ts ON observations (camera_id, ts);
+
+CREATE TABLE IF NOT EXISTS rollup_minute (
+    camera_id TEXT, bucket_start INTEGER, frames INTEGER, occupied_sum INTEGER, total_sum INTEGER,
+    PRIMARY KEY (camera_id, bucket_start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_hour (
+    camera_id TEXT, bucket_start INTEGER, frames INTEGER, occupied_sum INTEGER, total_sum INTEGER,
+    PRIMARY KEY (camera_id, bucket_start)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS slot_state (
+    camera_id TEXT, slot_id TEXT, occupied INTEGER, since_ts REAL, last_seen_ts REAL,
+    PRIMARY KEY (camera_id, slot_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dwell_intervals (
+    camera_id TEXT, slot_id TEXT, start_ts REAL, end_ts REAL, duration_s REAL
+);
+CREATE INDEX IF NOT EXISTS dwell_intervals_camera_end ON dwell_intervals (camera_id, end_ts);
+CREATE TABLE IF NOT EXISTS dwell_histogram (
+    camera_id TEXT, day_start INTEGER, bucket INTEGER, count INTEGER,
+    PRIMARY KEY (camera_id, day_start, bucket)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO {table} (camera_id, bucket_start, frames, occupied_sum, total_sum) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (camera_id, bucket_start) DO UPDATE SET
+    frames = frames + excluded.frames,
+    occupied_sum = occupied_sum + excluded.occupied_sum,
+    total_sum = total_sum + excluded.total_sum
+"""
+
+# ---------------------- HELPERS ------------------------
+def slot_key(slot):
+    """
+    Stable id for a slot: its 'slot_id' if the pipeline assigned one, otherwise its box snapped to a grid.
+    """
+    if 'slot_id' in slot:
+        return str(slot['slot_id'])
+    return '_'.join(str(int(round(v / SLOT_KEY_GRID_PX)) * SLOT_KEY_GRID_PX) for v in slot['box'])
+
+def dwell_bucket(duration_s):
+    for i, upper_bound in enumerate(DWELL_BUCKETS_SECONDS):
+        if duration_s <= upper_bound:
+            return i
+    return len(DWELL_BUCKETS_SECONDS)
+
+def day_start(ts):
+    return int(ts // 86400) * 86400
+
+# ---------------------- STORE ------------------------
+class OccupancyStore(ResultSink):
+    """
+    Local occupancy time series indexed by camera, slot and time.
+
+    Fed like any other result sink (frame records need 'camera_id' and 'timestamp').
+    Every flush applies one transaction that appends raw per-slot observations and
+    incrementally updates the per-minute and per-hour occupancy rollups, the current
+    state of each slot and the finished occupied intervals with their dwell-time
+    histogram, so the query methods read small pre-aggregated tables instead of
+    rescanning raw rows. Slot state only moves forward in time: an observation older than
+    the slot's last one is still stored raw and in the rollups, but skipped by the state
+    machine and counted in `out_of_order_observations`, so it cannot produce negative dwell times.
+    """
+
+    def __init__(self, db_path=OCCUPANCY_DB_PATH, batch_frames=STORE_BATCH_FRAMES,
+                 raw_retention_days=RAW_RETENTION_DAYS):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.batch_frames = batch_frames
+        self.raw_retention_days = raw_retention_days
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+        # Slot state lives in memory between flushes and is written back on every flush
+        self.slot_states = {(camera_id, slot_id): [occupied, since_ts, last_seen_ts]
+                            for camera_id, slot_id, occupied, since_ts, last_seen_ts
+                            in self.connection.execute("SELECT * FROM slot_state")}
+        self.out_of_order_observations = 0
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self.pending_frames = 0
+        self.pending_observations = []
+        self.pending_minute = {}
+        self.pending_hour = {}
+        self.pending_dwell_intervals = []
+        self.pending_dwell_histogram = {}
+        self.dirty_slots = set()
+
+    # ---- Ingest ----
+    def write_frame(self, frame_record, detected_slots_info):
+        camera_id = str(frame_record.get('camera_id') or 'default')
+        ts = float(frame_record.get('timestamp') or time.time())
+        occupied_count = 0
+        for slot in detected_slots_info:
+            occupied = 1 if slot['status'] == "occupied" else 0
+            occupied_count += occupied
+            slot_id = slot_key(slot)
+            self.pending_observations.append((camera_id, slot_id, ts, occupied, slot.get('score')))
+            self._update_slot_state(camera_id, slot_id, occupied, ts)
+
+        for pending, bucket_seconds in [(self.pending_minute, 60), (self.pending_hour, 3600)]:
+            bucket = (camera_id, int(ts // bucket_seconds) * bucket_seconds)
+            totals = pending.setdefault(bucket, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += occupied_count
+            totals[2] += len(detected_slots_info)
+
+        self.pending_frames += 1
+        if self.pending_frames >= self.batch_frames:
+            self.flush()
+
+    def _update_slot_state(self, camera_id, slot_id, occupied, ts):
+        key = (camera_id, slot_id)
+        state = self.slot_states.get(key)
+        if state is None:
+            self.slot_states[key] = [occupied, ts, ts]
+        elif ts < state[2]:
+            self.out_of_order_observations += 1
+            return
+        else:
+            if state[0] != occupied:
+                if state[0] == 1:
+                    # An occupied interval just ended
+                    duration_s = ts - state[1]
+                    self.pending_dwell_intervals.append((camera_id, slot_id, state[1], ts, duration_s))
+                    histogram_key = (camera_id, day_start(state[1]), dwell_bucket(duration_s))
+                    self.pending_dwell_histogram[histogram_key] = self.pending_dwell_histogram.get(histogram_key, 0) + 1
+                state[0] = occupied
+                state[1] = ts
+            state[2] = ts
+        self.dirty_slots.add(key)
+
+    def flush(self):
+        if not self.pending_frames:
+            return
+        with self.connection:
+            self.connection.executemany("INSERT INTO observations VALUES (?, ?, ?, ?, ?)", self.pending_observations)
+            for table, pending in [('rollup_minute', self.pending_minute), ('rollup_hour', self.pending_hour)]:
+                self.connection.executemany(ROLLUP_UPSERT.format(table=table),
+                                            [bucket + tuple(totals) for bucket, totals in pending.items()])
+            self.connection.executemany("INSERT INTO dwell_intervals VALUES (?, ?, ?, ?, ?)",
+                                        self.pending_dwell_intervals)
+            self.connection.executemany(
+                "INSERT INTO dwell_histogram VALUES (?, ?, ?, ?) ON CONFLICT (camera_id, day_start, bucket) "
+                "DO UPDATE SET count = count + excluded.count",
+                [key + (count,) for key, count in self.pending_dwell_histogram.items()])
+            self.connection.executemany("INSERT OR REPLACE INTO slot_state VALUES (?, ?, ?, ?, ?)",
+                                        [key + tuple(self.slot_states[key]) for key in self.dirty_slots])
+        self._reset_pending()
+
+    def prune_raw(self, now=None):
+        """
+        Drops raw observations older than the retention window. Rollups, dwell intervals and histograms are kept.
+        """
+        cutoff = (now or time.time()) - self.raw_retention_days * 86400
+        with self.connection:
+            self.connection.execute("DELETE FROM observations WHERE ts < ?", (cutoff,))
+
+    def close(self):
+        self.flush()
+        self.prune_raw()
+        self.connection.close()
+        if self.out_of_order_observations:
+            print(f"Occupancy store: {self.out_of_order_observations} slot observations older than the slot's "
+                  f"last one were left out of slot state and dwell times")
+
+    # ---- Queries ----
+    def occupancy_series(self, camera_id, start_ts, end_ts, bucket_seconds=900):
+        """
+        Average occupied and free slots per `bucket_seconds` window, read from the minute
+        rollup (or the hour rollup when the window is a whole number of hours).
+        Returns a list of (bucket_start, avg_occupied, avg_free, frames).
+        """
+        table = 'rollup_hour' if bucket_seconds % 3600 == 0 else 'rollup_minute'
+        rows = self.connection.execute(f"""
+            SELECT (bucket_start / ?) * ? AS window_start, SUM(frames), SUM(occupied_sum), SUM(total_sum)
+            FROM {table}
+            WHERE camera_id = ? AND bucket_start >= ? AND bucket_start < ?
+            GROUP BY window_start ORDER BY window_start
+        """, (bucket_seconds, bucket_seconds, camera_id, int(start_ts), int(end_ts))).fetchall()
+        return [(window_start, occupied_sum / frames, (total_sum - occupied_sum) / frames, frames)
+                for window_start, frames, occupied_sum, total_sum in rows]
+
+    def longest_occupied(self, camera_id, start_ts, end_ts, limit=5):
+        """
+        Longest occupied intervals that overlap [start_ts, end_ts), including slots that are still occupied.
+        Returns a list of (slot_id, start_ts, end_ts, duration_s, still_occupied).
+        """
+        finished = self.connection.execute("""
+            SELECT slot_id, start_ts, end_ts, duration_s, 0 FROM dwell_intervals
+            WHERE camera_id = ? AND end_ts >= ? AND start_ts < ?
+            ORDER BY duration_s DESC LIMIT ?
+        """, (camera_id, start_ts, end_ts, limit)).fetchall()
+        ongoing = [(slot_id, since_ts, last_seen_ts, last_seen_ts - since_ts, 1)
+                   for (state_camera_id, slot_id), (occupied, since_ts, last_seen_ts) in self.slot_states.items()
+                   if state_camera_id == camera_id and occupied == 1 and last_seen_ts >= start_ts and since_ts < end_ts]
+        return sorted(finished + ongoing, key=lambda interval: interval[3], reverse=True)[:limit]
+
+    def dwell_time_histogram(self, camera_id, start_ts, end_ts):
+        """
+        Counts of finished occupied intervals per dwell bucket for the days in [start_ts, end_ts).
+        Returns a list of (bucket_upper_bound_seconds or None for the last bucket, count).
+        """
+        counts = dict(self.connection.execute("""
+            SELECT bucket, SUM(count) FROM dwell_histogram
+            WHERE camera_id = ? AND day_start >= ? AND day_start < ?
+            GROUP BY bucket
+        """, (camera_id, day_start(start_ts), end_ts)).fetchall())
+        upper_bounds = DWELL_BUCKETS_SECONDS + [None]
+        return [(upper_bounds[bucket], counts.get(bucket, 0)) for bucket in range(len(upper_bounds))]
+
+    def cameras(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT camera_id FROM rollup_hour")]
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query the occupancy time-series store.")
+    parser.add_argument('--db', default=OCCUPANCY_DB_PATH)
+    parser.add_argument('--camera', default=None, help="Camera id (default: every camera in the store)")
+    parser.add_argument('--days', type=float, default=1.0, help="Look back this many days from now")
+    subparsers = parser.add_subparsers(dest='query', required=True)
+    series_parser = subparsers.add_parser('series', help="Average occupied/free slots per time window")
+    series_parser.add_argument('--bucket-minutes', type=int, default=15)
+    subparsers.add_parser('longest', help="Longest occupied slots")
+    subparsers.add_parser('dwell', help="Dwell-time histogram")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Error: Occupancy store '{args.db}' not found.")
+        exit()
+
+    store = OccupancyStore(args.db)
+    end_ts = time.time()
+    start_ts = end_ts - args.days * 86400
+    for camera_id in ([args.camera] if args.camera else store.cameras()):
+        print(f"\n--- Camera: {camera_id} ---")
+        query_start = time.perf_counter()
+        if args.query == 'series':
+            for window_start, avg_occupied, avg_free, frames in store.occupancy_series(
+                    camera_id, start_ts, end_ts, bucket_seconds=args.bucket_minutes * 60):
+                print(f"  {time.strftime('%Y-%m-%d %H:%M', time.localtime(window_start))}  "
+                      f"occupied {avg_occupied:6.1f}  free {avg_free:6.1f}  ({frames} frames)")
+        elif args.query == 'longest':
+            for slot_id, interval_start, interval_end, duration_s, still_occupied in store.longest_occupied(
+                    camera_id, start_ts, end_ts):
+                print(f"  slot {slot_id:<24} {duration_s / 60:8.1f} min  since "
+                      f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(interval_start))}"
+                      f"{'  (still occupied)' if still_occupied else ''}")
+        else:
+            for upper_bound, count in store.dwell_time_histogram(camera_id, start_ts, end_ts):
+                label = f"<= {upper_bound / 60:g} min" if upper_bound is not None else "longer"
+                print(f"  {label:<14} {count}")
+        print(f"  (query took {(time.perf_counter() - query_start) * 1000:.1f} ms)")
+    store.connection.close()
@@ -0,0 +1,302 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import cv2
+import numpy as np
+
+from inference import (
+    ParkingPipeline, extract_slot_crops, prepare_stage2_batch, box_iou_matrix,
+    STAGE1_MODEL_PATH, STAGE2_MODEL_PATH, ONNX_STAGE1_MODEL_PATH, ONNX_STAGE2_MODEL_PATH,
+    INPUT_TEST_IMAGES_DIR, STAGE2_IMG_HEIGHT, STAGE2_IMG_WIDTH
+)
+from inference_backends import OnnxStage1Backend, preprocess_stage1_images, STAGE1_ONNX_IMGSZ
+
+# ---------------------- CONFIG ------------------------
+INT8_STAGE1_MODEL_PATH = 'best_int8.onnx'
+INT8_STAGE2_MODEL_PATH = 'stage2_occupancy_classifier_best_int8.onnx'
+# Calibration must not overlap INPUT_TEST_IMAGES_DIR, which 'compare' uses to score the quantized models
+CALIBRATION_IMAGES_DIR = 'calibration_frames'  # Held-out full frames (e.g. a sample of Stage 1 training images)
+CALIBRATION_CROPS_DIR = os.path.join('sorted_patches', 'val')  # Held-out slot patches for Stage 2
+MAX_CALIBRATION_CROPS = 2000                    # Slot crops used to calibrate Stage 2
+CALIBRATION_BATCH_SIZE = 32
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+MATCH_IOU_THRESHOLD = 0.5                       # Slots from two backends count as the same slot above this IoU
+
+# ---------------------- EXPORT ------------------------
+def export_stage1_to_onnx(pt_path=STAGE1_MODEL_PATH, onnx_path=ONNX_STAGE1_MODEL_PATH, imgsz=STAGE1_ONNX_IMGSZ):
+    from ultralytics import YOLO
+    print(f"Exporting Stage 1 '{pt_path}' to ONNX...")
+    exported_path = YOLO(pt_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    if os.path.abspath(exported_path) != os.path.abspath(onnx_path):
+        os.replace(exported_path, onnx_path)
+    print(f"  Saved: {onnx_path}")
+    return onnx_path
+
+def export_stage2_to_onnx(h5_path=STAGE2_MODEL_PATH, onnx_path=ONNX_STAGE2_MODEL_PATH):
+    import tensorflow as tf
+    import tf2onnx
+    print(f"Exporting Stage 2 '{h5_path}' to ONNX...")
+    model = tf.keras.models.load_model(h5_path)
+    input_signature = [tf.TensorSpec((None, STAGE2_IMG_HEIGHT, STAGE2_IMG_WIDTH, 3), tf.float32, name='input')]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=13, output_path=onnx_path)
+    print(f"  Saved: {onnx_path}")
+    return onnx_path
+
+# ---------------------- INT8 QUANTIZATION ------------------------
+def list_images(image_dir, recursive=False):
+    pattern = os.path.join(image_dir, '**', '*') if recursive else os.path.join(image_dir, '*')
+    return sorted(p for p in glob.glob(pattern, recursive=recursive)
+                  if p.lower().endswith(('.png', '.jpg', '.jpeg')))
+
+def load_stage1_calibration_batches(image_dir, imgsz):
+    batches = []
+    for image_path in list_images(image_dir):
+        image = cv2.imread(image_path)
+        if image is not None:
+            batch, _ = preprocess_stage1_images([image], imgsz)
+            batches.append(batch)
+    return batches
+
+def load_stage2_calibration_batches(crops_dir, frames_dir, stage1_onnx_path, max_crops=MAX_CALIBRATION_CROPS):
+    """
+    Collects slot crops either from a directory of patch images (e.g. sorted_patches/val)
+    or, when none is given, by running the fp32 ONNX Stage 1 on full frames.
+    """
+    slot_crops = []
+    if crops_dir:
+        for image_path in list_images(crops_dir, recursive=True)[:max_crops]:
+            crop = cv2.imread(image_path)
+            if crop is not None:
+                slot_crops.append(crop)
+    else:
+        stage1_backend = OnnxStage1Backend(stage1_onnx_path)
+        for image_path in list_images(frames_dir):
+            image = cv2.imread(image_path)
+            if image is None:
+                continue
+            boxes, _ = stage1_backend.detect_batch([image], conf=STAGE1_CONF, iou=0.5)[0]
+            slot_crops.extend(extract_slot_crops(image, boxes)[1])
+            if len(slot_crops) >= max_crops:
+                break
+    slot_crops = slot_crops[:max_crops]
+    return [prepare_stage2_batch(slot_crops[i:i + CALIBRATION_BATCH_SIZE])
+            for i in range(0, len(slot_crops), CALIBRATION_BATCH_SIZE)]
+
+def quantize_to_int8(fp32_path, int8_path, calibration_batches):
+    """
+    Static INT8 quantization (QDQ, per-channel weights) of an ONNX model from a list of input batches.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class BatchCalibrationReader(CalibrationDataReader):
+        def __init__(self, batches):
+            self.batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {input_name: batch}
+
+    preprocessed_path = fp32_path.replace('.onnx', '_preprocessed.onnx')
+    quant_pre_process(fp32_path, preprocessed_path)
+    print(f"Quantizing '{fp32_path}' to INT8 with {len(calibration_batches)} calibration batches...")
+    quantize_static(preprocessed_path, int8_path, BatchCalibrationReader(calibration_batches),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    os.remove(preprocessed_path)
+    print(f"  Saved: {int8_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB -> {os.path.getsize(int8_path) / 1e6:.1f} MB)")
+    return int8_path
+
+# ---------------------- BACKEND RUN (ONE PROCESS PER BACKEND) ------------------------
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+    except ImportError:
+        try:
+            import psutil
+            memory_info = psutil.Process().memory_info()
+            return getattr(memory_info, 'peak_wset', memory_info.rss) / (1024.0 * 1024.0)
+        except ImportError:
+            return None
+
+def run_backend(backend, stage1_model_path, stage2_model_path, image_dir, output_json_path):
+    """
+    Runs one backend over a directory and writes per-image slots, per-stage latency and peak RSS to JSON.
+    """
+    pipeline = ParkingPipeline(stage1_model_path, stage2_model_path, backend=backend)
+    pipeline.warm_up()
+
+    per_image = {}
+    for image_path in list_images(image_dir):
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        start = time.perf_counter()
+        boxes, _ = pipeline.run_stage1_detection(image, stage1_conf=STAGE1_CONF)
+        stage1_ms = (time.perf_counter() - start) * 1000.0
+        start = time.perf_counter()
+        detected_slots_info = pipeline.classify_detected_slots(image, boxes,
+                                                               stage2_occupied_threshold=STAGE2_OCCUPIED_THRESHOLD)
+        stage2_ms = (time.perf_counter() - start) * 1000.0
+        per_image[os.path.basename(image_path)] = {
+            'slots': detected_slots_info, 'stage1_ms': stage1_ms, 'stage2_ms': stage2_ms
+        }
+
+    with open(output_json_path, 'w') as f:
+        json.dump({'backend': backend, 'stage1_model': stage1_model_path, 'stage2_model': stage2_model_path,
+                   'per_image': per_image, 'peak_rss_mb': peak_rss_mb(),
+                   'cold_start_seconds': pipeline.cold_start_seconds}, f)
+
+def run_backend_in_subprocess(backend, stage1_model_path, stage2_model_path, image_dir, output_json_path):
+    # A fresh process per backend keeps peak RSS from one runtime out of the other's measurement
+    subprocess.run([sys.executable, os.path.abspath(__file__), 'run', '--backend', backend,
+                    '--stage1-model', stage1_model_path, '--stage2-model', stage2_model_path,
+                    '--input-dir', image_dir, '--out', output_json_path], check=True)
+    with open(output_json_path) as f:
+        return json.load(f)
+
+# ---------------------- ACCURACY / LATENCY COMPARISON ------------------------
+def match_slots(reference_slots, candidate_slots, iou_threshold=MATCH_IOU_THRESHOLD):
+    """
+    Greedy one-to-one matching of slots by IoU. Returns a list of (reference_index, candidate_index).
+    """
+    if not reference_slots or not candidate_slots:
+        return []
+    iou = box_iou_matrix([s['box'] for s in reference_slots], [s['box'] for s in candidate_slots])
+    matches = []
+    used_reference, used_candidate = set(), set()
+    for flat_index in np.argsort(-iou, axis=None):
+        ref_i, cand_i = np.unravel_index(flat_index, iou.shape)
+        if iou[ref_i, cand_i] < iou_threshold:
+            break
+        if ref_i in used_reference or cand_i in used_candidate:
+            continue
+        used_reference.add(ref_i)
+        used_candidate.add(cand_i)
+        matches.append((int(ref_i), int(cand_i)))
+    return matches
+
+def compare_backends(reference, candidate):
+    print(f"\n--- {candidate['backend']} ({os.path.basename(candidate['stage1_model'])}, "
+          f"{os.path.basename(candidate['stage2_model'])}) vs {reference['backend']} ---")
+    print(f"{'Image':<20}{'Ref slots':>10}{'Cand slots':>11}{'Diff':>6}{'Matched':>9}{'Status agree':>14}"
+          f"{'Ref ms':>9}{'Cand ms':>9}")
+
+    total_matched = total_agree = 0
+    total_abs_count_diff = 0
+    ref_ms_total = cand_ms_total = 0.0
+    for image_name, ref_result in reference['per_image'].items():
+        cand_result = candidate['per_image'].get(image_name)
+        if cand_result is None:
+            continue
+        matches = match_slots(ref_result['slots'], cand_result['slots'])
+        agree = sum(1 for ref_i, cand_i in matches
+                    if ref_result['slots'][ref_i]['status'] == cand_result['slots'][cand_i]['status'])
+        count_diff = len(cand_result['slots']) - len(ref_result['slots'])
+        ref_ms = ref_result['stage1_ms'] + ref_result['stage2_ms']
+        cand_ms = cand_result['stage1_ms'] + cand_result['stage2_ms']
+        total_matched += len(matches)
+        total_agree += agree
+        total_abs_count_diff += abs(count_diff)
+        ref_ms_total += ref_ms
+        cand_ms_total += cand_ms
+        agreement_text = f"{agree / len(matches) * 100:.1f}%" if matches else "n/a"
+        print(f"{image_name:<20}{len(ref_result['slots']):>10}{len(cand_result['slots']):>11}{count_diff:>+6}"
+              f"{len(matches):>9}{agreement_text:>14}{ref_ms:>9.1f}{cand_ms:>9.1f}")
+
+    print(f"\nStatus agreement on matched slots: "
+          f"{total_agree / total_matched * 100 if total_matched else 0:.2f}% ({total_agree}/{total_matched})")
+    print(f"Total absolute slot-count difference: {total_abs_count_diff}")
+    for stage_key in ['stage1_ms', 'stage2_ms']:
+        ref_mean = np.mean([r[stage_key] for r in reference['per_image'].values()])
+        cand_mean = np.mean([r[stage_key] for r in candidate['per_image'].values()])
+        print(f"Mean {stage_key[:6]} latency: {ref_mean:.1f} ms -> {cand_mean:.1f} ms ({ref_mean / cand_mean:.2f}x)")
+    if cand_ms_total > 0:
+        print(f"Total latency: {ref_ms_total:.1f} ms -> {cand_ms_total:.1f} ms ({ref_ms_total / cand_ms_total:.2f}x)")
+    if reference['peak_rss_mb'] and candidate['peak_rss_mb']:
+        print(f"Peak resident memory: {reference['peak_rss_mb']:.0f} MB -> {candidate['peak_rss_mb']:.0f} MB "
+              f"(saved {reference['peak_rss_mb'] - candidate['peak_rss_mb']:.0f} MB)")
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export, INT8-quantize and validate the ONNX Runtime backend.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('export', help="Export best.pt and the .h5 classifier to ONNX")
+
+    quantize_parser = subparsers.add_parser('quantize', help="INT8-quantize the exported ONNX models")
+    quantize_parser.add_argument('--calibration-images', default=CALIBRATION_IMAGES_DIR,
+                                 help="Held-out full frames for Stage 1 calibration (and Stage 2 crops if no "
+                                      "crops dir); must not overlap the 'compare' images")
+    quantize_parser.add_argument('--calibration-crops', default=CALIBRATION_CROPS_DIR,
+                                 help="Held-out slot patches for Stage 2 calibration (default: sorted_patches/val); "
+                                      "pass '' to crop the calibration frames instead")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare ONNX fp32/INT8 against the native backends")
+    compare_parser.add_argument('--input-dir', default=INPUT_TEST_IMAGES_DIR)
+    compare_parser.add_argument('--skip-fp32', action='store_true', help="Only compare the INT8 models")
+
+    run_parser = subparsers.add_parser('run', help="(internal) run one backend and write results to JSON")
+    run_parser.add_argument('--backend', required=True)
+    run_parser.add_argument('--stage1-model', required=True)
+    run_parser.add_argument('--stage2-model', required=True)
+    run_parser.add_argument('--input-dir', default=INPUT_TEST_IMAGES_DIR)
+    run_parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_stage1_to_onnx()
+        export_stage2_to_onnx()
+
+    elif args.command == 'quantize':
+        for onnx_path in [ONNX_STAGE1_MODEL_PATH, ONNX_STAGE2_MODEL_PATH]:
+            if not os.path.exists(onnx_path):
+                print(f"Error: '{onnx_path}' not found. Run the 'export' command first.")
+                exit()
+        if not os.path.isdir(args.calibration_images):
+            print(f"Error: calibration frames directory '{args.calibration_images}' not found.")
+            exit()
+        if os.path.abspath(args.calibration_images) == os.path.abspath(INPUT_TEST_IMAGES_DIR):
+            print(f"Warning: calibrating on '{INPUT_TEST_IMAGES_DIR}', the same frames 'compare' scores against; "
+                  f"the INT8 accuracy it reports will be optimistic.")
+        if args.calibration_crops and not os.path.isdir(args.calibration_crops):
+            print(f"Error: calibration crops directory '{args.calibration_crops}' not found. "
+                  f"Run sort_pnr_patches.py or pass --calibration-crops ''.")
+            exit()
+        stage1_imgsz = OnnxStage1Backend(ONNX_STAGE1_MODEL_PATH).imgsz
+        quantize_to_int8(ONNX_STAGE1_MODEL_PATH, INT8_STAGE1_MODEL_PATH,
+                         load_stage1_calibration_batches(args.calibration_images, stage1_imgsz))
+        quantize_to_int8(ONNX_STAGE2_MODEL_PATH, INT8_STAGE2_MODEL_PATH,
+                         load_stage2_calibration_batches(args.calibration_crops, args.calibration_images,
+                                                         ONNX_STAGE1_MODEL_PATH))
+
+    elif args.command == 'compare':
+        print(f"Running native backend on: {args.input_dir}")
+        reference = run_backend_in_subprocess('native', STAGE1_MODEL_PATH, STAGE2_MODEL_PATH, args.input_dir,
+                                              'backend_results_native.json')
+        candidates = []
+        if not args.skip_fp32:
+            candidates.append(('backend_results_onnx_fp32.json', ONNX_STAGE1_MODEL_PATH, ONNX_STAGE2_MODEL_PATH))
+        candidates.append(('backend_results_onnx_int8.json', INT8_STAGE1_MODEL_PATH, INT8_STAGE2_MODEL_PATH))
+        for output_json_path, stage1_model_path, stage2_model_path in candidates:
+            if not (os.path.exists(stage1_model_path) and os.path.exists(stage2_model_path)):
+                print(f"Skipping {stage1_model_path} / {stage2_model_path}: not found.")
+                continue
+            print(f"Running onnx backend with: {stage1_model_path}, {stage2_model_path}")
+            candidate = run_backend_in_subprocess('onnx', stage1_model_path, stage2_model_path, args.input_dir,
+                                                  output_json_path)
+            compare_backends(reference, candidate)
+
+    elif args.command == 'run':
+        run_backend(args.backend, args.stage1_model, args.stage2_model, args.input_dir, args.out)
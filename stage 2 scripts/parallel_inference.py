@@ -0,0 +1,193 @@
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import time
+
+# NOTE: inference.py imports TensorFlow/Ultralytics lazily, but both frameworks read their
+# thread settings at import time, so the pipeline is only built inside the worker processes
+# (after their thread limits are set), never in the parent.
+
+# ---------------------- CONFIG ------------------------
+INPUT_TEST_IMAGES_DIR = 'test_images'
+OUTPUT_VISUALIZATION_DIR = 'test_results_creative'
+OUTPUT_CSV_DIR = 'csv_output'
+OUTPUT_CSV_FILENAME = 'all_images_parking_summary_creative.csv'
+
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+SHARD_SIZE = 8                       # Images per task handed to a worker (one Stage 1 batch)
+NUM_WORKERS = os.cpu_count() or 1
+BACKEND = 'native'                   # 'native' or 'onnx', see inference_backends.py
+
+# Environment variables read by OpenMP/MKL/OpenBLAS, PyTorch and TensorFlow at import time
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS']
+
+# ---------------------- WORKER SIDE ------------------------
+worker_pipeline = None
+
+def init_worker(threads_per_worker, backend, ready_workers=None):
+    """
+    Pins framework thread pools to `threads_per_worker` and loads both models once per process.
+    When given, the shared `ready_workers` counter is incremented once the models are warmed up.
+    """
+    global worker_pipeline
+    for env_var in THREAD_ENV_VARS:
+        os.environ[env_var] = str(threads_per_worker)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+    import cv2
+    cv2.setNumThreads(threads_per_worker)
+    if backend == 'native':
+        import torch
+        torch.set_num_threads(threads_per_worker)
+
+    from inference import ParkingPipeline
+    worker_pipeline = ParkingPipeline(backend=backend, num_threads=threads_per_worker)
+    worker_pipeline.warm_up()
+    if ready_workers is not None:
+        with ready_workers.get_lock():
+            ready_workers.value += 1
+
+def process_shard(shard):
+    """
+    Runs the batched pipeline on one shard and writes its visualizations.
+    Returns (shard_index, csv_rows, busy_seconds).
+    """
+    shard_index, image_filenames, input_dir, output_dir, save_visualizations = shard
+    import cv2
+
+    start = time.perf_counter()
+    image_paths = [os.path.join(input_dir, f) for f in image_filenames]
+    batch_results = worker_pipeline.predict_batch(
+        image_paths,
+        stage1_conf=STAGE1_CONF,
+        stage2_occupied_threshold=STAGE2_OCCUPIED_THRESHOLD,
+        render=save_visualizations
+    )
+
+    csv_rows = []
+    for image_filename_with_ext, (result_image, _, occupied_final, empty_final) in zip(image_filenames, batch_results):
+        if result_image is None:
+            continue
+        if save_visualizations:
+            base_name = os.path.splitext(image_filename_with_ext)[0]
+            cv2.imwrite(os.path.join(output_dir, f"{base_name}_creative_occupancy.jpg"), result_image)
+        csv_rows.append({
+            'Image Name': image_filename_with_ext,
+            'Total Detected Slots': occupied_final + empty_final,
+            'Occupied Slots': occupied_final,
+            'Available Slots': empty_final
+        })
+    return shard_index, csv_rows, time.perf_counter() - start
+
+# ---------------------- PARENT SIDE ------------------------
+def list_input_images(input_dir):
+    # Sorted so shard contents and the merged CSV order do not depend on the filesystem
+    return sorted(f for f in os.listdir(input_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+
+def make_shards(image_filenames, input_dir, output_dir, shard_size, save_visualizations):
+    shards = []
+    for shard_index, start in enumerate(range(0, len(image_filenames), shard_size)):
+        shards.append((shard_index, image_filenames[start:start + shard_size], input_dir, output_dir,
+                       save_visualizations))
+    return shards
+
+def run_sharded(image_filenames, num_workers, input_dir=INPUT_TEST_IMAGES_DIR, output_dir=OUTPUT_VISUALIZATION_DIR,
+                shard_size=SHARD_SIZE, save_visualizations=True, backend=BACKEND):
+    """
+    Processes all images with `num_workers` processes and returns (csv_rows, wall_seconds),
+    with rows merged back into input order. Model loading is excluded from the timing.
+    """
+    cpu_count = os.cpu_count() or 1
+    threads_per_worker = max(1, cpu_count // num_workers)
+    shards = make_shards(image_filenames, input_dir, output_dir, shard_size, save_visualizations)
+
+    # 'spawn' gives every worker a clean interpreter, so no framework state is inherited from the parent
+    context = mp.get_context('spawn')
+    ready_workers = context.Value('i', 0)
+    with context.Pool(processes=num_workers, initializer=init_worker,
+                      initargs=(threads_per_worker, backend, ready_workers)) as pool:
+        # The timed run only starts once every worker has loaded and warmed up its models
+        while ready_workers.value < num_workers:
+            time.sleep(0.05)
+
+        start = time.perf_counter()
+        rows_by_shard = {}
+        busy_seconds = 0.0
+        for shard_index, csv_rows, shard_seconds in pool.imap_unordered(process_shard, shards):
+            rows_by_shard[shard_index] = csv_rows
+            busy_seconds += shard_seconds
+            print(f"  Shard {shard_index + 1}/{len(shards)} done ({len(csv_rows)} images, {shard_seconds:.2f}s)")
+        wall_seconds = time.perf_counter() - start
+
+    merged_rows = []
+    for shard_index in sorted(rows_by_shard):
+        merged_rows.extend(rows_by_shard[shard_index])
+    print(f"  {num_workers} worker(s) x {threads_per_worker} thread(s): {len(merged_rows)} images in "
+          f"{wall_seconds:.2f}s ({len(merged_rows) / wall_seconds if wall_seconds > 0 else 0:.2f} images/s, "
+          f"worker busy time {busy_seconds:.2f}s)")
+    return merged_rows, wall_seconds
+
+def write_summary_csv(csv_rows, csv_path):
+    fieldnames = ['Image Name', 'Total Detected Slots', 'Occupied Slots', 'Available Slots']
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(csv_rows)
+
+def report_scaling(image_filenames, max_workers, input_dir, shard_size, backend=BACKEND):
+    """
+    Reruns the workload with 1, 2, 4, ... max_workers processes and prints speedup and
+    scaling efficiency (speedup / workers) relative to a single worker.
+    """
+    worker_counts = []
+    n = 1
+    while n < max_workers:
+        worker_counts.append(n)
+        n *= 2
+    worker_counts.append(max_workers)
+
+    timings = {}
+    for num_workers in worker_counts:
+        print(f"\n--- Scaling run: {num_workers} worker(s) ---")
+        _, timings[num_workers] = run_sharded(image_filenames, num_workers, input_dir=input_dir,
+                                              shard_size=shard_size, save_visualizations=False, backend=backend)
+
+    print("\n--- Scaling Efficiency ---")
+    print(f"{'Workers':>8}{'Wall s':>10}{'Speedup':>10}{'Efficiency':>12}")
+    for num_workers in worker_counts:
+        speedup = timings[1] / timings[num_workers] if timings[num_workers] > 0 else 0.0
+        print(f"{num_workers:>8}{timings[num_workers]:>10.2f}{speedup:>10.2f}{speedup / num_workers * 100:>11.1f}%")
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the two-stage pipeline on a directory with a process pool.")
+    parser.add_argument('--input-dir', default=INPUT_TEST_IMAGES_DIR)
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--backend', default=BACKEND, choices=['native', 'onnx'])
+    parser.add_argument('--scaling', action='store_true', help="Measure scaling efficiency from 1 to --workers")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir) or not os.listdir(args.input_dir):
+        print(f"Error: Input images directory '{args.input_dir}' not found or is empty.")
+        exit()
+
+    image_filenames = list_input_images(args.input_dir)
+    print(f"Processing {len(image_filenames)} images from: {args.input_dir} "
+          f"with {args.workers} worker(s), shard size {args.shard_size}")
+
+    if args.scaling:
+        report_scaling(image_filenames, args.workers, args.input_dir, args.shard_size, backend=args.backend)
+    else:
+        os.makedirs(OUTPUT_VISUALIZATION_DIR, exist_ok=True)
+        os.makedirs(OUTPUT_CSV_DIR, exist_ok=True)
+        csv_rows, _ = run_sharded(image_filenames, args.workers, input_dir=args.input_dir, shard_size=args.shard_size,
+                                  backend=args.backend)
+        if csv_rows:
+            overall_csv_path = os.path.join(OUTPUT_CSV_DIR, OUTPUT_CSV_FILENAME)
+            write_summary_csv(csv_rows, overall_csv_path)
+            print(f"\nOverall summary saved to: {overall_csv_path}")
+        else:
+            print("\nNo images were processed to create an overall summary.")
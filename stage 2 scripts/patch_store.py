@@ -0,0 +1,238 @@
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# ---------------------- CONFIG ------------------------
+SORTED_PATCHES_DIR = 'sorted_patches'   # Output of sort_pnr_patches.py: {split}/{empty,occupied}/*.jpg
+PACKED_PATCHES_DIR = 'packed_patches'
+MANIFEST_FILENAME = 'manifest.csv'      # Written by sort_pnr_patches.py, used instead of listing folders when present
+SPLITS = ['train', 'val', 'test']
+CLASS_NAMES = ['empty', 'occupied']     # Label = index, so 1 matches the classifier's "occupied" score
+PATCH_HEIGHT = 96                       # Same as STAGE2_IMG_HEIGHT / STAGE2_IMG_WIDTH in inference.py
+PATCH_WIDTH = 96
+NUM_DECODE_WORKERS = 8                  # cv2.imdecode/resize release the GIL
+BATCH_SIZE = 64
+PATCH_STORE_VERSION = 1
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# ---------------------- PACKING ------------------------
+def list_split(sorted_patches_dir, split_name):
+    """
+    Returns [(patch_path, label)] for one split, from manifest.csv when it exists, else from the class folders.
+    """
+    manifest_path = os.path.join(sorted_patches_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, newline='') as f_in:
+            return [(row['source'], CLASS_NAMES.index(row['label']))
+                    for row in csv.DictReader(f_in) if row['split'] == split_name]
+    entries = []
+    for label, class_name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(sorted_patches_dir, split_name, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        entries.extend((os.path.join(class_dir, f), label)
+                       for f in sorted(os.listdir(class_dir)) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return entries
+
+def split_paths(store_dir, split_name):
+    return {name: os.path.join(store_dir, f"{split_name}_{name}.npy") for name in ['images', 'labels', 'index']}
+
+def pack_split(entries, store_dir, split_name, num_workers=NUM_DECODE_WORKERS):
+    """
+    Decodes and resizes every patch once (BGR, INTER_LINEAR, exactly like prepare_stage2_batch) into
+    {split}_images.npy (N, 96, 96, 3) uint8, {split}_labels.npy (N,) uint8 and {split}_index.npy (N,)
+    source paths. Rows are written straight into the memory-mapped output file, so packing needs no
+    more RAM than a few patches per worker. Unreadable patches are dropped and counted.
+    """
+    paths = split_paths(store_dir, split_name)
+    tmp_images_path = paths['images'] + '.tmp'
+    images = np.lib.format.open_memmap(tmp_images_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(entries), PATCH_HEIGHT, PATCH_WIDTH, 3))
+    valid = np.zeros(len(entries), dtype=bool)
+    progress_lock = threading.Lock()
+    progress = [0]
+
+    def decode(i):
+        patch = cv2.imread(entries[i][0], cv2.IMREAD_COLOR)
+        if patch is not None:
+            images[i] = cv2.resize(patch, (PATCH_WIDTH, PATCH_HEIGHT))
+            valid[i] = True
+        with progress_lock:
+            progress[0] += 1
+            if progress[0] % 10000 == 0:
+                print(f"    {split_name}: {progress[0]}/{len(entries)} patches packed...")
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for _ in pool.map(decode, range(len(entries)), chunksize=256):
+            pass
+    images.flush()
+
+    num_failed = int((~valid).sum())
+    if num_failed:
+        # Compact in row chunks so the images never have to fit in memory
+        compact_path = paths['images'] + '.compact.tmp'
+        valid_rows = np.flatnonzero(valid)
+        compacted = np.lib.format.open_memmap(compact_path, mode='w+', dtype=np.uint8,
+                                              shape=(len(valid_rows), PATCH_HEIGHT, PATCH_WIDTH, 3))
+        for start in range(0, len(valid_rows), 4096):
+            compacted[start:start + 4096] = images[valid_rows[start:start + 4096]]
+        compacted.flush()
+        del compacted, images
+        os.replace(compact_path, tmp_images_path)
+    else:
+        del images
+
+    labels = np.array([label for _, label in entries], dtype=np.uint8)[valid]
+    index = np.array([path for path, _ in entries], dtype=str)[valid]
+    np.save(paths['labels'], labels)
+    np.save(paths['index'], index)
+    os.replace(tmp_images_path, paths['images'])
+    return {'patches': int(len(labels)), 'failed': num_failed,
+            'class_counts': {name: int((labels == label).sum()) for label, name in enumerate(CLASS_NAMES)}}
+
+def pack_patches(sorted_patches_dir=SORTED_PATCHES_DIR, store_dir=PACKED_PATCHES_DIR, splits=SPLITS,
+                 num_workers=NUM_DECODE_WORKERS):
+    """
+    Packs every split and writes store_dir/meta.json describing the layout.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    meta = {'version': PATCH_STORE_VERSION, 'patch_shape': [PATCH_HEIGHT, PATCH_WIDTH, 3], 'color_order': 'BGR',
+            'class_names': CLASS_NAMES, 'source_dir': os.path.abspath(sorted_patches_dir), 'splits': {}}
+    for split_name in splits:
+        entries = list_split(sorted_patches_dir, split_name)
+        if not entries:
+            print(f"Warning: No patches found for split '{split_name}'. Skipping.")
+            continue
+        start_time = time.perf_counter()
+        split_meta = pack_split(entries, store_dir, split_name, num_workers=num_workers)
+        elapsed = time.perf_counter() - start_time
+        meta['splits'][split_name] = split_meta
+        print(f"Packed '{split_name}': {split_meta['patches']} patches ({split_meta['failed']} unreadable) "
+              f"in {elapsed:.1f}s ({len(entries) / max(elapsed, 1e-9):.0f} patches/sec)")
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f_out:
+        json.dump(meta, f_out, indent=2)
+    return meta
+
+# ---------------------- LOADING ------------------------
+class PatchStore:
+    """
+    One packed split, memory-mapped read-only: `images` is an (N, 96, 96, 3) uint8 BGR array,
+    `labels` (N,) uint8 with 0 = empty and 1 = occupied, `index` the source patch paths.
+    Pages are read on demand and shared through the OS page cache, so several processes
+    (or epochs) reuse the same data without decoding a single JPEG.
+    """
+
+    def __init__(self, store_dir=PACKED_PATCHES_DIR, split_name='train'):
+        paths = split_paths(store_dir, split_name)
+        if not os.path.exists(paths['images']):
+            raise RuntimeError(f"Packed split not found: '{paths['images']}'. Run: python patch_store.py pack")
+        self.split_name = split_name
+        self.images = np.load(paths['images'], mmap_mode='r')
+        self.labels = np.load(paths['labels'])
+        self.index = np.load(paths['index'])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def class_counts(self):
+        return {name: int((self.labels == label).sum()) for label, name in enumerate(CLASS_NAMES)}
+
+    def batches(self, batch_size=BATCH_SIZE, shuffle=True, seed=None, drop_remainder=False, normalize=True):
+        """
+        Yields (images, labels) batches in a fresh random order per call (one epoch).
+        Images are float32 in [0, 1] like prepare_stage2_batch (uint8 with normalize=False),
+        labels are float32. Indices are sorted within each batch so reads stay mostly forward in the file.
+        """
+        order = np.random.default_rng(seed).permutation(len(self)) if shuffle else np.arange(len(self))
+        stop = len(order) - len(order) % batch_size if drop_remainder else len(order)
+        for start in range(0, stop, batch_size):
+            batch_indices = np.sort(order[start:start + batch_size])
+            batch_images = self.images[batch_indices]
+            if normalize:
+                batch_images = batch_images.astype(np.float32)
+                batch_images /= 255.0
+            yield batch_images, self.labels[batch_indices].astype(np.float32)
+
+    def tf_dataset(self, batch_size=BATCH_SIZE, shuffle=True, seed=None, prefetch=2):
+        """
+        The same batches as a tf.data.Dataset for model.fit / model.evaluate; reshuffled every epoch.
+        """
+        import tensorflow as tf
+        epoch = [0]
+
+        def generator():
+            epoch_seed = None if seed is None else seed + epoch[0]
+            epoch[0] += 1
+            yield from self.batches(batch_size, shuffle=shuffle, seed=epoch_seed)
+
+        dataset = tf.data.Dataset.from_generator(generator, output_signature=(
+            tf.TensorSpec(shape=(None, PATCH_HEIGHT, PATCH_WIDTH, 3), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.float32)))
+        return dataset.prefetch(prefetch)
+
+# ---------------------- EVALUATION ------------------------
+def evaluate_stage2(pipeline, store, stage2_occupied_threshold=0.7, batch_size=256):
+    """
+    Runs the pipeline's Stage 2 classifier over a packed split and returns accuracy and per-class error counts.
+    """
+    scores = np.empty(len(store), dtype=np.float32)
+    position = 0
+    for batch_images, _ in store.batches(batch_size, shuffle=False):
+        scores[position:position + len(batch_images)] = pipeline.stage2_backend.predict_scores(batch_images)
+        position += len(batch_images)
+    predicted = scores > stage2_occupied_threshold
+    actual = store.labels == 1
+    return {'patches': len(store), 'accuracy': float((predicted == actual).mean()) if len(store) else 0.0,
+            'false_occupied': int((predicted & ~actual).sum()), 'false_empty': int((~predicted & actual).sum())}
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack Stage 2 patches into memory-mapped arrays and read them back.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pack_parser = subparsers.add_parser('pack', help="Decode, resize and pack sorted_patches")
+    pack_parser.add_argument('--source', default=SORTED_PATCHES_DIR)
+    pack_parser.add_argument('--out', default=PACKED_PATCHES_DIR)
+    pack_parser.add_argument('--splits', nargs='+', default=SPLITS)
+    pack_parser.add_argument('--workers', type=int, default=NUM_DECODE_WORKERS)
+
+    info_parser = subparsers.add_parser('info', help="Show sizes and time one shuffled epoch per split")
+    info_parser.add_argument('--store', default=PACKED_PATCHES_DIR)
+    info_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help="Evaluate the Stage 2 classifier on a packed split")
+    evaluate_parser.add_argument('--store', default=PACKED_PATCHES_DIR)
+    evaluate_parser.add_argument('--split', default='test')
+    evaluate_parser.add_argument('--backend', default='native', choices=['native', 'onnx'])
+    evaluate_parser.add_argument('--threshold', type=float, default=0.7)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'pack':
+            pack_patches(args.source, args.out, args.splits, args.workers)
+        elif args.command == 'info':
+            for split_name in SPLITS:
+                if not os.path.exists(split_paths(args.store, split_name)['images']):
+                    continue
+                store = PatchStore(args.store, split_name)
+                start_time = time.perf_counter()
+                for _ in store.batches(args.batch_size):
+                    pass
+                elapsed = time.perf_counter() - start_time
+                print(f"{split_name}: {len(store)} patches {store.class_counts()}, one shuffled epoch in "
+                      f"{elapsed:.2f}s ({len(store) / max(elapsed, 1e-9):.0f} patches/sec)")
+        elif args.command == 'evaluate':
+            from inference import ParkingPipeline
+            store = PatchStore(args.store, args.split)
+            results = evaluate_stage2(ParkingPipeline(backend=args.backend), store, args.threshold)
+            print(f"{args.split}: {results['patches']} patches, accuracy {results['accuracy'] * 100:.2f}%, "
+                  f"false occupied: {results['false_occupied']}, false empty: {results['false_empty']}")
+    except RuntimeError as e:
+        print(e)
+        exit()
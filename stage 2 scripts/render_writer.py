@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+import cv2
+
+from instrumentation import DISABLED_INSTRUMENTATION
+
+# ---------------------- CONFIG ------------------------
+RENDER_MODES = ['off', 'sampled', 'always']
+RENDER_WORKERS = 2        # cv2 drawing and JPEG encoding release the GIL, so threads run them in parallel
+RENDER_QUEUE_SIZE = 16    # Max frames waiting to be rendered
+
+_STOP = None
+
+def should_render(render_mode, frame_index, render_every_n_frames=1):
+    """
+    'off' never renders, 'always' renders every frame and 'sampled' renders every Nth frame (starting with the first).
+    """
+    if render_mode == 'always':
+        return True
+    if render_mode == 'sampled':
+        return frame_index % max(1, render_every_n_frames) == 0
+    if render_mode == 'off':
+        return False
+    raise ValueError(f"Unknown render mode '{render_mode}', expected one of {RENDER_MODES}")
+
+# ---------------------- BACKGROUND WRITER ------------------------
+class BackgroundImageWriter:
+    """
+    Pool of threads that draw overlays and write the annotated images, so the caller's
+    detection loop only pays for putting the frame on a bounded queue.
+
+    `submit(draw_fn, image, draw_args, output_path)` queues one job; a worker calls
+    `draw_fn(image, *draw_args)` and writes the returned image to `output_path`.
+    The image must not be modified by the caller afterwards. When the queue is full,
+    `submit` waits for room (block_when_full=True, nothing is lost) or discards the
+    job and counts it in `dropped` (block_when_full=False, for live streams).
+    """
+
+    def __init__(self, num_workers=RENDER_WORKERS, max_queue_size=RENDER_QUEUE_SIZE, block_when_full=True,
+                 instrumentation=None):
+        self.jobs = queue.Queue(maxsize=max_queue_size)
+        self.block_when_full = block_when_full
+        self.instrumentation = instrumentation or DISABLED_INSTRUMENTATION
+        self.stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.workers = [threading.Thread(target=self._run, name=f'render-writer-{i}', daemon=True)
+                        for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, draw_fn, image, draw_args, output_path):
+        job = (draw_fn, image, draw_args, output_path)
+        if self.block_when_full:
+            self.jobs.put(job)
+            return True
+        try:
+            self.jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is _STOP:
+                return
+            draw_fn, image, draw_args, output_path = job
+            try:
+                with self.instrumentation.stage('draw'):
+                    annotated_image = draw_fn(image, *draw_args) if draw_fn is not None else image
+                os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+                with self.instrumentation.stage('encode_write'):
+                    if not cv2.imwrite(output_path, annotated_image):
+                        raise IOError(f"cv2.imwrite failed for {output_path}")
+                with self.stats_lock:
+                    self.written += 1
+            except Exception as e:
+                print(f"  Render/write failed for {output_path}: {e}")
+                with self.stats_lock:
+                    self.failed += 1
+
+    def close(self):
+        """
+        Waits for every queued job to finish and stops the workers.
+        """
+        for _ in self.workers:
+            self.jobs.put(_STOP)
+        for worker in self.workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ---------------------- CONFIG ------------------------
+RESULT_CACHE_PATH = os.path.join('csv_output', 'result_cache.sqlite')
+RESULT_CACHE_MAX_ENTRIES = 100000
+RESULT_CACHE_VERSION = 1   # Bump when pre/post-processing changes in a way that alters results for the same models
+HASH_CHUNK_BYTES = 1 << 20
+
+# ---------------------- HASHING ------------------------
+def hash_bytes(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+_file_hash_memo = {}
+_file_hash_lock = threading.Lock()
+
+def hash_file(path):
+    """
+    Content hash of a model file, recomputed only when its size or mtime changes.
+    """
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    with _file_hash_lock:
+        memo = _file_hash_memo.get(path)
+        if memo is not None and memo[0] == signature:
+            return memo[1]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    file_hash = digest.hexdigest()
+    with _file_hash_lock:
+        _file_hash_memo[path] = (signature, file_hash)
+    return file_hash
+
+# ---------------------- CACHE ------------------------
+class ResultCache:
+    """
+    On-disk cache of detected_slots_info keyed by a hash of the encoded image bytes,
+    the content hashes of both model files and the thresholds.
+
+    Model hashes are checked (by size/mtime, rehashing only on change) on every key, so
+    replacing best.pt or the .h5 makes old entries unreachable; they are purged when the
+    cache is opened with different models and otherwise age out through LRU eviction
+    once `max_entries` is exceeded.
+    """
+
+    def __init__(self, db_path=RESULT_CACHE_PATH, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                cache_key TEXT PRIMARY KEY,
+                models_key TEXT,
+                slots_json TEXT,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access);
+        """)
+        self.connection.commit()
+        self.entry_count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        self.purged_models_key = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.purged = 0
+
+    def models_key(self, stage1_model_path, stage2_model_path, backend='', calibration=None, stage1_settings=None):
+        """
+        Key of everything besides the image and thresholds that changes the results: the backend, both
+        model files, the Stage 2 calibration and `stage1_settings` (the tiling geometry when tiling is on).
+        A new key purges the entries stored under any other key.
+        """
+        key_text = f"{RESULT_CACHE_VERSION}|{backend}|{hash_file(stage1_model_path)}|{hash_file(stage2_model_path)}"
+        if stage1_settings is not None:
+            # Tiling changes which boxes Stage 1 finds
+            key_text += f"|stage1:{stage1_settings}"
+        if calibration is not None:
+            # Calibrated scores can flip statuses at a fixed threshold
+            key_text += f"|{calibration['scale']!r},{calibration['bias']!r}"
+        models_key = hash_bytes(key_text.encode('utf-8'))
+        if models_key != self.purged_models_key:
+            self._purge_other_models(models_key)
+        return models_key
+
+    def make_key(self, image_bytes, models_key, stage1_conf, stage2_occupied_threshold):
+        return hash_bytes(image_bytes) + hash_bytes(
+            f"{models_key}|{stage1_conf!r}|{stage2_occupied_threshold!r}".encode('utf-8'))
+
+    def _purge_other_models(self, models_key):
+        with self.lock, self.connection:
+            purged = self.connection.execute("DELETE FROM results WHERE models_key != ?", (models_key,)).rowcount
+            self.purged += purged
+            self.entry_count -= purged
+            self.purged_models_key = models_key
+
+    def get(self, cache_key):
+        """
+        Returns the cached detected_slots_info, or None on a miss.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT slots_json FROM results WHERE cache_key = ?", (cache_key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE results SET last_access = ? WHERE cache_key = ?",
+                                        (time.time(), cache_key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, cache_key, models_key, detected_slots_info):
+        with self.lock, self.connection:
+            inserted = self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (cache_key, models_key, json.dumps(detected_slots_info), time.time())).rowcount
+            self.entry_count += inserted
+            if self.entry_count > self.max_entries:
+                # Evict the least recently used tenth, so eviction does not run on every insert
+                evict_count = self.entry_count - self.max_entries + max(1, self.max_entries // 10)
+                evicted = self.connection.execute("""
+                    DELETE FROM results WHERE cache_key IN (
+                        SELECT cache_key FROM results ORDER BY last_access LIMIT ?)
+                """, (evict_count,)).rowcount
+                self.evictions += evicted
+                self.entry_count = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def print_summary(self):
+        print("--- Result Cache ---")
+        print(f"  Lookups: {self.hits + self.misses}, hits: {self.hits}, misses: {self.misses} "
+              f"(hit rate {self.hit_rate() * 100:.1f}%)")
+        print(f"  Entries: {self.entry_count}/{self.max_entries}, evicted: {self.evictions}, "
+              f"purged after model change: {self.purged}")
+
+    def close(self):
+        self.connection.close()
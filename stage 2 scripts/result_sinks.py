@@ -0,0 +1,256 @@
+import csv
+import os
+import sqlite3
+import time
+
+from inference import count_slot_statuses
+
+# ---------------------- CONFIG ------------------------
+SUMMARY_CSV_FIELDNAMES = ['Image Name', 'Total Detected Slots', 'Occupied Slots', 'Available Slots']
+SQLITE_BATCH_FRAMES = 64         # Frames buffered before one SQLite transaction
+PARQUET_BATCH_SLOT_ROWS = 50000  # Slot rows buffered before a Parquet part file is written
+SINK_NAMES = ['csv', 'sqlite', 'parquet', 'timeseries']
+
+# ---------------------- BASE ------------------------
+class ResultSink:
+    """
+    Destination for pipeline results. `write_frame` receives one frame record
+    ({'frame_name', 'camera_id', 'timestamp'}) and that frame's detected_slots_info;
+    sinks buffer records and write them in batches, `flush()` forces the buffer out
+    and `close()` flushes and releases the file.
+    """
+
+    def write_frame(self, frame_record, detected_slots_info):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+def slot_rows(frame_id, detected_slots_info):
+    """
+    Flattens detected_slots_info into (frame_id, slot_index, x1, y1, x2, y2, confidence, score, status, slot_id)
+    rows. slot_id is the persistent id from a SlotRegistry, or None when slots are not tracked.
+    """
+    rows = []
+    for slot_index, slot in enumerate(detected_slots_info):
+        x1, y1, x2, y2 = slot['box']
+        rows.append((frame_id, slot_index, int(x1), int(y1), int(x2), int(y2),
+                     slot.get('confidence'), slot.get('score'), slot['status'], slot.get('slot_id')))
+    return rows
+
+# ---------------------- CSV (PER-FRAME SUMMARY) ------------------------
+class CsvSummarySink(ResultSink):
+    """
+    The original per-image summary CSV, written row by row instead of at the end of the run.
+    The file is only created once the first frame arrives.
+    """
+
+    def __init__(self, csv_path, flush_every_n_frames=1):
+        self.csv_path = csv_path
+        self.flush_every_n_frames = flush_every_n_frames
+        self.csvfile = None
+        self.writer = None
+        self.frames_written = 0
+
+    def write_frame(self, frame_record, detected_slots_info):
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.csv_path) or '.', exist_ok=True)
+            self.csvfile = open(self.csv_path, 'w', newline='')
+            self.writer = csv.DictWriter(self.csvfile, fieldnames=SUMMARY_CSV_FIELDNAMES)
+            self.writer.writeheader()
+        occupied_count, empty_count = count_slot_statuses(detected_slots_info)
+        self.writer.writerow({
+            'Image Name': frame_record['frame_name'],
+            'Total Detected Slots': occupied_count + empty_count,
+            'Occupied Slots': occupied_count,
+            'Available Slots': empty_count
+        })
+        self.frames_written += 1
+        if self.frames_written % self.flush_every_n_frames == 0:
+            self.flush()
+
+    def flush(self):
+        if self.csvfile is not None:
+            self.csvfile.flush()
+
+    def close(self):
+        if self.csvfile is not None:
+            self.csvfile.close()
+            self.csvfile = None
+
+# ---------------------- SQLITE ------------------------
+class SqliteSink(ResultSink):
+    """
+    Per-frame and per-slot records in SQLite, committed once per `batch_frames` frames.
+    Tables: frames(frame_id, frame_name, camera_id, timestamp, total_slots, occupied_slots, available_slots)
+    and slots(frame_id, slot_index, x1, y1, x2, y2, confidence, score, status, slot_id), where slot_id
+    is the persistent SlotRegistry id (NULL when slots are not tracked).
+    """
+
+    def __init__(self, db_path, batch_frames=SQLITE_BATCH_FRAMES):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.batch_frames = batch_frames
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frames (
+                frame_id INTEGER PRIMARY KEY,
+                frame_name TEXT,
+                camera_id TEXT,
+                timestamp REAL,
+                total_slots INTEGER,
+                occupied_slots INTEGER,
+                available_slots INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS slots (
+                frame_id INTEGER,
+                slot_index INTEGER,
+                x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+                confidence REAL,
+                score REAL,
+                status TEXT,
+                slot_id INTEGER,
+                PRIMARY KEY (frame_id, slot_index)
+            );
+        """)
+        # Databases created before slot_id existed get the column appended (NULL for their old rows)
+        slot_columns = [row[1] for row in self.connection.execute("PRAGMA table_info(slots)")]
+        if 'slot_id' not in slot_columns:
+            self.connection.execute("ALTER TABLE slots ADD COLUMN slot_id INTEGER")
+        self.connection.commit()
+        self.next_frame_id = self.connection.execute("SELECT COALESCE(MAX(frame_id), 0) + 1 FROM frames").fetchone()[0]
+        self.pending_frames = []
+        self.pending_slots = []
+
+    def write_frame(self, frame_record, detected_slots_info):
+        frame_id = self.next_frame_id
+        self.next_frame_id += 1
+        occupied_count, empty_count = count_slot_statuses(detected_slots_info)
+        self.pending_frames.append((frame_id, frame_record['frame_name'], frame_record.get('camera_id'),
+                                    frame_record.get('timestamp', time.time()),
+                                    occupied_count + empty_count, occupied_count, empty_count))
+        self.pending_slots.extend(slot_rows(frame_id, detected_slots_info))
+        if len(self.pending_frames) >= self.batch_frames:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_frames:
+            return
+        with self.connection:
+            self.connection.executemany("INSERT INTO frames VALUES (?, ?, ?, ?, ?, ?, ?)", self.pending_frames)
+            self.connection.executemany("INSERT INTO slots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.pending_slots)
+        self.pending_frames = []
+        self.pending_slots = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+# ---------------------- PARQUET ------------------------
+class ParquetSink(ResultSink):
+    """
+    Columnar per-frame and per-slot records. Every flush writes one complete
+    frames-NNNNN.parquet / slots-NNNNN.parquet pair into `output_dir`, so a crash
+    loses at most the current buffer; read all slots-*.parquet (or frames-*.parquet)
+    files together as one dataset. Requires pyarrow.
+    """
+
+    def __init__(self, output_dir, batch_slot_rows=PARQUET_BATCH_SLOT_ROWS):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("The Parquet sink requires pyarrow (pip install pyarrow)") from e
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.batch_slot_rows = batch_slot_rows
+        existing_parts = [f for f in os.listdir(output_dir) if f.startswith('frames-') and f.endswith('.parquet')]
+        self.next_part = len(existing_parts)
+        self.next_frame_id = 0
+        self.run_id = int(time.time() * 1000)
+        self.frame_columns = {name: [] for name in ['run_id', 'frame_id', 'frame_name', 'camera_id', 'timestamp',
+                                                    'total_slots', 'occupied_slots', 'available_slots']}
+        self.slot_columns = {name: [] for name in ['run_id', 'frame_id', 'slot_index', 'x1', 'y1', 'x2', 'y2',
+                                                   'confidence', 'score', 'status', 'slot_id']}
+
+    def write_frame(self, frame_record, detected_slots_info):
+        frame_id = self.next_frame_id
+        self.next_frame_id += 1
+        occupied_count, empty_count = count_slot_statuses(detected_slots_info)
+        frame_values = [self.run_id, frame_id, frame_record['frame_name'], frame_record.get('camera_id'),
+                        frame_record.get('timestamp', time.time()),
+                        occupied_count + empty_count, occupied_count, empty_count]
+        for column, value in zip(self.frame_columns.values(), frame_values):
+            column.append(value)
+        for row in slot_rows(frame_id, detected_slots_info):
+            for column, value in zip(self.slot_columns.values(), (self.run_id,) + row):
+                column.append(value)
+        if len(self.slot_columns['frame_id']) >= self.batch_slot_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.frame_columns['frame_id']:
+            return
+        part_name = f"{self.next_part:05d}.parquet"
+        self.pq.write_table(self.pa.table(self.frame_columns), os.path.join(self.output_dir, f"frames-{part_name}"))
+        # slot_id is typed explicitly so parts from untracked runs (all None) keep the same schema
+        slot_table = self.pa.table({name: self.pa.array(values, type=self.pa.int64() if name == 'slot_id' else None)
+                                    for name, values in self.slot_columns.items()})
+        self.pq.write_table(slot_table, os.path.join(self.output_dir, f"slots-{part_name}"))
+        self.next_part += 1
+        for column in list(self.frame_columns.values()) + list(self.slot_columns.values()):
+            column.clear()
+
+# ---------------------- FAN-OUT ------------------------
+class MultiSink(ResultSink):
+    """
+    Sends every frame to several sinks.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write_frame(self, frame_record, detected_slots_info):
+        for sink in self.sinks:
+            sink.write_frame(frame_record, detected_slots_info)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def create_sink(sink_names, csv_path, sqlite_path, parquet_dir, timeseries_path=None):
+    """
+    Builds a MultiSink from names in SINK_NAMES, e.g. ['csv', 'sqlite'].
+    """
+    sinks = []
+    for sink_name in sink_names:
+        if sink_name == 'csv':
+            sinks.append(CsvSummarySink(csv_path))
+        elif sink_name == 'sqlite':
+            sinks.append(SqliteSink(sqlite_path))
+        elif sink_name == 'parquet':
+            sinks.append(ParquetSink(parquet_dir))
+        elif sink_name == 'timeseries':
+            from occupancy_store import OccupancyStore
+            sinks.append(OccupancyStore(timeseries_path) if timeseries_path else OccupancyStore())
+        else:
+            raise ValueError(f"Unknown output sink '{sink_name}', expected one of {SINK_NAMES}")
+    return MultiSink(sinks)
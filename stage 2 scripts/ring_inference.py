@@ -0,0 +1,281 @@
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import queue
+import time
+
+from frame_ring import SharedFrameRing, RING_SLOTS, MAX_FRAME_SHAPE
+
+# NOTE: as in parallel_inference.py, the pipeline is only built inside the worker processes
+# (after their thread limits are set). Frames reach the workers through a shared-memory ring
+# (frame_ring.py), so only small result records are pickled between processes.
+
+# ---------------------- CONFIG ------------------------
+STREAM_SOURCES = ['test_video.mp4']  # Video files, RTSP URLs, camera indexes or frame directories
+OUTPUT_VISUALIZATION_DIR = 'test_results_creative/ring'
+OUTPUT_CSV_DIR = 'csv_output'
+OUTPUT_RING_CSV_PATH = os.path.join(OUTPUT_CSV_DIR, 'ring_parking_summary_creative.csv')
+
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+NUM_WORKERS = 2                      # Inference processes reading from the ring
+BACKEND = 'native'                   # 'native' or 'onnx', see inference_backends.py
+RENDER_MODE = 'off'                  # 'off', 'sampled' (every RENDER_EVERY_N_FRAMES) or 'always'
+RENDER_EVERY_N_FRAMES = 50
+SIMULATE_REALTIME = True             # Pace local video files at their native FPS
+RESULT_TIMEOUT_S = 1.0               # How often the parent checks that the workers are alive while it waits
+
+# ---------------------- DECODER PROCESSES ------------------------
+def decoder_process(ring, source, source_index, simulate_realtime):
+    """
+    Decodes one source into the ring; each frame is copied once, into its shared slot. The
+    parent closes this writer in the ring once the process has exited (see close_exited_decoders),
+    so a decoder that dies mid-stream cannot leave the workers waiting for frames.
+    """
+    from stream_inference import iter_frames
+    try:
+        for frame_index, frame in enumerate(iter_frames(source, simulate_realtime)):
+            ring.write(frame, capture_time=time.time(), source_index=source_index, frame_index=frame_index)
+    except ValueError as e:
+        print(f"Decoder for '{source}' stopped: {e}")
+    finally:
+        ring.close()
+
+# ---------------------- INFERENCE PROCESSES ------------------------
+def process_lease(pipeline, lease, layout_cache, render, stage1_conf, stage2_occupied_threshold):
+    """
+    Runs both stages on the leased frame in place. Returns (annotated copy or None, record); no
+    reference to the shared frame survives this call, so the lease can be released right after.
+    """
+    result_image, detected_slots_info, occupied_count, empty_count = pipeline.predict(
+        lease.frame, stage1_conf=stage1_conf, stage2_occupied_threshold=stage2_occupied_threshold,
+        layout_cache=layout_cache, render=render)
+    record = {
+        'source_index': lease.source_index,
+        'frame_index': lease.frame_index,
+        'sequence': lease.sequence,
+        'occupied': occupied_count,
+        'empty': empty_count,
+        'latency_ms': (time.time() - lease.capture_time) * 1000.0,
+    }
+    return (result_image if render and detected_slots_info is not None else None), record
+
+def worker_process(ring, result_queue, worker_index, threads_per_worker, backend, sources, render_mode,
+                   render_every_n_frames, output_dir, stage1_conf, stage2_occupied_threshold):
+    """
+    Always ends by posting ('done', busy_seconds) or ('error', message), so the parent never waits on a dead worker.
+    """
+    busy_seconds = 0.0
+    try:
+        import parallel_inference
+        parallel_inference.init_worker(threads_per_worker, backend)
+        import cv2
+        from render_writer import should_render
+        from slot_layout_cache import SlotLayoutCache
+
+        pipeline = parallel_inference.worker_pipeline
+        layout_caches = {}
+        result_queue.put(('ready', worker_index, None))
+        while True:
+            lease = ring.read()
+            if lease is None:
+                break
+            start = time.perf_counter()
+            render = should_render(render_mode, lease.frame_index, render_every_n_frames)
+            if lease.source_index not in layout_caches:
+                layout_caches[lease.source_index] = SlotLayoutCache(camera_id=sources[lease.source_index])
+            with lease:
+                annotated_image, record = process_lease(pipeline, lease, layout_caches[lease.source_index], render,
+                                                        stage1_conf, stage2_occupied_threshold)
+            # The slot is already back in the ring; only the rendered copy is written from here
+            if annotated_image is not None:
+                cv2.imwrite(os.path.join(output_dir, f"source{record['source_index']}_frame{record['frame_index']:06d}"
+                                                     f"_creative_occupancy.jpg"), annotated_image)
+            record['rendered'] = annotated_image is not None
+            record['worker'] = worker_index
+            busy_seconds += time.perf_counter() - start
+            result_queue.put(('frame', worker_index, record))
+    except Exception as e:
+        result_queue.put(('error', worker_index, f"Ring worker {worker_index} failed: {e}"))
+    else:
+        result_queue.put(('done', worker_index, busy_seconds))
+    finally:
+        ring.close()
+
+# ---------------------- PARENT SIDE ------------------------
+def close_exited_decoders(ring, decoders, closed_decoders):
+    """
+    Calls `ring.writer_done()` once for every decoder that has exited, whether it finished its
+    source or crashed, so the workers see end of stream once every decoder is gone.
+    """
+    for i, decoder in enumerate(decoders):
+        # exitcode stays None until a started process has exited
+        if i in closed_decoders or decoder.exitcode is None:
+            continue
+        closed_decoders.add(i)
+        ring.writer_done()
+        if decoder.exitcode != 0:
+            print(f"Warning: {decoder.name} exited with code {decoder.exitcode}; closing its source")
+
+def next_message(result_queue, workers, finished_workers, on_idle=None):
+    """
+    Returns the next (message_type, worker_index, payload) from the workers. Raises RuntimeError
+    for an 'error' message or when a worker that has not finished exits without reporting.
+    `on_idle` is called whenever no message arrived within RESULT_TIMEOUT_S.
+    """
+    while True:
+        try:
+            message = result_queue.get(timeout=RESULT_TIMEOUT_S)
+        except queue.Empty:
+            if on_idle is not None:
+                on_idle()
+            dead_workers = [worker for i, worker in enumerate(workers)
+                            if i not in finished_workers and not worker.is_alive()]
+            if not dead_workers:
+                continue
+            # A worker may have posted its last message just before exiting
+            try:
+                message = result_queue.get(timeout=RESULT_TIMEOUT_S)
+            except queue.Empty:
+                raise RuntimeError("Error: " + ", ".join(f"{worker.name} exited (code {worker.exitcode})"
+                                                         for worker in dead_workers) + " without reporting")
+        if message[0] == 'error':
+            raise RuntimeError(message[2])
+        return message
+
+def run_ring(sources, num_workers=NUM_WORKERS, csv_path=OUTPUT_RING_CSV_PATH, output_dir=OUTPUT_VISUALIZATION_DIR,
+             ring_slots=RING_SLOTS, max_frame_shape=MAX_FRAME_SHAPE, backend=BACKEND, render_mode=RENDER_MODE,
+             render_every_n_frames=RENDER_EVERY_N_FRAMES, simulate_realtime=SIMULATE_REALTIME,
+             stage1_conf=STAGE1_CONF, stage2_occupied_threshold=STAGE2_OCCUPIED_THRESHOLD):
+    """
+    Starts `num_workers` inference processes, waits until their models are loaded, then starts
+    one decoder process per source. Writes one CSV row per processed frame and prints ring
+    drop counts, latency and how many frames were copied for rendering.
+    """
+    import numpy as np
+
+    context = mp.get_context('spawn')
+    ring = SharedFrameRing(num_slots=ring_slots, max_frame_shape=max_frame_shape, num_writers=len(sources),
+                           context=context)
+    result_queue = context.Queue()
+    threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+    if render_mode != 'off':
+        os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+
+    workers = [context.Process(target=worker_process, name=f'ring-worker-{i}',
+                               args=(ring, result_queue, i, threads_per_worker, backend, sources, render_mode,
+                                     render_every_n_frames, output_dir, stage1_conf, stage2_occupied_threshold))
+               for i in range(num_workers)]
+    decoders = [context.Process(target=decoder_process, name=f'ring-decoder-{i}',
+                                args=(ring, source, i, simulate_realtime))
+                for i, source in enumerate(sources)]
+    for worker in workers:
+        worker.start()
+
+    latencies_ms = []
+    rendered = 0
+    busy_seconds = 0.0
+    finished_workers = set()
+    closed_decoders = set()
+    fieldnames = ['Source', 'Frame Index', 'Sequence', 'Worker', 'Total Detected Slots', 'Occupied Slots',
+                  'Available Slots', 'Latency ms']
+    try:
+        # Decoders only start once every model is loaded, so no frames are dropped during warm-up
+        for _ in range(num_workers):
+            next_message(result_queue, workers, finished_workers)
+        start = time.perf_counter()
+        for decoder in decoders:
+            decoder.start()
+
+        with open(csv_path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer.writeheader()
+            while len(finished_workers) < num_workers:
+                close_exited_decoders(ring, decoders, closed_decoders)
+                message_type, worker_index, payload = next_message(
+                    result_queue, workers, finished_workers,
+                    on_idle=lambda: close_exited_decoders(ring, decoders, closed_decoders))
+                if message_type == 'done':
+                    finished_workers.add(worker_index)
+                    busy_seconds += payload
+                    continue
+                latencies_ms.append(payload['latency_ms'])
+                rendered += payload['rendered']
+                writer.writerow({
+                    'Source': sources[payload['source_index']],
+                    'Frame Index': payload['frame_index'],
+                    'Sequence': payload['sequence'],
+                    'Worker': payload['worker'],
+                    'Total Detected Slots': payload['occupied'] + payload['empty'],
+                    'Occupied Slots': payload['occupied'],
+                    'Available Slots': payload['empty'],
+                    'Latency ms': f"{payload['latency_ms']:.1f}"
+                })
+    except RuntimeError as e:
+        # One failed worker aborts the whole run instead of leaving the others waiting on the ring
+        print(e)
+        for process in workers + decoders:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        ring.close()
+        return None
+    wall_time_s = time.perf_counter() - start
+    for process in decoders + workers:
+        process.join()
+    ring_stats = ring.stats()
+    frame_mb = int(np.prod(max_frame_shape)) / 1e6
+    ring.close()
+
+    print("\n--- Shared-Memory Ring Summary ---")
+    print(f"Ring:             {ring_slots} slots of up to {max_frame_shape[1]}x{max_frame_shape[0]} "
+          f"({ring_slots * frame_mb:.1f} MB shared)")
+    print(f"Frames written:   {ring_stats['written']} from {len(sources)} source(s)")
+    print(f"Frames processed: {ring_stats['read']} by {num_workers} worker(s)")
+    print(f"Frames dropped:   {ring_stats['dropped']} (oldest unread frame overwritten when the ring was full)")
+    print(f"Frames copied for rendering: {rendered}")
+    if wall_time_s > 0:
+        print(f"Throughput:       {ring_stats['read'] / wall_time_s:.2f} frames/s over {wall_time_s:.1f}s "
+              f"(worker busy time {busy_seconds:.1f}s)")
+    if latencies_ms:
+        values = np.asarray(latencies_ms)
+        print(f"{'End-to-end latency ms:':<24} p50 {np.percentile(values, 50):8.1f}  "
+              f"p95 {np.percentile(values, 95):8.1f}  max {values.max():8.1f}")
+    print(f"Per-frame summary saved to: {csv_path}")
+    return ring_stats
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Decode and infer in separate processes joined by a shared-memory "
+                                                 "frame ring.")
+    parser.add_argument('sources', nargs='*', default=STREAM_SOURCES,
+                        help="Video files, RTSP URLs, camera indexes or frame directories")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--ring-slots', type=int, default=RING_SLOTS)
+    parser.add_argument('--max-frame', default=f"{MAX_FRAME_SHAPE[1]}x{MAX_FRAME_SHAPE[0]}",
+                        help="Largest frame size as WIDTHxHEIGHT; sets the size of every ring slot")
+    parser.add_argument('--backend', default=BACKEND, choices=['native', 'onnx'])
+    parser.add_argument('--render-mode', default=RENDER_MODE, choices=['off', 'sampled', 'always'],
+                        help="Which frames are copied, annotated and written as JPEGs")
+    parser.add_argument('--render-every', type=int, default=RENDER_EVERY_N_FRAMES)
+    parser.add_argument('--csv', default=OUTPUT_RING_CSV_PATH, help="Per-frame summary CSV")
+    parser.add_argument('--no-realtime', action='store_true', help="Decode local files as fast as possible")
+    args = parser.parse_args()
+
+    for source in args.sources:
+        if not (os.path.exists(source) or source.isdigit() or '://' in source):
+            print(f"Error: Stream source '{source}' not found.")
+            exit()
+    try:
+        max_width, max_height = (int(v) for v in args.max_frame.lower().split('x'))
+    except ValueError:
+        print(f"Error: --max-frame must look like 1920x1080, got '{args.max_frame}'")
+        exit()
+
+    print(f"Streaming {len(args.sources)} source(s) through a {args.ring_slots}-slot shared-memory ring "
+          f"to {args.workers} worker(s)")
+    run_ring(args.sources, num_workers=args.workers, csv_path=args.csv, ring_slots=args.ring_slots,
+             max_frame_shape=(max_height, max_width, 3), backend=args.backend, render_mode=args.render_mode,
+             render_every_n_frames=args.render_every, simulate_realtime=not args.no_realtime)
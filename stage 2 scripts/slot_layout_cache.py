@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+
+# ---------------------- CONFIG ------------------------
+LAYOUT_THUMBNAIL_WIDTH = 160       # Width of the grayscale thumbnail used for scene-change checks
+REDETECT_EVERY_N_FRAMES = 300      # Scheduled Stage 1 refresh, even if the scene looks unchanged (0 = never)
+SCENE_DIFF_THRESHOLD = 30.0        # Mean absolute gray-level difference (0-255) that counts as a new scene
+MAX_CAMERA_SHIFT_PX = 1.5          # Phase-correlation shift (thumbnail pixels) that counts as a camera move
+
+# ---------------------- SCENE-CHANGE HELPERS ------------------------
+def make_layout_thumbnail(image, thumbnail_width=LAYOUT_THUMBNAIL_WIDTH):
+    """
+    Downscales a BGR frame to a small float32 grayscale thumbnail for cheap global comparisons.
+    """
+    h_img, w_img = image.shape[:2]
+    thumbnail_height = max(1, int(round(h_img * thumbnail_width / float(w_img))))
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    thumbnail = cv2.resize(gray, (thumbnail_width, thumbnail_height), interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.float32)
+
+def estimate_camera_shift(reference_thumbnail, current_thumbnail, hanning_window=None):
+    """
+    Estimates the global translation between two thumbnails with phase correlation.
+    Returns the shift magnitude in thumbnail pixels.
+    """
+    (shift_x, shift_y), _ = cv2.phaseCorrelate(reference_thumbnail, current_thumbnail, hanning_window)
+    return float(np.hypot(shift_x, shift_y))
+
+# ---------------------- LAYOUT CACHE ------------------------
+class SlotLayoutCache:
+    """
+    Per-camera cache of Stage 1 slot boxes for static cameras.
+
+    Stage 1 is rerun only on the first frame, every `redetect_every_n_frames` frames,
+    or when the frame differs globally from the one the layout was detected on
+    (large mean gray-level change or an estimated camera shift).
+    """
+
+    def __init__(self, camera_id='default', redetect_every_n_frames=REDETECT_EVERY_N_FRAMES,
+                 scene_diff_threshold=SCENE_DIFF_THRESHOLD, max_camera_shift_px=MAX_CAMERA_SHIFT_PX,
+                 thumbnail_width=LAYOUT_THUMBNAIL_WIDTH):
+        self.camera_id = camera_id
+        self.redetect_every_n_frames = redetect_every_n_frames
+        self.scene_diff_threshold = scene_diff_threshold
+        self.max_camera_shift_px = max_camera_shift_px
+        self.thumbnail_width = thumbnail_width
+
+        self.boxes = None
+        self.confidences = None
+        self.reference_thumbnail = None
+        self.hanning_window = None
+        self.frames_since_detection = 0
+
+        # Counters for summary
+        self.frames_seen = 0
+        self.detections_run = 0
+        self.redetect_reasons = {'initial': 0, 'schedule': 0, 'scene_change': 0, 'camera_shift': 0, 'resolution': 0}
+        self.current_redetect_reason = None
+
+    def invalidate(self):
+        self.boxes = None
+        self.confidences = None
+        self.reference_thumbnail = None
+
+    def _redetect_reason(self, current_thumbnail):
+        if self.boxes is None:
+            return 'initial'
+        if current_thumbnail.shape != self.reference_thumbnail.shape:
+            return 'resolution'
+        if self.redetect_every_n_frames > 0 and self.frames_since_detection >= self.redetect_every_n_frames:
+            return 'schedule'
+        mean_abs_diff = float(np.mean(np.abs(current_thumbnail - self.reference_thumbnail)))
+        if mean_abs_diff > self.scene_diff_threshold:
+            return 'scene_change'
+        if self.max_camera_shift_px is not None:
+            shift_px = estimate_camera_shift(self.reference_thumbnail, current_thumbnail, self.hanning_window)
+            if shift_px > self.max_camera_shift_px:
+                return 'camera_shift'
+        return None
+
+    def get_layout(self, image, detect_fn):
+        """
+        Returns (boxes, confidences) for `image`, calling `detect_fn(image)` only when
+        the cached layout is missing, due for a refresh, or the view has moved.
+        """
+        self.frames_seen += 1
+        current_thumbnail = make_layout_thumbnail(image, self.thumbnail_width)
+        reason = self._redetect_reason(current_thumbnail)
+
+        if reason is None:
+            self.frames_since_detection += 1
+            return self.boxes, self.confidences
+
+        self.current_redetect_reason = reason
+        self.boxes, self.confidences = detect_fn(image)
+        self.current_redetect_reason = None
+        self.reference_thumbnail = current_thumbnail
+        self.hanning_window = cv2.createHanningWindow(
+            (current_thumbnail.shape[1], current_thumbnail.shape[0]), cv2.CV_32F)
+        self.frames_since_detection = 0
+        self.detections_run += 1
+        self.redetect_reasons[reason] += 1
+        return self.boxes, self.confidences
+
+    def known_layout(self):
+        """
+        While `detect_fn` runs for a scheduled refresh the view has not moved, so the previous
+        boxes still show where the slots are; tiled Stage 1 uses them to skip empty tiles.
+        Returns None for every other redetection reason.
+        """
+        return self.boxes if self.current_redetect_reason == 'schedule' else None
+
+    def hit_rate(self):
+        if self.frames_seen == 0:
+            return 0.0
+        return (self.frames_seen - self.detections_run) / float(self.frames_seen)
+
+    def print_summary(self):
+        print(f"Layout cache '{self.camera_id}': {self.frames_seen} frames, "
+              f"{self.detections_run} Stage 1 runs, hit rate {self.hit_rate() * 100:.1f}%")
+        print(f"  Redetection reasons: {self.redetect_reasons}")
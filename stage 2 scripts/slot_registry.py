@@ -0,0 +1,171 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+from inference import box_iou_matrix
+
+# ---------------------- CONFIG ------------------------
+MATCH_IOU_THRESHOLD = 0.3          # Minimum IoU between a known slot and a new box to be the same slot
+RETIRE_AFTER_MISSED_FRAMES = 30    # A slot unmatched for this many consecutive frames is retired
+BOX_SMOOTHING = 0.3                # Weight of the new box in the slot's running box (0 = frozen, 1 = latest box)
+STATUS_CONFIRM_FRAMES = 3          # Consecutive frames a new status must persist before the slot flips
+STATUS_SCORE_MARGIN = 0.15         # ...unless the score is at least this far past the threshold (flip at once)
+
+# ---------------------- ASSIGNMENT ------------------------
+def assign_by_iou(iou, min_iou=MATCH_IOU_THRESHOLD):
+    """
+    Returns matched (row, col) index arrays maximizing total IoU, keeping only pairs with IoU >= min_iou.
+    Uses the optimal Hungarian assignment from SciPy when installed; otherwise a greedy
+    highest-IoU-first matching, which gives the same result whenever slots do not overlap heavily.
+    """
+    if iou.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+    else:
+        candidates = np.flatnonzero(iou.ravel() >= min_iou)
+        candidates = candidates[np.argsort(-iou.ravel()[candidates], kind='stable')]
+        row_taken = np.zeros(iou.shape[0], dtype=bool)
+        col_taken = np.zeros(iou.shape[1], dtype=bool)
+        rows, cols = [], []
+        for row, col in zip(*np.unravel_index(candidates, iou.shape)):
+            if not row_taken[row] and not col_taken[col]:
+                row_taken[row] = col_taken[col] = True
+                rows.append(row)
+                cols.append(col)
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    keep = iou[rows, cols] >= min_iou
+    return rows[keep], cols[keep]
+
+# ---------------------- REGISTRY ------------------------
+class SlotRegistry:
+    """
+    Per-camera registry that gives every parking slot a persistent integer ID across frames.
+
+    `update(detected_slots_info, threshold)` matches the frame's Stage 1 boxes to the known
+    slots with an IoU matrix and an optimal assignment, sets slot['slot_id'] on every slot,
+    registers unmatched boxes as new slots and retires slots unmatched for
+    `retire_after_missed_frames` frames. Status changes go through hysteresis: the Stage 2
+    status is kept as slot['raw_status'] and slot['status'] only flips after
+    `status_confirm_frames` agreeing frames, or at once when the score is `status_score_margin`
+    past the threshold. `last_changes` lists the (slot_id, old_status, new_status) flips of the
+    latest frame, for diffing frames and alerting.
+
+    Known slot state is kept in parallel arrays/lists indexed by slot row.
+    """
+
+    def __init__(self, camera_id='default', match_iou_threshold=MATCH_IOU_THRESHOLD,
+                 retire_after_missed_frames=RETIRE_AFTER_MISSED_FRAMES, box_smoothing=BOX_SMOOTHING,
+                 status_confirm_frames=STATUS_CONFIRM_FRAMES, status_score_margin=STATUS_SCORE_MARGIN):
+        self.camera_id = camera_id
+        self.match_iou_threshold = match_iou_threshold
+        self.retire_after_missed_frames = retire_after_missed_frames
+        self.box_smoothing = box_smoothing
+        self.status_confirm_frames = status_confirm_frames
+        self.status_score_margin = status_score_margin
+
+        self.slot_ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.missed_frames = np.empty(0, dtype=np.int64)
+        self.statuses = []
+        self.pending_statuses = []
+        self.pending_frames = []
+        self.next_slot_id = 1
+        self.last_changes = []
+
+        # Counters for summary
+        self.frames_seen = 0
+        self.slots_created = 0
+        self.slots_retired = 0
+        self.status_changes = 0
+        self.flips_suppressed = 0
+
+    def __len__(self):
+        return len(self.slot_ids)
+
+    def _smoothed_status(self, row, raw_status, score, threshold):
+        current = self.statuses[row]
+        if raw_status == current:
+            self.pending_statuses[row], self.pending_frames[row] = None, 0
+            return current
+        confident = score is not None and abs(score - threshold) >= self.status_score_margin
+        if self.pending_statuses[row] == raw_status:
+            self.pending_frames[row] += 1
+        else:
+            self.pending_statuses[row], self.pending_frames[row] = raw_status, 1
+        if confident or self.pending_frames[row] >= self.status_confirm_frames:
+            self.statuses[row] = raw_status
+            self.pending_statuses[row], self.pending_frames[row] = None, 0
+            self.last_changes.append((int(self.slot_ids[row]), current, raw_status))
+            self.status_changes += 1
+            return raw_status
+        self.flips_suppressed += 1
+        return current
+
+    def update(self, detected_slots_info, stage2_occupied_threshold=0.7):
+        """
+        Assigns slot IDs and smoothed statuses to this frame's slots in place and returns the list.
+        """
+        self.frames_seen += 1
+        self.last_changes = []
+        new_boxes = np.array([slot['box'] for slot in detected_slots_info], dtype=np.float32).reshape(-1, 4)
+        rows, cols = assign_by_iou(box_iou_matrix(self.boxes, new_boxes), self.match_iou_threshold)
+
+        # Matched slots: smooth the box, reset the miss counter and apply hysteresis to the status
+        matched_rows = np.zeros(len(self.slot_ids), dtype=bool)
+        matched_rows[rows] = True
+        self.missed_frames[matched_rows] = 0
+        self.missed_frames[~matched_rows] += 1
+        if len(rows):
+            self.boxes[rows] += self.box_smoothing * (new_boxes[cols] - self.boxes[rows])
+        for row, col in zip(rows, cols):
+            slot = detected_slots_info[col]
+            slot['slot_id'] = int(self.slot_ids[row])
+            slot['raw_status'] = slot['status']
+            slot['status'] = self._smoothed_status(row, slot['status'], slot.get('score'), stage2_occupied_threshold)
+
+        # Unmatched boxes become new slots
+        matched_cols = np.zeros(len(new_boxes), dtype=bool)
+        matched_cols[cols] = True
+        new_cols = np.flatnonzero(~matched_cols)
+        if len(new_cols):
+            new_ids = np.arange(self.next_slot_id, self.next_slot_id + len(new_cols), dtype=np.int64)
+            self.next_slot_id += len(new_cols)
+            self.slot_ids = np.concatenate([self.slot_ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, new_boxes[new_cols]])
+            self.missed_frames = np.concatenate([self.missed_frames, np.zeros(len(new_cols), dtype=np.int64)])
+            for slot_id, col in zip(new_ids, new_cols):
+                slot = detected_slots_info[col]
+                slot['slot_id'] = int(slot_id)
+                slot['raw_status'] = slot['status']
+                self.statuses.append(slot['status'])
+                self.pending_statuses.append(None)
+                self.pending_frames.append(0)
+            self.slots_created += len(new_cols)
+
+        # Retire slots that have been missing for too long
+        retired = self.missed_frames > self.retire_after_missed_frames
+        if retired.any():
+            keep_rows = np.flatnonzero(~retired)
+            self.slot_ids = self.slot_ids[keep_rows]
+            self.boxes = self.boxes[keep_rows]
+            self.missed_frames = self.missed_frames[keep_rows]
+            self.statuses = [self.statuses[row] for row in keep_rows]
+            self.pending_statuses = [self.pending_statuses[row] for row in keep_rows]
+            self.pending_frames = [self.pending_frames[row] for row in keep_rows]
+            self.slots_retired += int(retired.sum())
+        return detected_slots_info
+
+    def slot_boxes(self):
+        """
+        {slot_id: smoothed xyxy box} of every active slot.
+        """
+        return {int(slot_id): [float(v) for v in box] for slot_id, box in zip(self.slot_ids, self.boxes)}
+
+    def print_summary(self):
+        print(f"Slot registry ({self.camera_id}): {len(self)} active slots after {self.frames_seen} frames, "
+              f"{self.slots_created} created, {self.slots_retired} retired, {self.status_changes} status changes, "
+              f"{self.flips_suppressed} slot-frames held back by hysteresis")
@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+
+# ---------------------- CONFIG ------------------------
+FINGERPRINT_SIZE = 16                # Slot crops are reduced to a FINGERPRINT_SIZE x FINGERPRINT_SIZE gray thumbnail
+FINGERPRINT_DIFF_THRESHOLD = 8.0     # Mean absolute gray-level difference (0-255) that triggers reclassification
+MAX_REUSE_FRAMES = 150               # Force a reclassification after this many reused frames (0 = no limit)
+
+# ---------------------- FINGERPRINTS ------------------------
+def compute_slot_fingerprints(slot_crops, fingerprint_size=FINGERPRINT_SIZE):
+    """
+    Returns an (N, size, size) float32 array of downsampled grayscale slot crops.
+    """
+    fingerprints = np.empty((len(slot_crops), fingerprint_size, fingerprint_size), dtype=np.float32)
+    for i, slot_crop in enumerate(slot_crops):
+        gray = cv2.cvtColor(slot_crop, cv2.COLOR_BGR2GRAY) if slot_crop.ndim == 3 else slot_crop
+        fingerprints[i] = cv2.resize(gray, (fingerprint_size, fingerprint_size), interpolation=cv2.INTER_AREA)
+    return fingerprints
+
+# ---------------------- INCREMENTAL CLASSIFIER ------------------------
+class SlotStatusCache:
+    """
+    Remembers the Stage 2 score of each slot together with the fingerprint of the crop
+    it was computed on. Only slots whose fingerprint moved by more than
+    `diff_threshold` (or whose cached score is older than `max_reuse_frames`) are
+    sent back to the classifier; every other slot reuses its cached score.
+
+    Slots are keyed by their box, which is stable when boxes come from a SlotLayoutCache.
+    """
+
+    def __init__(self, diff_threshold=FINGERPRINT_DIFF_THRESHOLD, max_reuse_frames=MAX_REUSE_FRAMES,
+                 fingerprint_size=FINGERPRINT_SIZE):
+        self.diff_threshold = diff_threshold
+        self.max_reuse_frames = max_reuse_frames
+        self.fingerprint_size = fingerprint_size
+
+        # slot key -> {'fingerprint': ..., 'score': ..., 'age': frames since last classification}
+        self.entries = {}
+
+        # Per-frame and running counters
+        self.last_reclassified_count = 0
+        self.last_reused_count = 0
+        self.total_reclassified = 0
+        self.total_reused = 0
+        self.frames_seen = 0
+
+    def clear(self):
+        self.entries = {}
+
+    def classify(self, slot_boxes, slot_crops, classify_fn):
+        """
+        Returns the Stage 2 scores for all slots, calling `classify_fn(crops)` only
+        on the subset of crops that changed since they were last classified.
+        """
+        scores = np.empty(len(slot_crops), dtype=np.float32)
+        if not slot_crops:
+            self.entries = {}
+            self.last_reclassified_count = 0
+            self.last_reused_count = 0
+            self.frames_seen += 1
+            return scores
+
+        fingerprints = compute_slot_fingerprints(slot_crops, self.fingerprint_size)
+        slot_keys = [tuple(int(v) for v in box) for box in slot_boxes]
+
+        indices_to_classify = []
+        for i, slot_key in enumerate(slot_keys):
+            entry = self.entries.get(slot_key)
+            if entry is None:
+                indices_to_classify.append(i)
+                continue
+            if self.max_reuse_frames > 0 and entry['age'] >= self.max_reuse_frames:
+                indices_to_classify.append(i)
+                continue
+            mean_abs_diff = float(np.mean(np.abs(fingerprints[i] - entry['fingerprint'])))
+            if mean_abs_diff > self.diff_threshold:
+                indices_to_classify.append(i)
+                continue
+            scores[i] = entry['score']
+
+        if indices_to_classify:
+            new_scores = classify_fn([slot_crops[i] for i in indices_to_classify])
+            for i, score in zip(indices_to_classify, new_scores):
+                scores[i] = score
+
+        # Rebuild the cache from the current frame so slots that disappeared are dropped
+        classified = set(indices_to_classify)
+        new_entries = {}
+        for i, slot_key in enumerate(slot_keys):
+            if i in classified:
+                new_entries[slot_key] = {'fingerprint': fingerprints[i], 'score': float(scores[i]), 'age': 0}
+            else:
+                entry = self.entries[slot_key]
+                entry['age'] += 1
+                new_entries[slot_key] = entry
+        self.entries = new_entries
+
+        self.last_reclassified_count = len(indices_to_classify)
+        self.last_reused_count = len(slot_crops) - len(indices_to_classify)
+        self.total_reclassified += self.last_reclassified_count
+        self.total_reused += self.last_reused_count
+        self.frames_seen += 1
+        return scores
+
+    def reuse_rate(self):
+        total = self.total_reclassified + self.total_reused
+        if total == 0:
+            return 0.0
+        return self.total_reused / float(total)
+
+    def print_summary(self):
+        print(f"Slot status cache: {self.frames_seen} frames, {self.total_reclassified} slots reclassified, "
+              f"{self.total_reused} reused ({self.reuse_rate() * 100:.1f}% reuse)")
@@ -1,10 +1,16 @@
 import os
+import csv
+import time
 import shutil
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # ---------------------- CONFIG ------------------------
 PATCHES_ROOT_DIR = '.'  # Root directory where PATCHES and LABELS folders exist
 CNRPARK_LABELS_DIR = os.path.join(PATCHES_ROOT_DIR, 'LABELS')
 OUTPUT_STAGE2_DATA_DIR = os.path.join(PATCHES_ROOT_DIR, 'sorted_patches')
+MANIFEST_FILENAME = 'manifest.csv'  # split,label,source,target for every patch, written in every mode
 
 # Mapping of CNRPark labels to folder names
 LABEL_TO_FOLDER = {
@@ -15,8 +21,162 @@ LABEL_TO_FOLDER = {
 # List of label split files to process
 SPLIT_FILES_TO_PROCESS = ['train.txt', 'val.txt', 'test.txt']
 
+# How patches are materialized:
+#   'hardlink' - no extra disk space, falls back to a copy when PATCHES is on another filesystem
+#   'symlink'  - no extra disk space, works across filesystems, breaks if PATCHES moves
+#   'copy'     - independent copies (the original behaviour)
+#   'manifest' - only writes the manifest, for loaders that read file lists
+MATERIALIZE_MODES = ['hardlink', 'symlink', 'copy', 'manifest']
+MATERIALIZE_MODE = 'hardlink'
+NUM_WORKERS = 16            # Link/copy calls are I/O bound, so threads overlap them well
+MAX_NOT_FOUND_MESSAGES = 5
+PROGRESS_EVERY_N_FILES = 10000
+
+# ---------------------- PLANNING ------------------------
+def read_split_plan(labels_dir, patches_dir, output_dir, split_files):
+    """
+    Parses the split label files into {target_path: (split_name, folder_name, source_path)}.
+    Later lines win when two patches map to the same target, as they did with serial copying.
+    """
+    plan = {}
+    for split_filename in split_files:
+        label_file_path = os.path.join(labels_dir, split_filename)
+        split_name = os.path.splitext(split_filename)[0]
+
+        if not os.path.exists(label_file_path):
+            print(f"\nWarning: Label file not found: '{label_file_path}'. Skipping this split.")
+            continue
+
+        print(f"Reading: {label_file_path} (split: {split_name})")
+        with open(label_file_path, 'r') as f_in:
+            for line_num, line in enumerate(f_in):
+                parts = line.strip().split()
+                if len(parts) != 2:
+                    print(f"  L{line_num+1} Warning: Malformed line. Skipping: '{line.strip()}'")
+                    continue
+
+                relative_patch_path, cnrpark_label = parts
+                # Skip unknown labels
+                if cnrpark_label not in LABEL_TO_FOLDER:
+                    print(f"  L{line_num+1} Warning: Unknown label '{cnrpark_label}'. Skipping.")
+                    continue
+
+                folder_name = LABEL_TO_FOLDER[cnrpark_label]
+                source_path = os.path.join(patches_dir, relative_patch_path)
+                target_path = os.path.join(output_dir, split_name, folder_name, os.path.basename(relative_patch_path))
+                plan[target_path] = (split_name, folder_name, source_path)
+    return plan
+
+def write_manifest(plan, manifest_path):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(['split', 'label', 'source', 'target'])
+        for target_path, (split_name, folder_name, source_path) in sorted(plan.items()):
+            writer.writerow([split_name, folder_name, source_path, target_path])
+    os.replace(tmp_path, manifest_path)
+
+# ---------------------- MATERIALIZING ------------------------
+def is_up_to_date(source_stat, source_path, target_path, mode):
+    """
+    True when the target already is what `mode` would produce for the source.
+    """
+    try:
+        if mode == 'symlink':
+            return os.path.islink(target_path) and os.readlink(target_path) == os.path.abspath(source_path)
+        target_stat = os.stat(target_path, follow_symlinks=False)
+    except OSError:
+        return False
+    if mode == 'hardlink' and (target_stat.st_ino, target_stat.st_dev) == (source_stat.st_ino, source_stat.st_dev):
+        return True
+    # Copies (including hardlink fallbacks) keep the source mtime via copy2
+    return (target_stat.st_size == source_stat.st_size and
+            int(target_stat.st_mtime) == int(source_stat.st_mtime) and
+            not os.path.islink(target_path))
+
+def materialize_one(source_path, target_path, mode):
+    """
+    Links or copies one patch. Returns 'skipped', 'linked', 'copied' or 'not_found'.
+    """
+    try:
+        source_stat = os.stat(source_path)
+    except FileNotFoundError:
+        return 'not_found'
+    if is_up_to_date(source_stat, source_path, target_path, mode):
+        return 'skipped'
+
+    if os.path.lexists(target_path):
+        os.unlink(target_path)
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(source_path), target_path)
+        return 'linked'
+    if mode == 'hardlink':
+        try:
+            os.link(source_path, target_path)
+            return 'linked'
+        except OSError:
+            pass  # Different filesystem or no hardlink support: copy instead
+    shutil.copy2(source_path, target_path)
+    return 'copied'
+
+def prune_stale_targets(plan, output_dir):
+    """
+    Removes files under the split/label folders that are no longer in the plan
+    (e.g. a patch moved from 'empty' to 'occupied' between label revisions).
+    """
+    target_dirs = {os.path.dirname(target_path) for target_path in plan}
+    removed = 0
+    for target_dir in target_dirs:
+        for entry in os.scandir(target_dir):
+            if entry.path not in plan and (entry.is_file(follow_symlinks=False) or entry.is_symlink()):
+                os.unlink(entry.path)
+                removed += 1
+    return removed
+
+def materialize(plan, mode=MATERIALIZE_MODE, num_workers=NUM_WORKERS):
+    """
+    Creates every target folder once, then links/copies all patches on a thread pool.
+    Returns a dict of counts per outcome.
+    """
+    counts = {'linked': 0, 'copied': 0, 'skipped': 0, 'not_found': 0, 'failed': 0}
+    counts_lock = threading.Lock()
+
+    for target_dir in {os.path.dirname(target_path) for target_path in plan}:
+        os.makedirs(target_dir, exist_ok=True)
+
+    def work(item):
+        target_path, (_, _, source_path) = item
+        try:
+            outcome = materialize_one(source_path, target_path, mode)
+        except OSError as e:
+            print(f"  Error materializing '{source_path}' -> '{target_path}': {e}")
+            outcome = 'failed'
+        with counts_lock:
+            counts[outcome] += 1
+            if outcome == 'not_found':
+                if counts['not_found'] <= MAX_NOT_FOUND_MESSAGES:
+                    print(f"  Error: Source patch not found: '{source_path}'")
+                if counts['not_found'] == MAX_NOT_FOUND_MESSAGES:
+                    print("    Further 'not found' errors will be suppressed.")
+            done = sum(counts.values())
+            if done % PROGRESS_EVERY_N_FILES == 0:
+                print(f"    {done}/{len(plan)} patches done...")
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        # Consume the iterator so worker exceptions are raised here
+        for _ in pool.map(work, plan.items(), chunksize=256):
+            pass
+    return counts
+
 # ---------------------- MAIN SCRIPT ------------------------
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sort CNRPark patches into split/label folders for Stage 2 training.")
+    parser.add_argument('--mode', default=MATERIALIZE_MODE, choices=MATERIALIZE_MODES)
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+    parser.add_argument('--prune', action='store_true',
+                        help="Delete files in the output folders that are not in the current splits")
+    args = parser.parse_args()
+
     # Validate required directories
     if not os.path.isdir(PATCHES_ROOT_DIR):
         print(f"Error: Current directory somehow not found: '{os.path.abspath(PATCHES_ROOT_DIR)}'")
@@ -33,79 +193,28 @@ if __name__ == '__main__':
     print(f"Using PATCHES_ROOT_DIR: {os.path.abspath(PATCHES_ROOT_DIR)}")
     print(f"Expecting PATCHES: {os.path.abspath(expected_patches_data_folder)}")
     print(f"Using LABELS: {os.path.abspath(CNRPARK_LABELS_DIR)}")
-    print(f"Output will be in: {os.path.abspath(OUTPUT_STAGE2_DATA_DIR)}")
-
-    # Counters for summary
-    overall_processed_count = 0
-    overall_copied_count = 0
-    overall_source_not_found_count = 0
-
-    # Process each split file
-    for split_filename in SPLIT_FILES_TO_PROCESS:
-        label_file_path = os.path.join(CNRPARK_LABELS_DIR, split_filename)
-        split_name = os.path.splitext(split_filename)[0]
-
-        if not os.path.exists(label_file_path):
-            print(f"\nWarning: Label file not found: '{label_file_path}'. Skipping this split.")
-            continue
-
-        print(f"\nProcessing: {label_file_path} (split: {split_name})")
-        current_split_copied_count = 0
-        current_split_source_not_found = 0
-
-        # Read and process each line of label file
-        with open(label_file_path, 'r') as f_in:
-            for line_num, line in enumerate(f_in):
-                overall_processed_count += 1
-                try:
-                    parts = line.strip().split()
-                    if len(parts) != 2:
-                        print(f"  L{line_num+1} Warning: Malformed line. Skipping: '{line.strip()}'")
-                        continue
-
-                    relative_patch_path = parts[0]
-                    cnrpark_label = parts[1]
-
-                    # Skip unknown labels
-                    if cnrpark_label not in LABEL_TO_FOLDER:
-                        print(f"  L{line_num+1} Warning: Unknown label '{cnrpark_label}'. Skipping.")
-                        continue
-
-                    target_folder_name = LABEL_TO_FOLDER[cnrpark_label]
-                    source_patch_full_path = os.path.join(PATCHES_ROOT_DIR, 'PATCHES', relative_patch_path)
-
-                    # Check if source exists
-                    if not os.path.exists(source_patch_full_path):
-                        print(f"  L{line_num+1} Error: Source patch not found: '{source_patch_full_path}'")
-                        current_split_source_not_found += 1
-                        overall_source_not_found_count += 1
-                        if overall_source_not_found_count == 6:
-                            print("    DEBUG: Further 'not found' errors will be suppressed.")
-                        continue
-
-                    # Create output directory
-                    target_split_dir = os.path.join(OUTPUT_STAGE2_DATA_DIR, split_name, target_folder_name)
-                    os.makedirs(target_split_dir, exist_ok=True)
-
-                    # Copy file
-                    patch_filename = os.path.basename(relative_patch_path)
-                    target_patch_full_path = os.path.join(target_split_dir, patch_filename)
-                    shutil.copy2(source_patch_full_path, target_patch_full_path)
-                    current_split_copied_count += 1
-                    overall_copied_count += 1
-
-                    if current_split_copied_count > 0 and current_split_copied_count % 500 == 0:
-                        print(f"    Copied {current_split_copied_count} patches for '{split_name}'...")
-
-                except Exception as e:
-                    print(f"  L{line_num+1} Error processing line: {e}")
-
-        # Split summary
-        print(f"Finished '{split_filename}' - Copied: {current_split_copied_count}, Not Found: {current_split_source_not_found}")
+    print(f"Output will be in: {os.path.abspath(OUTPUT_STAGE2_DATA_DIR)} (mode: {args.mode})")
+
+    start_time = time.perf_counter()
+    plan = read_split_plan(CNRPARK_LABELS_DIR, expected_patches_data_folder, OUTPUT_STAGE2_DATA_DIR,
+                           SPLIT_FILES_TO_PROCESS)
+    os.makedirs(OUTPUT_STAGE2_DATA_DIR, exist_ok=True)
+    manifest_path = os.path.join(OUTPUT_STAGE2_DATA_DIR, MANIFEST_FILENAME)
+    write_manifest(plan, manifest_path)
+    print(f"Manifest with {len(plan)} patches written to: {manifest_path}")
+
+    counts = None
+    if args.mode != 'manifest':
+        counts = materialize(plan, mode=args.mode, num_workers=args.workers)
+        if args.prune:
+            print(f"Pruned {prune_stale_targets(plan, OUTPUT_STAGE2_DATA_DIR)} stale files")
+    elapsed = time.perf_counter() - start_time
 
     # Final summary
     print(f"\n--- Summary ---")
-    print(f"Total lines processed: {overall_processed_count}")
-    print(f"Total copied: {overall_copied_count}")
-    print(f"Total not found: {overall_source_not_found_count}")
+    print(f"Total patches in splits: {len(plan)}")
+    if counts is not None:
+        print(f"Linked: {counts['linked']}, copied: {counts['copied']}, already up to date: {counts['skipped']}")
+        print(f"Total not found: {counts['not_found']}, failed: {counts['failed']}")
+    print(f"Elapsed: {elapsed:.2f}s ({len(plan) / max(elapsed, 1e-9):.0f} files/sec)")
     print(f"Output dir: {os.path.abspath(OUTPUT_STAGE2_DATA_DIR)}")
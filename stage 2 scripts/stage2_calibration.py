@@ -0,0 +1,89 @@
+import json
+import os
+import numpy as np
+
+# ---------------------- CONFIG ------------------------
+CALIBRATION_METHODS = ['temperature', 'platt']
+NEWTON_ITERATIONS = 100
+SCORE_EPSILON = 1e-6    # Sigmoid outputs are clipped to [eps, 1 - eps] before taking the logit
+ECE_BINS = 15
+
+# ---------------------- CALIBRATION ------------------------
+def scores_to_logits(scores):
+    scores = np.clip(np.asarray(scores, dtype=np.float64), SCORE_EPSILON, 1.0 - SCORE_EPSILON)
+    return np.log(scores) - np.log1p(-scores)
+
+def apply_calibration(scores, calibration):
+    """
+    Maps raw Stage 2 sigmoid scores to calibrated probabilities: sigmoid(scale * logit(score) + bias).
+    Temperature scaling is scale = 1 / T with bias 0. The mapping is monotonic, so it never
+    changes the ranking of slots, only where a given threshold falls. None returns the scores unchanged.
+    """
+    if calibration is None:
+        return scores
+    logits = calibration['scale'] * scores_to_logits(scores) + calibration['bias']
+    return (1.0 / (1.0 + np.exp(-logits))).astype(np.float32)
+
+def fit_calibration(scores, labels, method='temperature'):
+    """
+    Fits the calibration by minimizing the log loss with Newton's method on the logits:
+    'temperature' fits only the scale (one parameter), 'platt' fits scale and bias.
+    """
+    if method not in CALIBRATION_METHODS:
+        raise ValueError(f"Unknown calibration method '{method}', expected one of {CALIBRATION_METHODS}")
+    logits = scores_to_logits(scores)
+    labels = np.asarray(labels, dtype=np.float64)
+    features = np.stack([logits, np.ones_like(logits)], axis=1)
+    if method == 'temperature':
+        features = features[:, :1]
+    params = np.zeros(features.shape[1])
+    params[0] = 1.0
+    for _ in range(NEWTON_ITERATIONS):
+        probabilities = 1.0 / (1.0 + np.exp(-(features @ params)))
+        gradient = features.T @ (probabilities - labels)
+        weights = probabilities * (1.0 - probabilities)
+        hessian = (features * weights[:, None]).T @ features + 1e-9 * np.eye(len(params))
+        step = np.linalg.solve(hessian, gradient)
+        params -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    scale = float(params[0])
+    bias = float(params[1]) if method == 'platt' else 0.0
+    return {'method': method, 'scale': scale, 'bias': bias, 'temperature': 1.0 / scale if scale else float('inf'),
+            'samples': int(len(labels))}
+
+def log_loss(scores, labels):
+    scores = np.clip(np.asarray(scores, dtype=np.float64), SCORE_EPSILON, 1.0 - SCORE_EPSILON)
+    labels = np.asarray(labels, dtype=np.float64)
+    return float(-np.mean(labels * np.log(scores) + (1.0 - labels) * np.log1p(-scores)))
+
+def expected_calibration_error(scores, labels, num_bins=ECE_BINS):
+    """
+    Mean |observed occupied rate - mean score| over equal-width score bins, weighted by bin size.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.float64)
+    if len(scores) == 0:
+        return 0.0
+    bins = np.minimum((scores * num_bins).astype(np.int64), num_bins - 1)
+    counts = np.bincount(bins, minlength=num_bins)
+    score_sums = np.bincount(bins, weights=scores, minlength=num_bins)
+    label_sums = np.bincount(bins, weights=labels, minlength=num_bins)
+    return float(np.abs(label_sums - score_sums).sum() / len(scores))
+
+# ---------------------- PERSISTENCE ------------------------
+def save_calibration(path, calibration):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(calibration, f, indent=2)
+
+def load_calibration(path):
+    """
+    Reads a calibration JSON written by evaluate_stage2.py; None (no path) means uncalibrated scores.
+    """
+    if path is None:
+        return None
+    if not os.path.exists(path):
+        raise RuntimeError(f"Stage 2 calibration file not found: '{path}'")
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,333 @@
+import argparse
+import csv
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+
+from inference import (
+    get_default_pipeline, run_stage1_detection, classify_detected_slots, count_slot_statuses,
+    draw_occupancy_overlay, OUTPUT_CSV_DIR, OUTPUT_SQLITE_PATH, OUTPUT_PARQUET_DIR, OUTPUT_TIMESERIES_PATH
+)
+from result_sinks import create_sink
+from render_writer import RENDER_MODES, should_render
+from slot_layout_cache import SlotLayoutCache
+from slot_status_cache import SlotStatusCache
+from slot_registry import SlotRegistry
+
+# ---------------------- CONFIG ------------------------
+STREAM_SOURCE = 'test_video.mp4'   # Video file, RTSP URL, camera index ('0') or a directory of frames
+OUTPUT_VIDEO_PATH = 'test_results_creative/stream_creative_occupancy.mp4'
+OUTPUT_VIDEO_FPS = 10.0            # Dropped frames are not written, so the output plays back as a time-lapse
+RENDER_MODE = 'always'             # Annotated video frames: 'off', 'sampled' (every RENDER_EVERY_N_FRAMES) or 'always'
+RENDER_EVERY_N_FRAMES = 10
+OUTPUT_STREAM_CSV_PATH = os.path.join(OUTPUT_CSV_DIR, 'stream_parking_summary_creative.csv')
+
+STAGE1_CONF = 0.2
+STAGE2_OCCUPIED_THRESHOLD = 0.9
+
+QUEUE_SIZE = 2               # Max frames waiting in front of each stage; the oldest is dropped when full
+SIMULATE_REALTIME = True     # Pace a local video file at its native FPS so it behaves like a live camera
+DIRECTORY_SOURCE_FPS = 5.0   # Frame rate used when the source is a directory of images
+END_OF_STREAM_POLL_S = 0.5   # How often a producer waiting to post the end marker checks that its consumer is alive
+
+END_OF_STREAM = None
+
+# ---------------------- BOUNDED QUEUES ------------------------
+class DropOldestQueue:
+    """
+    Bounded queue between two pipeline stages. When the consumer falls behind,
+    `put` discards the oldest waiting frame instead of blocking the producer,
+    so latency stays bounded by the queue size. `consumer` is the thread reading
+    from the queue, if known, so the end marker is not waited on forever when it has died.
+    """
+
+    def __init__(self, name, maxsize=QUEUE_SIZE):
+        self.name = name
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.consumer = None
+
+    def put(self, item):
+        with self.lock:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def put_end_of_stream(self):
+        # The end marker must never be dropped, so wait for room instead, unless nobody is left to read it
+        while True:
+            try:
+                self.queue.put(END_OF_STREAM, timeout=END_OF_STREAM_POLL_S)
+                return
+            except queue.Full:
+                if self.consumer is not None and not self.consumer.is_alive():
+                    print(f"Warning: the '{self.name}' queue's consumer has stopped; end of stream not delivered")
+                    return
+
+    def get(self):
+        return self.queue.get()
+
+# ---------------------- FRAME SOURCES ------------------------
+def iter_frames(source, simulate_realtime=SIMULATE_REALTIME):
+    """
+    Yields BGR frames from a video file, RTSP URL, camera index or image directory.
+    """
+    if os.path.isdir(source):
+        frame_interval = 1.0 / DIRECTORY_SOURCE_FPS
+        for image_filename_with_ext in sorted(os.listdir(source)):
+            if not image_filename_with_ext.lower().endswith(('.png', '.jpg', '.jpeg')):
+                continue
+            frame = cv2.imread(os.path.join(source, image_filename_with_ext))
+            if frame is None:
+                print(f"Skipping unreadable frame: {image_filename_with_ext}")
+                continue
+            yield frame
+            if simulate_realtime:
+                time.sleep(frame_interval)
+        return
+
+    capture_source = int(source) if source.isdigit() else source
+    capture = cv2.VideoCapture(capture_source)
+    if not capture.isOpened():
+        print(f"Error: Could not open stream source '{source}'")
+        return
+
+    # Live sources are already paced by the camera; only local files need throttling
+    is_local_file = os.path.isfile(source)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_interval = 1.0 / fps
+    next_frame_time = time.perf_counter()
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+            if simulate_realtime and is_local_file:
+                next_frame_time += frame_interval
+                sleep_time = next_frame_time - time.perf_counter()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+    finally:
+        capture.release()
+
+# ---------------------- PIPELINE STAGES ------------------------
+def decode_stage(source, output_queue, stats, simulate_realtime):
+    for frame_index, frame in enumerate(iter_frames(source, simulate_realtime)):
+        output_queue.put({'frame_index': frame_index, 'frame': frame, 'capture_time': time.perf_counter(),
+                          'timestamp': time.time()})
+        stats['decoded'] += 1
+    output_queue.put_end_of_stream()
+
+def stage1_stage(input_queue, output_queue, stats, stage1_conf, layout_cache):
+    while True:
+        packet = input_queue.get()
+        if packet is END_OF_STREAM:
+            output_queue.put_end_of_stream()
+            return
+        start = time.perf_counter()
+        if layout_cache is not None:
+            packet['boxes'], packet['confidences_s1'] = layout_cache.get_layout(
+                packet['frame'], lambda image: run_stage1_detection(image, stage1_conf=stage1_conf))
+        else:
+            packet['boxes'], packet['confidences_s1'] = run_stage1_detection(packet['frame'], stage1_conf=stage1_conf)
+        stats['stage1_ms'].append((time.perf_counter() - start) * 1000.0)
+        output_queue.put(packet)
+
+def stage2_stage(input_queue, output_queue, stats, stage2_occupied_threshold, slot_status_cache, slot_registry=None):
+    while True:
+        packet = input_queue.get()
+        if packet is END_OF_STREAM:
+            output_queue.put_end_of_stream()
+            return
+        start = time.perf_counter()
+        packet['detected_slots_info'] = classify_detected_slots(
+            packet['frame'], packet['boxes'],
+            stage2_occupied_threshold=stage2_occupied_threshold,
+            slot_status_cache=slot_status_cache,
+            confidences=packet['confidences_s1']
+        )
+        if slot_registry is not None:
+            slot_registry.update(packet['detected_slots_info'], stage2_occupied_threshold)
+        stats['stage2_ms'].append((time.perf_counter() - start) * 1000.0)
+        output_queue.put(packet)
+
+def output_stage(input_queue, stats, output_video_path, csv_path, source, result_sink=None,
+                 render_mode=RENDER_MODE, render_every_n_frames=RENDER_EVERY_N_FRAMES):
+    video_writer = None
+    fieldnames = ['Frame Index', 'Total Detected Slots', 'Occupied Slots', 'Available Slots', 'Latency ms']
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        while True:
+            packet = input_queue.get()
+            if packet is END_OF_STREAM:
+                break
+            start = time.perf_counter()
+            occupied_count, empty_count = count_slot_statuses(packet['detected_slots_info'])
+
+            if output_video_path and should_render(render_mode, packet['frame_index'], render_every_n_frames):
+                # The frame is owned by this packet, so draw on it directly
+                annotated_frame = draw_occupancy_overlay(packet['frame'], packet['detected_slots_info'])
+                if video_writer is None:
+                    h_img, w_img = annotated_frame.shape[:2]
+                    video_writer = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'mp4v'),
+                                                   OUTPUT_VIDEO_FPS, (w_img, h_img))
+                video_writer.write(annotated_frame)
+
+            latency_ms = (time.perf_counter() - packet['capture_time']) * 1000.0
+            stats['latency_ms'].append(latency_ms)
+            stats['output_ms'].append((time.perf_counter() - start) * 1000.0)
+            stats['processed'] += 1
+            writer.writerow({
+                'Frame Index': packet['frame_index'],
+                'Total Detected Slots': occupied_count + empty_count,
+                'Occupied Slots': occupied_count,
+                'Available Slots': empty_count,
+                'Latency ms': f"{latency_ms:.1f}"
+            })
+            if result_sink is not None:
+                result_sink.write_frame({'frame_name': str(packet['frame_index']), 'camera_id': source,
+                                         'timestamp': packet['timestamp']}, packet['detected_slots_info'])
+
+    if video_writer is not None:
+        video_writer.release()
+
+# ---------------------- REPORTING ------------------------
+def print_stream_report(stats, queues, wall_time_s):
+    print("\n--- Stream Summary ---")
+    print(f"Frames decoded:   {stats['decoded']}")
+    print(f"Frames processed: {stats['processed']}")
+    if wall_time_s > 0:
+        print(f"Throughput:       {stats['processed'] / wall_time_s:.2f} frames/s over {wall_time_s:.1f}s")
+    print("Frames dropped per stage (oldest frame discarded at the stage input):")
+    for stage_queue in queues:
+        print(f"  {stage_queue.name:<10} {stage_queue.dropped}")
+    for key, label in [('stage1_ms', 'Stage 1'), ('stage2_ms', 'Stage 2'), ('output_ms', 'Output'),
+                       ('latency_ms', 'End-to-end latency')]:
+        if stats[key]:
+            values = np.asarray(stats[key])
+            print(f"{label + ' ms:':<24} p50 {np.percentile(values, 50):8.1f}  p95 {np.percentile(values, 95):8.1f}"
+                  f"  max {values.max():8.1f}")
+
+def run_stream(source, output_video_path=OUTPUT_VIDEO_PATH, csv_path=OUTPUT_STREAM_CSV_PATH,
+               stage1_conf=STAGE1_CONF, stage2_occupied_threshold=STAGE2_OCCUPIED_THRESHOLD,
+               queue_size=QUEUE_SIZE, simulate_realtime=SIMULATE_REALTIME,
+               use_layout_cache=True, use_slot_status_cache=False, result_sink=None,
+               render_mode=RENDER_MODE, render_every_n_frames=RENDER_EVERY_N_FRAMES, use_slot_registry=False):
+    """
+    Runs decode -> Stage 1 -> Stage 2 -> output as four threads connected by
+    drop-oldest bounded queues, then prints latency and drop statistics.
+    Per-frame and per-slot records are also streamed to `result_sink` when given.
+    With `use_slot_registry` slots keep persistent IDs and hysteresis-smoothed statuses.
+    """
+    stats = {'decoded': 0, 'processed': 0, 'stage1_ms': [], 'stage2_ms': [], 'output_ms': [], 'latency_ms': []}
+    stage1_queue = DropOldestQueue('stage1', queue_size)
+    stage2_queue = DropOldestQueue('stage2', queue_size)
+    output_queue = DropOldestQueue('output', queue_size)
+    layout_cache = SlotLayoutCache(camera_id=source) if use_layout_cache else None
+    slot_status_cache = SlotStatusCache() if use_slot_status_cache else None
+    slot_registry = SlotRegistry(camera_id=source) if use_slot_registry else None
+
+    if output_video_path:
+        os.makedirs(os.path.dirname(output_video_path) or '.', exist_ok=True)
+    os.makedirs(os.path.dirname(csv_path) or '.', exist_ok=True)
+
+    threads = [
+        threading.Thread(target=decode_stage, args=(source, stage1_queue, stats, simulate_realtime), name='decode'),
+        threading.Thread(target=stage1_stage, args=(stage1_queue, stage2_queue, stats, stage1_conf, layout_cache),
+                         name='stage1'),
+        threading.Thread(target=stage2_stage, args=(stage2_queue, output_queue, stats, stage2_occupied_threshold,
+                                                    slot_status_cache, slot_registry), name='stage2'),
+        threading.Thread(target=output_stage, args=(output_queue, stats, output_video_path, csv_path, source,
+                                                    result_sink, render_mode, render_every_n_frames),
+                         name='output'),
+    ]
+    for stage_queue, consumer in zip([stage1_queue, stage2_queue, output_queue], threads[1:]):
+        stage_queue.consumer = consumer
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time_s = time.perf_counter() - start
+
+    print_stream_report(stats, [stage1_queue, stage2_queue, output_queue], wall_time_s)
+    if layout_cache is not None:
+        layout_cache.print_summary()
+    if slot_status_cache is not None:
+        slot_status_cache.print_summary()
+    if slot_registry is not None:
+        slot_registry.print_summary()
+    if result_sink is not None:
+        result_sink.close()
+    print(f"Per-frame summary saved to: {csv_path}")
+    if output_video_path:
+        print(f"Annotated video saved to: {output_video_path}")
+    return stats
+
+# ---------------------- MAIN SCRIPT ------------------------
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the two-stage pipeline on a video file, camera or RTSP stream.")
+    parser.add_argument('source', nargs='?', default=STREAM_SOURCE,
+                        help="Video file, RTSP URL, camera index or directory of frames")
+    parser.add_argument('--output-video', default=OUTPUT_VIDEO_PATH, help="Annotated output video ('' to disable)")
+    parser.add_argument('--csv', default=OUTPUT_STREAM_CSV_PATH, help="Per-frame summary CSV")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE)
+    parser.add_argument('--no-realtime', action='store_true', help="Decode a local file as fast as possible")
+    parser.add_argument('--no-layout-cache', action='store_true', help="Run Stage 1 on every frame")
+    parser.add_argument('--incremental', action='store_true', help="Only reclassify slots whose crop changed")
+    parser.add_argument('--track-slots', action='store_true',
+                        help="Give slots persistent IDs and smooth status flicker (stored as slot_id by the sinks)")
+    parser.add_argument('--render-mode', default=RENDER_MODE, choices=RENDER_MODES,
+                        help="Which frames are annotated and written to the output video")
+    parser.add_argument('--render-every', type=int, default=RENDER_EVERY_N_FRAMES,
+                        help="Frame interval for --render-mode sampled")
+    parser.add_argument('--sink', action='append', default=[], choices=['sqlite', 'parquet', 'timeseries'],
+                        help="Also stream per-frame and per-slot records to this sink (repeatable)")
+    args = parser.parse_args()
+
+    if not (os.path.exists(args.source) or args.source.isdigit() or '://' in args.source):
+        print(f"Error: Stream source '{args.source}' not found.")
+        exit()
+
+    # Load both stages before the first frame arrives so model errors surface immediately
+    try:
+        get_default_pipeline().warm_up()
+    except RuntimeError as e:
+        print(e)
+        exit()
+    get_default_pipeline().print_cold_start_report()
+
+    try:
+        stream_result_sink = create_sink(args.sink, None, OUTPUT_SQLITE_PATH, OUTPUT_PARQUET_DIR,
+                                         OUTPUT_TIMESERIES_PATH) if args.sink else None
+    except RuntimeError as e:
+        print(e)
+        exit()
+
+    print(f"Streaming from: {args.source}")
+    run_stream(
+        args.source,
+        output_video_path=args.output_video,
+        csv_path=args.csv,
+        queue_size=args.queue_size,
+        simulate_realtime=not args.no_realtime,
+        use_layout_cache=not args.no_layout_cache,
+        use_slot_status_cache=args.incremental,
+        result_sink=stream_result_sink,
+        render_mode=args.render_mode,
+        render_every_n_frames=args.render_every,
+        use_slot_registry=args.track_slots
+    )